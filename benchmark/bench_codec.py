@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# 对比各个 json 编解码器在典型请求/响应上的编解码耗时
+#
+#   python benchmark/bench_codec.py [重复次数]
+
+import sys
+import timeit
+
+sys.path.append(".")
+from media_asset.media_asset import MediaMeta, UploadMedia, FilterBy
+from media_asset.codec import JsonCodec, OrjsonCodec, UjsonCodec, orjson, ujson
+
+
+def media_info(i):
+    return {
+        "MediaID": 100000 + i,
+        "Name": "测试媒体{}".format(i),
+        "Duration": 360.5,
+        "Size": 1024 * 1024 * 300 + i,
+        "Width": 1920,
+        "Height": 1080,
+        "FPS": 25,
+        "BitRate": 8000000,
+        "Format": "mp4",
+        "DownLoadURL": "/FileManager/GetObject?Bucket=media&Key=2021-04-06/{}.mp4".format(i),
+        "FailedReason": "",
+        "Status": "上传完成",
+        "MediaType": "视频",
+        "MediaTag": "新闻",
+        "MediaSecondTag": "",
+        "MediaLang": "普通话"
+    }
+
+
+def payloads():
+    media_meta = MediaMeta("视频", "新闻", "", "普通话")
+    label = {"Type": "视频", "Tag": "新闻", "SecondTagSet": [""]}
+    return [
+        ("DescribeMedias 请求", {
+            "TIBusinessID": 1, "TIProjectID": 1, "PageNumber": 1, "PageSize": 100,
+            "FilterBy": FilterBy("", ["视频"], [label], []).to_map(), "Inner": False, "Action": "DescribeMedias"
+        }),
+        ("CreateMedias 1000 条", {
+            "TIBusinessID": 1, "TIProjectID": 1,
+            "UploadMediaSet": [UploadMedia("URL视频{}".format(i), "", "https://example.com/{}.mp4".format(i),
+                                           media_meta, "").to_map() for i in range(1000)]
+        }),
+        ("MediaInfoSet 100 条", {"Response": {"RequestID": "r", "TotalCount": 100,
+                                             "MediaInfoSet": [media_info(i) for i in range(100)]}}),
+        ("MediaInfoSet 10000 条", {"Response": {"RequestID": "r", "TotalCount": 10000,
+                                               "MediaInfoSet": [media_info(i) for i in range(10000)]}}),
+    ]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    codecs = [JsonCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    if ujson is not None:
+        codecs.append(UjsonCodec())
+
+    print("{:<22} {:<8} {:>12} {:>12}".format("", "codec", "dumps ms", "loads ms"))
+    for name, payload in payloads():
+        body = JsonCodec().dumps(payload)
+        for codec in codecs:
+            dumps = timeit.timeit(lambda: codec.dumps(payload), number=number) / number * 1000
+            loads = timeit.timeit(lambda: codec.loads(body), number=number) / number * 1000
+            print("{:<22} {:<8} {:>12.3f} {:>12.3f}".format(name, codec.name, dumps, loads))
+
+
+if __name__ == "__main__":
+    main()
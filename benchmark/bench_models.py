@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# 对比 100k 条 MediaInfoSet 记录在不同表示下的内存占用和解析耗时
+#
+#   python benchmark/bench_models.py [记录数]
+
+import sys
+import json
+import time
+import tracemalloc
+
+sys.path.append(".")
+from media_asset.media_asset import MediaInfoSet
+
+
+class DictMediaInfoSet(object):
+    # 没有 __slots__ 的 MediaInfoSet，即之前的实现
+    def __init__(self, data):
+        self.media_id = data.get("MediaID", 0)
+        self.name = data.get("Name", "")
+        self.duration = data.get("Duration", 0)
+        self.size = data.get("Size", 0)
+        self.width = data.get("Width", 0)
+        self.height = data.get("Height", 0)
+        self.fps = data.get("FPS", 0)
+        self.bit_rate = data.get("BitRate", 0)
+        self.format = data.get("Format", "")
+        self.download_url = data.get("DownLoadURL", "")
+        self.failed_reason = data.get("FailedReason", "")
+        self.status = data.get("Status", "")
+        self.media_type = data.get("MediaType", "")
+        self.media_tag = data.get("MediaTag", "")
+        self.media_second_tag = data.get("MediaSecondTag", "")
+        self.media_lang = data.get("MediaLang", "")
+
+
+def make_response(count):
+    media_info_set = []
+    for i in range(count):
+        media_info_set.append({
+            "MediaID": 100000 + i,
+            "Name": "测试媒体{}".format(i),
+            "Duration": 360.5,
+            "Size": 1024 * 1024 * 300 + i,
+            "Width": 1920,
+            "Height": 1080,
+            "FPS": 25,
+            "BitRate": 8000000,
+            "Format": "mp4",
+            "DownLoadURL": "/FileManager/GetObject?Bucket=media&Key=2021-04-06/{}.mp4".format(i),
+            "FailedReason": "",
+            "Status": "上传完成",
+            "MediaType": "视频",
+            "MediaTag": "新闻",
+            "MediaSecondTag": "",
+            "MediaLang": "普通话"
+        })
+    return json.dumps({"Response": {"RequestID": "bench", "MediaInfoSet": media_info_set,
+                                    "TotalCount": count}}).encode("utf-8")
+
+
+def measure(name, body, count, build):
+    # 耗时和内存分两次测量，避免 tracemalloc 影响耗时
+    start = time.perf_counter()
+    build(json.loads(body)["Response"]["MediaInfoSet"])
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = build(json.loads(body)["Response"]["MediaInfoSet"])
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<20} {:>8.1f} MB {:>8.0f} B {:>8.1f} MB {:>8.3f} s".format(
+        name, current / 1024.0 / 1024, float(current) / count, peak / 1024.0 / 1024, elapsed))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    body = make_response(count)
+    print("{} 条 MediaInfoSet，响应 {:.1f} MB".format(count, len(body) / 1024.0 / 1024))
+    print("{:<20} {:>11} {:>10} {:>11} {:>10}".format("", "保留内存", "每条", "峰值内存", "解析耗时"))
+    measure("dict", body, count, lambda data: [DictMediaInfoSet(v) for v in data])
+    measure("__slots__", body, count, lambda data: [MediaInfoSet(v) for v in data])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+# 使用本地模拟网关压测 upload_file、download_file 和媒体列表，输出吞吐、p50/p99 延迟和峰值 RSS。
+# 默认在子进程中启动 media_asset.mock_gateway，避免网关和 SDK 争抢 GIL、网关内存计入 RSS。
+#
+#   python benchmark/bench_transfer.py [--size 256] [--repeat 3] [--latency 0.005] [--bandwidth 200MB]
+#   python benchmark/bench_transfer.py --gateway 127.0.0.1:8080   # 使用已经启动的网关
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+sys.path.append(".")
+from media_asset.media_asset import MediaAsset, MediaConfig, MediaMeta, UploadMedia, FilterBy
+from media_asset.metrics import MemoryMetrics, percentile
+from media_asset.mock_gateway import MockGateway, parse_size
+
+MB = 1024 * 1024
+
+
+class RssSampler(object):
+    # RssSampler 在后台线程中每 interval 秒采样一次当前进程的 RSS，记录期间的峰值。
+    # 没有 /proc 时退化为 resource 模块记录的整个进程的峰值
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self.__run__, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+    def __run__(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 的单位是字节，Linux 是 KB
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def start_gateway(args):
+    if args.gateway:
+        host, port = args.gateway.rsplit(":", 1)
+        return None, host, int(port)
+    if args.in_process:
+        gateway = MockGateway(latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate).start()
+        return gateway, gateway.host, gateway.port
+    cmd = [sys.executable, "-m", "media_asset.mock_gateway", "--latency", str(args.latency),
+           "--error-rate", str(args.error_rate)]
+    if args.bandwidth:
+        cmd += ["--bandwidth", str(args.bandwidth)]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    host, port = process.stdout.readline().strip().rsplit(":", 1)
+    return process, host, int(port)
+
+
+def stop_gateway(gateway):
+    if isinstance(gateway, MockGateway):
+        gateway.stop()
+    elif gateway is not None:
+        gateway.terminate()
+        gateway.wait()
+
+
+def make_file(path, size):
+    with open(path, "wb") as f:
+        block = os.urandom(MB)
+        for offset in range(0, size, MB):
+            f.write(block[:min(MB, size - offset)])
+
+
+def report(name, rate, unit, p50, p99, peak):
+    print("{:<34} {:>10.1f} {:<8} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+        name, rate, unit, p50 * 1000, p99 * 1000, peak / float(MB)))
+
+
+def report_latencies(name, rate, unit, latencies, peak):
+    latencies = sorted(latencies)
+    report(name, rate, unit, percentile(latencies, 50), percentile(latencies, 99), peak)
+
+
+def report_requests(metrics, name, action):
+    summary = metrics.summary().get(name, {}).get(action)
+    if summary:
+        print("  {:<32} {:>8} 次 {:>19.1f} {:>10.1f}".format(
+            "{} {}".format(name, action), summary["count"], summary["p50"] * 1000, summary["p99"] * 1000))
+
+
+def bench_upload(media_asset, metrics, path, size, repeat, name):
+    meta = MediaMeta("视频", "新闻", "", "普通话")
+    latencies = []
+    media_info = None
+    metrics.reset()
+    with RssSampler() as rss:
+        for i in range(repeat):
+            start = time.perf_counter()
+            media_info, err = media_asset.upload_file(path, "bench-{}".format(i), meta)
+            latencies.append(time.perf_counter() - start)
+            if err.code != "ok":
+                raise RuntimeError("upload_file failed: {} {}".format(err.code, err.message))
+    report_latencies(name, size * repeat / float(MB) / sum(latencies), "MB/s", latencies, rss.peak)
+    report_requests(metrics, "request", "UploadPart" if size >= 32 * MB else "PutObject")
+    report_requests(metrics, "md5_wait", "UploadPart")
+    return media_info
+
+
+def bench_download(media_asset, metrics, media_info, work_dir, repeat, name):
+    latencies = []
+    metrics.reset()
+    with RssSampler() as rss:
+        for i in range(repeat):
+            start = time.perf_counter()
+            err = media_asset.download_file(media_info.download_url, work_dir, "download.bin")
+            latencies.append(time.perf_counter() - start)
+            if err.code != "ok":
+                raise RuntimeError("download_file failed: {} {}".format(err.code, err.message))
+    report_latencies(name, media_info.size * repeat / float(MB) / sum(latencies), "MB/s", latencies, rss.peak)
+    report_requests(metrics, "request", "DownloadFile")
+
+
+def bench_list(media_asset, metrics, count, page_size):
+    # 通过 CreateMedias 准备媒体，真实网关和模拟网关都适用
+    meta = MediaMeta("视频", "新闻", "", "普通话")
+    for offset in range(0, count, 1000):
+        medias = [UploadMedia("bench-{}".format(i), "", "http://example.com/{}.mp4".format(i), meta, "")
+                  for i in range(offset, min(offset + 1000, count))]
+        medias, err = media_asset.create_medias(medias)
+        if err.code != "ok":
+            raise RuntimeError("create_medias failed: {} {}".format(err.code, err.message))
+
+    metrics.reset()
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        total = 0
+        for media_info, err in media_asset.iter_medias(FilterBy("", [], [], []), page_size=page_size):
+            if err.code != "ok":
+                raise RuntimeError("iter_medias failed: {} {}".format(err.code, err.message))
+            total += 1
+        elapsed = time.perf_counter() - start
+    pages = metrics.summary()["request"]["DescribeMedias"]
+    # 列表的延迟为单页 DescribeMedias 请求的延迟
+    report("iter_medias page_size={}".format(page_size), total / elapsed, "条/s", pages["p50"], pages["p99"],
+           rss.peak)
+    report_requests(metrics, "request", "DescribeMedias")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="upload/download/list 吞吐压测")
+    parser.add_argument("--size", type=int, default=256, help="大文件 MB 数")
+    parser.add_argument("--small-size", type=int, default=1, help="小文件 MB 数")
+    parser.add_argument("--small-count", type=int, default=20, help="小文件上传次数")
+    parser.add_argument("--repeat", type=int, default=3, help="大文件上传/下载次数")
+    parser.add_argument("--medias", type=int, default=10000, help="列表压测的媒体数")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0, help="模拟网关每个请求增加的秒数")
+    parser.add_argument("--bandwidth", type=parse_size, default=None, help="模拟网关每个连接的带宽，如 200MB")
+    parser.add_argument("--error-rate", type=float, default=0, help="模拟网关上传分片/下载返回 500 的概率")
+    parser.add_argument("--gateway", default=None, help="使用已启动的网关 host:port")
+    parser.add_argument("--in-process", action="store_true", help="在当前进程中启动模拟网关")
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--download-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    gateway, host, port = start_gateway(args)
+    work_dir = tempfile.mkdtemp(prefix="bench-transfer-")
+    metrics = MemoryMetrics()
+    config = MediaConfig(host, port, "mock-secret-id", "mock-secret-key", 1, 1, "mock-service", "2021-02-26",
+                         upload_concurrency=args.upload_concurrency,
+                         download_concurrency=args.download_concurrency,
+                         upload_retry_times=10, download_retry_times=10, metrics=metrics)
+    try:
+        with MediaAsset(config) as media_asset:
+            print("{:<34} {:>10} {:<8} {:>10} {:>10} {:>10}".format(
+                "", "吞吐", "", "p50 ms", "p99 ms", "峰值RSS MB"))
+            big = os.path.join(work_dir, "big.bin")
+            make_file(big, args.size * MB)
+            media_info = bench_upload(media_asset, metrics, big, args.size * MB, args.repeat,
+                                      "upload_file {}MB".format(args.size))
+            bench_download(media_asset, metrics, media_info, work_dir, args.repeat,
+                           "download_file {}MB".format(args.size))
+
+            small = os.path.join(work_dir, "small.bin")
+            make_file(small, args.small_size * MB)
+            bench_upload(media_asset, metrics, small, args.small_size * MB, args.small_count,
+                         "upload_file {}MB x{}".format(args.small_size, args.small_count))
+
+            bench_list(media_asset, metrics, args.medias, args.page_size)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        stop_gateway(gateway)
+
+
+if __name__ == "__main__":
+    main()
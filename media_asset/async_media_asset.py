@@ -0,0 +1,878 @@
+# -*- coding: UTF-8 -*-
+
+import os
+import time
+import random
+import asyncio
+import inspect
+import logging
+import warnings
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+
+from .tisign.sign import TiSign
+from .checkpoint import UploadJournal
+from .dedup import open_dedup_index
+from .limiter import TokenBucket, AsyncAdaptiveLimiter, is_congestion
+from .codec import JsonCodec, get_codec
+from .metrics import MetricsCollector
+from .progress import ProgressTracker
+from .media_asset import (MediaAsset, MediaResponse, MediaInfoSet, FailedMediaInfo, Category, Label, UploadMediaInfo,
+                          FileSlice, BytesSlice, PartHasher, PartSizePolicy, BLOCK_SIZE, MB, DOWNLOAD_CONCURRENCY,
+                          create_temp_file, iter_stream_parts, merge_batches, failed_removal, logger, redact_header,
+                          LogBody)
+
+
+async def async_post_http(session, header, url, req, retry_times=3, codec=JsonCodec(), metrics=MetricsCollector(),
+                          rate_limiter=None):
+    # 与 post_http 一致，网络异常时最多尝试 retry_times 次，重试前按指数退避等待并加入随机抖动
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("POST %s header=%s body=%s", url, redact_header(header), LogBody(req))
+    action = header.get("X-TC-Action")
+    data = codec.dumps(req)
+    for i in range(retry_times):
+        if rate_limiter is not None:
+            wait_time = rate_limiter.reserve()
+            if wait_time > 0:
+                metrics.timing("limit_wait", action, wait_time)
+                await asyncio.sleep(wait_time)
+        start = time.perf_counter()
+        try:
+            async with session.post(url, data=data, headers=header) as response:
+                content = await response.read()
+                metrics.timing("request", action, time.perf_counter() - start)
+                metrics.count("bytes_sent", action, len(data))
+                metrics.count("bytes_received", action, len(content))
+                if response.status != 200:
+                    logger.warning("POST %s action=%s failed: http %d", url, action, response.status)
+                    if rate_limiter is not None:
+                        rate_limiter.feedback(is_congestion(response.status))
+                    return None, MediaResponse(
+                        {"RequestID": "", "Error": {"Code": str(response.status), "Message": "http failed"}})
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("POST %s action=%s response=%s", url, action, LogBody(content))
+                response_map = codec.loads(content)
+                if rate_limiter is not None:
+                    error = response_map.get("Response", {}).get("Error")
+                    rate_limiter.feedback(error is not None and is_congestion(code=error.get("Code")))
+                return response_map, None
+        except aiohttp.ClientError as e:
+            metrics.count("errors", action)
+            if rate_limiter is not None:
+                rate_limiter.feedback(True)
+            if i + 1 == retry_times:
+                raise
+            logger.warning("POST %s action=%s failed: %s, retry", url, action, e)
+            metrics.count("retries", action)
+            await asyncio.sleep(min(0.1 * 2 ** (i + 1), 2) + random.uniform(0, 0.1))
+
+
+# async_iter_stream_parts 与 iter_stream_parts 相同，stream 的 read 为协程函数（如 aiohttp.StreamReader）时直接 await，
+# 其它可读对象在线程池中读取
+async def async_iter_stream_parts(stream, part_size, file_hash=None):
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        for part in iter_stream_parts(stream, part_size, file_hash):
+            yield part
+        return
+    if not inspect.iscoroutinefunction(getattr(stream, "read", None)):
+        loop = asyncio.get_running_loop()
+        parts = iter_stream_parts(stream, part_size, file_hash)
+        while True:
+            part = await loop.run_in_executor(None, next, parts, None)
+            if part is None:
+                return
+            yield part
+
+    first = True
+    while True:
+        chunks = []
+        pos = 0
+        while pos < part_size:
+            data = await stream.read(part_size - pos)
+            if not data:
+                break
+            chunks.append(data)
+            pos += len(data)
+        part = b"".join(chunks)
+        if not part and not first:
+            return
+        first = False
+        if file_hash is not None:
+            file_hash.update(part)
+        yield part
+        if len(part) < part_size:
+            return
+
+
+class AsyncMediaAsset(object):
+    # AsyncMediaAsset MediaAsset 的 asyncio 版本，所有方法都是协程，返回值与 MediaAsset 相同。
+    # 同一个 AsyncMediaAsset 的所有请求共用一个 aiohttp 连接池。
+    # 只有 MediaAsset 支持的功能：iter_medias、upload_files、wait_for_medias、响应缓存（cache_size、cache_stats）、
+    # 分段并发下载和断点下载（download_concurrency、download_file 的 resume），这里的 download_file 顺序下载
+    def __init__(self, media_config):
+        self.media_config = media_config
+        self.url = "http://{}:{}/gateway".format(media_config.host, media_config.port)
+        self.session = None
+        self.codec = get_codec(media_config.json_codec)
+        self.metrics = media_config.metrics if media_config.metrics is not None else MetricsCollector()
+        self.part_size_policy = media_config.part_size_policy
+        if self.part_size_policy is None:
+            self.part_size_policy = PartSizePolicy()
+        self.throughput = None
+        self.dedup, self._own_dedup = open_dedup_index(media_config.dedup_index)
+        self.rate_limiter = None
+        if media_config.api_rate:
+            self.rate_limiter = TokenBucket(media_config.api_rate, media_config.api_burst)
+        self.part_limiter = None
+        if media_config.adaptive_concurrency:
+            self.part_limiter = AsyncAdaptiveLimiter(max(1, media_config.upload_concurrency))
+        self._signers = {}
+        # 以下配置只有 MediaAsset 支持，显式设置时提示调用方
+        if media_config.download_concurrency not in (1, DOWNLOAD_CONCURRENCY):
+            warnings.warn("AsyncMediaAsset downloads sequentially, download_concurrency is ignored", stacklevel=2)
+        if media_config.cache_size > 0:
+            warnings.warn("AsyncMediaAsset does not cache responses, cache_size is ignored", stacklevel=2)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # close 关闭连接池
+    async def close(self):
+        if self._own_dedup:
+            await asyncio.get_running_loop().run_in_executor(None, self.dedup.close)
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    # aiohttp 的连接池需要在事件循环中创建，第一次请求时创建
+    def __get_session__(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.media_config.pool_size,
+                                             force_close=not self.media_config.keep_alive)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.media_config.connect_timeout,
+                                            sock_read=self.media_config.read_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.session
+
+    # __get_header__ 构造带签名的请求头，每种 action/content_type/http_method 复用同一个 TiSign
+    def __get_header__(self, action, content_type='application/json', http_method='POST'):
+        start = time.perf_counter()
+        key = (action, content_type, http_method)
+        ts = self._signers.get(key)
+        if ts is None:
+            ts = TiSign(self.media_config.host,
+                        action,
+                        self.media_config.version,
+                        self.media_config.service,
+                        content_type,
+                        http_method,
+                        self.media_config.secret_id,
+                        self.media_config.secret_key)
+            self._signers[key] = ts
+
+        http_header_dict, authorization = ts.build_header_with_signature()
+        self.metrics.timing("sign", action, time.perf_counter() - start)
+        return http_header_dict, authorization
+
+    async def __post__(self, action, req):
+        http_header_dict, authorization = self.__get_header__(action)
+        return await async_post_http(self.__get_session__(), http_header_dict, self.url, req, codec=self.codec,
+                                     metrics=self.metrics, rate_limiter=self.rate_limiter)
+
+    # download_file 通过媒体信息返回的url下载文件到本地，边下载边写入临时文件，下载完成后重命名为 file_name。
+    # 不支持断点下载，resume 为 True 时抛出 NotImplementedError。progress 与 MediaAsset.download_file 相同
+    async def download_file(self, download_url, dir2, file_name, resume=False, progress=None):
+        if resume:
+            raise NotImplementedError("AsyncMediaAsset.download_file does not support resume")
+        start = time.perf_counter()
+        response, err = await self.__get_download__(download_url)
+        if err.code != "ok":
+            return err
+        chunks = self.__iter_response__(response, self.media_config.read_chunk_size)
+        tracker = None
+        if progress is not None:
+            tracker = ProgressTracker(progress, interval=self.media_config.progress_interval)
+            content_length = response.headers.get("Content-Length", "")
+            if content_length.isdigit():
+                tracker.begin(int(content_length))
+            tracker.start()
+
+        if not os.path.exists(dir2):
+            os.makedirs(dir2)
+
+        loop = asyncio.get_running_loop()
+        tmp_file, tmp_path = create_temp_file(dir2, file_name)
+        try:
+            with tmp_file as f:
+                async for data in chunks:
+                    await loop.run_in_executor(None, f.write, data)
+                    if tracker is not None:
+                        tracker.add(len(data))
+            os.replace(tmp_path, os.path.join(dir2, file_name))
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            await chunks.aclose()
+            os.remove(tmp_path)
+            return MediaResponse({"RequestID": "", "Error": {"Code": "download failed", "Message": str(e)}})
+        finally:
+            if tracker is not None:
+                tracker.done()
+                tracker.finish()
+
+        self.metrics.timing("download", "DownloadFile", time.perf_counter() - start)
+        return MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+
+    # iter_download 通过媒体信息返回的url下载文件，返回按块产出文件内容的异步迭代器
+    async def iter_download(self, download_url, chunk_size=None):
+        response, err = await self.__get_download__(download_url)
+        if err.code != "ok":
+            return None, err
+        return self.__iter_response__(response, chunk_size or self.media_config.read_chunk_size), err
+
+    # __get_download__ 发起下载请求，返回状态码为 200 的响应
+    async def __get_download__(self, download_url):
+        http_header_dict, authorization = self.__get_header__("DownloadFile", "application/octet-stream", 'GET')
+        url = "http://{}:{}{}".format(self.media_config.host, self.media_config.port, download_url)
+
+        try:
+            response = await self.__get_session__().get(url, headers=http_header_dict)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return None, MediaResponse({"RequestID": "", "Error": {"Code": "download failed", "Message": str(e)}})
+        if response.status != 200:
+            response.release()
+            return None, MediaResponse(
+                {"RequestID": "", "Error": {"Code": str(response.status), "Message": "http failed"}})
+        return response, MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+
+    async def __iter_response__(self, response, chunk_size):
+        received = 0
+        try:
+            async for data in response.content.iter_chunked(chunk_size):
+                received += len(data)
+                yield data
+        finally:
+            response.release()
+            self.metrics.count("bytes_received", "DownloadFile", received)
+
+    # download_t_buf 通过媒体信息返回的url下载文件到内存
+    async def download_t_buf(self, download_url):
+        http_header_dict, authorization = self.__get_header__("DownloadFile", "application/octet-stream", 'GET')
+        url = "http://{}:{}{}".format(self.media_config.host, self.media_config.port, download_url)
+
+        async with self.__get_session__().get(url, headers=http_header_dict) as response:
+            if response.status != 200:
+                return None, MediaResponse(
+                    {"RequestID": "", "Error": {"Code": str(response.status), "Message": "http failed"}})
+            resp = await response.read()
+        return resp, MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+
+    # describe_medias 拉取媒体列表
+    async def describe_medias(self, page_number, page_size, filter_by):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "PageNumber": page_number,
+            "PageSize": page_size,
+            "FilterBy": filter_by.to_map(),
+            "Inner": False,
+            "Action": "DescribeMedias"
+        }
+
+        resp, err = await self.__post__("DescribeMedias", req)
+        if err is not None:
+            return None, None, err
+
+        response_err = MediaResponse(resp["Response"])
+        if response_err.code != "ok":
+            return None, None, response_err
+
+        media_info = [MediaInfoSet(v) for v in resp["Response"]["MediaInfoSet"]]
+        return media_info, resp["Response"]["TotalCount"], response_err
+
+    # __fan_out__ 与 MediaAsset.__fan_out__ 相同，同时进行的请求不超过 api_concurrency 个
+    async def __fan_out__(self, func, media_ids, on_error=None):
+        batch_size = self.media_config.media_id_batch_size
+        batches = [media_ids[i:i + batch_size] for i in range(0, len(media_ids), batch_size)]
+        if len(batches) <= 1:
+            return await func(media_ids)
+
+        semaphore = asyncio.Semaphore(max(1, self.media_config.api_concurrency))
+
+        async def call(batch):
+            async with semaphore:
+                return await func(batch)
+
+        return merge_batches(batches, await asyncio.gather(*[call(batch) for batch in batches]), on_error)
+
+    # describe_media_details 获取指定媒体集的详情，媒体ID较多时拆分为多个请求并发获取
+    async def describe_media_details(self, media_ids):
+        return await self.__fan_out__(self.__describe_media_details__, media_ids)
+
+    async def __describe_media_details__(self, media_ids):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "MediaIDSet": media_ids,
+            "Action": "DescribeMediaDetails"
+        }
+
+        resp, err = await self.__post__("DescribeMediaDetails", req)
+        if err is not None:
+            return None, err
+
+        response_err = MediaResponse(resp["Response"])
+        if response_err.code != "ok":
+            return None, response_err
+
+        media_info = [MediaInfoSet(v) for v in resp["Response"]["MediaInfoSet"]]
+        return media_info, response_err
+
+    # remove_medias 删除指定媒体集，媒体ID较多时拆分为多个请求并发删除，部分批次失败时与 MediaAsset.remove_medias 相同
+    async def remove_medias(self, media_ids):
+        return await self.__fan_out__(self.__remove_medias__, media_ids, failed_removal)
+
+    async def __remove_medias__(self, media_ids):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "MediaIDSet": media_ids,
+            "Action": "RemoveMedias"
+        }
+
+        resp, err = await self.__post__("RemoveMedias", req)
+        if err is not None:
+            return None, err
+
+        response_err = MediaResponse(resp["Response"])
+        if response_err.code != "ok":
+            return None, response_err
+
+        failed_media = []
+        for v in resp["Response"]["FailedMediaSet"]:
+            failed_media.append(FailedMediaInfo(v))
+        return failed_media, response_err
+
+    # describe_categories 返回可选媒体类型列表
+    async def describe_categories(self):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "Action": "DescribeCategories"
+        }
+
+        resp, err = await self.__post__("DescribeCategories", req)
+        if err is not None:
+            return None, None, None, err
+
+        response_err = MediaResponse(resp["Response"])
+        if response_err.code != "ok":
+            return None, None, None, response_err
+
+        category = []
+        lang = []
+        label = []
+        for v in resp["Response"]["CategorySet"]:
+            category.append(Category(v))
+        for v in resp["Response"]["LabelSet"]:
+            label.append(Label(v))
+        for v in resp["Response"]["LangSet"]:
+            lang.append(v)
+        return category, label, lang, response_err
+
+    # modify_media 修改媒体信息
+    async def modify_media(self, media_id, media_tag, media_second_tag):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "MediaID": media_id,
+            "MediaTag": media_tag,
+            "MediaSecondTag": media_second_tag,
+            "Action": "ModifyMedia"
+        }
+
+        resp, err = await self.__post__("ModifyMedia", req)
+        if err is None:
+            return MediaResponse(resp["Response"])
+        return err
+
+    # modify_expire_time 修改文件过期时间，当前时间算起来，有效时间为 days 天
+    async def modify_expire_time(self, media_id, days):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "MediaID": media_id,
+            "Days": days,
+            "Action": "ModifyExpireTime"
+        }
+
+        resp, err = await self.__post__("ModifyExpireTime", req)
+        if err is None:
+            return MediaResponse(resp["Response"])
+        return err
+
+    async def apply_upload(self, media_name, media_meta, file_size, part_size=None):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "Name": media_name,
+            "MediaMeta": media_meta.to_map(),
+            "Inner": False,
+            "Action": "ApplyUpload"
+        }
+        if file_size is not None:
+            req["Size"] = str(file_size)
+            if file_size < (part_size or BLOCK_SIZE):
+                req["UsePutObject"] = 1
+        resp, err = await self.__post__("ApplyUpload", req)
+        if err is not None:
+            return None, err
+
+        response_err = MediaResponse(resp["Response"])
+        if response_err.code != "ok":
+            return None, response_err
+
+        return resp["Response"], response_err
+
+    # do_upload 上传文件内容，journal 不为空时跳过其中已上传的分片并记录新完成的分片，
+    # file_hash、part_size 与 MediaAsset.do_upload 相同
+    async def do_upload(self, file_path, file_size, media_msg, journal=None, progress=None, file_hash=None,
+                        part_size=None):
+        part_size = part_size or BLOCK_SIZE
+        if file_size < part_size:
+            return await self.__put_object__(file_path, file_size, media_msg, progress, file_hash)
+
+        number = (file_size + part_size - 1) // part_size
+        if progress is not None:
+            done = 0 if journal is None else sum(min(part_size, file_size - (i - 1) * part_size)
+                                                 for i in journal.parts)
+            progress.begin(file_size, done)
+        window = max(1, min(self.media_config.upload_concurrency,
+                            self.media_config.max_inflight_bytes // part_size, number))
+
+        # 分片 md5 在线程池中提前计算，计算整个文件的 hash 时改为单线程按顺序计算
+        skip = set() if journal is None else set(journal.parts)
+        hash_executor = ThreadPoolExecutor(
+            max_workers=1 if file_hash is not None else self.media_config.md5_concurrency)
+        hasher = PartHasher(hash_executor, file_path, file_size, self.media_config.read_chunk_size, skip, file_hash,
+                            window, self.metrics, part_size)
+
+        # window 个协程共享同一个分片迭代器，任意分片完成后该协程立即取下一个分片
+        part_numbers = iter([i for i in range(1, number + 1) if i not in skip])
+        failed = []
+
+        async def worker():
+            for part_number in part_numbers:
+                if failed:
+                    return
+                err = await self.__upload_part__(file_path, file_size, media_msg, part_number, journal, progress,
+                                                 hasher, part_size)
+                if err.code != "ok":
+                    if not failed:
+                        failed.append(err)
+                    return
+
+        try:
+            await asyncio.gather(*[worker() for i in range(window)])
+            if not failed and file_hash is not None:
+                await asyncio.get_running_loop().run_in_executor(None, hasher.finish)
+        finally:
+            hasher.cancel()
+            hash_executor.shutdown(wait=False)
+        if failed:
+            return failed[0]
+        return MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+
+    # __upload_part__ 上传编号为 part_number 的分片
+    async def __upload_part__(self, file_path, file_size, media_msg, part_number, journal=None, progress=None,
+                              hasher=None, part_size=BLOCK_SIZE):
+        start = time.perf_counter()
+        offset = (part_number - 1) * part_size
+        part = FileSlice(file_path, offset, min(part_size, file_size - offset), self.media_config.read_chunk_size)
+        if progress is not None:
+            progress.start()
+        try:
+            if hasher is not None:
+                md5 = await asyncio.wrap_future(hasher.future(part_number))
+                self.metrics.timing("md5_wait", "UploadPart", time.perf_counter() - start)
+            else:
+                md5 = await asyncio.get_running_loop().run_in_executor(None, part.md5)
+                self.metrics.timing("md5", "UploadPart", time.perf_counter() - start)
+            part.progress = progress
+            query = "useJson=true&Bucket={}&Key={}&uploadId={}&partNumber={}&Content-MD5={}".format(
+                media_msg["Bucket"], media_msg["Key"], media_msg["UploadId"], part_number, md5)
+            url = "http://{}:{}/FileManager/UploadPart?{}".format(self.media_config.host, self.media_config.port,
+                                                                  query)
+            response_err = await self.__put_body__("UploadPart", url, part)
+            if response_err.code == "ok":
+                self.metrics.timing("part", "UploadPart", time.perf_counter() - start)
+                if journal is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, journal.record_part, part_number, md5)
+            else:
+                part.seek(0)
+            return response_err
+        finally:
+            if progress is not None:
+                progress.done()
+            part.close()
+
+    # __put_object__ 小文件通过 PutObject 一次上传
+    async def __put_object__(self, file_path, file_size, media_msg, progress=None, file_hash=None):
+        body = FileSlice(file_path, 0, file_size, self.media_config.read_chunk_size)
+        if progress is not None:
+            progress.begin(file_size)
+            progress.start()
+        try:
+            start = time.perf_counter()
+            md5 = await asyncio.get_running_loop().run_in_executor(None, body.md5, file_hash)
+            self.metrics.timing("md5", "PutObject", time.perf_counter() - start)
+            body.progress = progress
+            query = "useJson=true&Bucket={}&Key={}&Content-MD5={}".format(
+                        media_msg["Bucket"], media_msg["Key"], md5)
+            url = "http://{}:{}/FileManager/PutObject?{}".format(self.media_config.host, self.media_config.port,
+                                                                      query)
+            response_err = await self.__put_body__("PutObject", url, body)
+            if response_err.code != "ok":
+                body.seek(0)
+            return response_err
+        finally:
+            if progress is not None:
+                progress.done()
+            body.close()
+
+    # __put_body__ PUT 上传 body，文件读取放在线程池中执行，失败后按带随机抖动的指数退避重试，
+    # 开启自适应并发时与 MediaAsset.__put_body__ 相同
+    async def __put_body__(self, action, url, body):
+        loop = asyncio.get_running_loop()
+
+        async def read_body():
+            while True:
+                data = await loop.run_in_executor(None, body.read, body.chunk_size)
+                if not data:
+                    break
+                yield data
+
+        try_times = self.media_config.upload_retry_times
+        sleep_time = self.media_config.upload_retry_interval
+        while True:
+            http_header_dict, authorization = self.__get_header__(action, "application/octet-stream", 'PUT')
+            http_header_dict["Content-Length"] = str(len(body))
+            body.seek(0)
+            await self.__acquire_part__(action)
+            congested, size, elapsed = True, 0, 0
+            start = time.perf_counter()
+            try:
+                async with self.__get_session__().put(url, headers=http_header_dict, data=read_body()) as resp:
+                    content = await resp.read()
+                    elapsed = time.perf_counter() - start
+                    self.metrics.timing("request", action, elapsed)
+                    self.metrics.count("bytes_sent", action, len(body))
+                    if resp.status == 200:
+                        dic = self.codec.loads(content)
+                        response_err = MediaResponse(dic["Response"])
+                        congested = is_congestion(code=response_err.code)
+                        if response_err.code == "ok":
+                            self.__observe_throughput__(len(body), elapsed)
+                            size = len(body)
+                            return response_err
+                        response_err = MediaResponse({"RequestID": "", "Error": {"Code": response_err.code, "Message": content.decode("utf-8", "replace")}})
+                    else:
+                        response_err = MediaResponse({"RequestID": "", "Error": {"Code": str(resp.status), "Message": "http put failed"}})
+                        congested = is_congestion(resp.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                response_err = MediaResponse({"RequestID": "", "Error": {"Code": "http put failed", "Message": str(e)}})
+                self.metrics.count("errors", action)
+            finally:
+                await self.__release_part__(congested, size, elapsed)
+            try_times -= 1
+            if try_times <= 0:
+                logger.error("%s failed: %s %s", action, response_err.code, response_err.message)
+                return response_err
+            wait_time = sleep_time * random.uniform(0.5, 1.5)
+            logger.warning("%s failed: %s %s, retry in %.2fs", action, response_err.code, response_err.message, wait_time)
+            self.metrics.count("retries", action)
+            await asyncio.sleep(wait_time)
+            sleep_time *= 2
+
+    async def __acquire_part__(self, action):
+        if self.part_limiter is None:
+            return
+        start = time.perf_counter()
+        await self.part_limiter.acquire()
+        self.metrics.timing("limit_wait", action, time.perf_counter() - start)
+
+    async def __release_part__(self, congested, size=0, seconds=0):
+        if self.part_limiter is None:
+            return
+        await self.part_limiter.release(congested, seconds * MB / size if size >= MB else None)
+
+    # __observe_throughput__ 与 MediaAsset.__observe_throughput__ 相同
+    def __observe_throughput__(self, size, seconds):
+        if size < MB or seconds <= 0:
+            return
+        rate = size / seconds
+        throughput = self.throughput
+        self.throughput = rate if throughput is None else throughput * 0.7 + rate * 0.3
+
+    def __part_size__(self, file_size):
+        concurrency = max(1, self.media_config.upload_concurrency)
+        max_part_size = max(MB, self.media_config.max_inflight_bytes // concurrency)
+        return self.part_size_policy.part_size_for(file_size, concurrency, max_part_size, self.throughput)
+
+    async def commit_upload(self, media_msg):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "MediaID": media_msg["MediaID"],
+            "Bucket": media_msg["Bucket"],
+            "Key": media_msg["Key"],
+            "UploadId": media_msg["UploadId"],
+            "Action": "CommitUpload"
+        }
+
+        resp, err = await self.__post__("CommitUpload", req)
+        if err is None:
+            return MediaResponse(resp["Response"])
+        return err
+
+    # upload_medias array of UploadMedia
+    async def create_medias(self, upload_medias):
+        req = {
+            "TIBusinessID": self.media_config.business,
+            "TIProjectID": self.media_config.project,
+            "UploadMediaSet": [media.to_map() for media in upload_medias]
+        }
+
+        resp, err = await self.__post__("CreateMedias", req)
+        if err is None:
+            media_infos = []
+            for v in resp["Response"]["UploadMediaInfoSet"]:
+                media_infos.append(UploadMediaInfo(v))
+            return media_infos, MediaResponse(resp["Response"])
+        return None, err
+
+    # upload_file 上传本地文件，返回上传后的媒体信息，progress、file_hash 与 MediaAsset.upload_file 相同。
+    # 文件和断点记录的读写放在线程池中执行，progress 可能在线程池中被调用
+    async def upload_file(self, file_path, media_name, media_meta, progress=None, file_hash=None):
+        if not os.path.exists(file_path):
+            return None, MediaResponse(
+                {"RequestID": "", "Error": {"Code": "failed", "Message": "file path is failed."}})
+
+        loop = asyncio.get_running_loop()
+        file_size = os.path.getsize(file_path)
+        start = time.perf_counter()
+
+        file_md5 = None
+        if self.dedup is not None:
+            file_md5 = await loop.run_in_executor(None, self.dedup.file_md5, file_path,
+                                                  self.media_config.read_chunk_size, file_hash)
+            self.metrics.timing("md5", "UploadFile", time.perf_counter() - start)
+            file_hash = None
+            media_info, err = await self.__find_duplicate__(file_md5, file_size)
+            if media_info is not None:
+                return media_info, err
+
+        journal = None
+        media_msg = None
+        part_size = None
+        mtime = os.path.getmtime(file_path)
+        if self.media_config.checkpoint_dir is not None:
+            journal = await loop.run_in_executor(None, UploadJournal.open, self.media_config.checkpoint_dir, file_path)
+            media_msg = await loop.run_in_executor(None, journal.load, file_size, mtime, None, media_name,
+                                                   media_meta.to_map())
+            part_size = journal.part_size
+        resumed = media_msg is not None
+
+        tracker = None
+        if progress is not None:
+            tracker = ProgressTracker(progress, file_size, self.media_config.progress_interval)
+        while True:
+            if media_msg is None:
+                part_size = self.__part_size__(file_size)
+                media_msg, err = await self.apply_upload(media_name, media_meta, file_size, part_size)
+                if err.code != "ok":
+                    break
+                if file_size < part_size:
+                    journal = None
+                if journal is not None:
+                    await loop.run_in_executor(None, journal.start, media_msg, file_size, mtime, part_size,
+                                               media_name, media_meta.to_map())
+
+            err = await self.do_upload(file_path, file_size, media_msg, journal, tracker, file_hash, part_size)
+            if err.code == "ok":
+                err = await self.commit_upload(media_msg)
+            if err.code == "ok" or not resumed or MediaAsset.__transient_error__(err):
+                break
+            # 与 MediaAsset.upload_file 相同，网关拒绝了断点记录中的上传时删除记录后重新申请上传，
+            # 传入 file_hash 时只删除记录
+            await loop.run_in_executor(None, journal.remove)
+            if file_hash is not None:
+                break
+            logger.warning("resumed upload of %s failed: %s %s, start over", file_path, err.code, err.message)
+            media_msg = None
+            resumed = False
+        if tracker is not None:
+            tracker.finish()
+        if err.code != "ok":
+            return None, err
+        if journal is not None:
+            await loop.run_in_executor(None, journal.remove)
+        if file_md5 is not None:
+            await loop.run_in_executor(None, self.dedup.add, file_md5, file_size, media_msg["MediaID"])
+        self.metrics.timing("upload", "UploadFile", time.perf_counter() - start)
+
+        media_info, err = await self.describe_media_details([media_msg["MediaID"]])
+        if err.code != "ok":
+            return None, err
+
+        return media_info[0], err
+
+    # upload_stream 与 MediaAsset.upload_stream 相同，stream 还可以是 read 为协程函数的对象
+    async def upload_stream(self, stream, media_name, media_meta, size=None, progress=None, file_hash=None):
+        start = time.perf_counter()
+        if isinstance(stream, (bytes, bytearray, memoryview)):
+            size = memoryview(stream).nbytes
+        part_size = self.__part_size__(size)
+        parts = async_iter_stream_parts(stream, part_size, file_hash)
+        try:
+            first = await parts.__anext__()
+        except (OSError, ValueError) as e:
+            return None, MediaResponse({"RequestID": "", "Error": {"Code": "read failed", "Message": str(e)}})
+        # 流在第一个分片内结束，或者传入的 size 小于分片大小时使用 PutObject，第一个分片必须正好是整个流
+        if len(first) < part_size or (size is not None and size < part_size):
+            size_err = MediaAsset.__check_stream_size__(size, len(first))
+            if size_err is not None:
+                return None, size_err
+            size = len(first)
+
+        media_msg, err = await self.apply_upload(media_name, media_meta, size, part_size)
+        if err.code != "ok":
+            return None, err
+
+        tracker = None
+        if progress is not None:
+            tracker = ProgressTracker(progress, size, self.media_config.progress_interval)
+        if size is not None and size < part_size:
+            err = await self.__upload_buffer__(media_msg, None, first, tracker)
+        else:
+            err = await self.__upload_parts__(media_msg, first, parts, size, part_size, tracker)
+        if tracker is not None:
+            tracker.finish()
+        if err.code != "ok":
+            return None, err
+
+        err = await self.commit_upload(media_msg)
+        if err.code != "ok":
+            return None, err
+        self.metrics.timing("upload", "UploadStream", time.perf_counter() - start)
+
+        media_info, err = await self.describe_media_details([media_msg["MediaID"]])
+        if err.code != "ok":
+            return None, err
+
+        return media_info[0], err
+
+    # __upload_parts__ window 个协程按顺序从 parts 中取下一个分片上传，first 为已经读出的第一个分片
+    async def __upload_parts__(self, media_msg, first, parts, size, part_size, progress=None):
+        window = max(1, min(self.media_config.upload_concurrency, self.media_config.max_inflight_bytes // part_size))
+        lock = asyncio.Lock()
+        pending = [first]
+        failed = []
+        part_number = 0
+        total = 0
+
+        async def next_part():
+            nonlocal part_number, total
+            async with lock:
+                if failed:
+                    return None, None
+                if pending:
+                    data = pending.pop()
+                else:
+                    try:
+                        data = await parts.__anext__()
+                    except StopAsyncIteration:
+                        return None, None
+                    except (OSError, ValueError) as e:
+                        failed.append(MediaResponse(
+                            {"RequestID": "", "Error": {"Code": "read failed", "Message": str(e)}}))
+                        return None, None
+                part_number += 1
+                total += len(data)
+                if size is not None and total > size:
+                    failed.append(MediaAsset.__check_stream_size__(size, total))
+                    return None, None
+                return part_number, data
+
+        async def worker():
+            while True:
+                number, data = await next_part()
+                if number is None:
+                    return
+                err = await self.__upload_buffer__(media_msg, number, data, progress)
+                if err.code != "ok":
+                    if not failed:
+                        failed.append(err)
+                    return
+
+        await asyncio.gather(*[worker() for i in range(window)])
+        if failed:
+            return failed[0]
+        return MediaAsset.__check_stream_size__(size, total) or \
+            MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+
+    # __upload_buffer__ 与 MediaAsset.__upload_buffer__ 相同，md5 在线程池中计算
+    async def __upload_buffer__(self, media_msg, part_number, data, progress=None):
+        action = "PutObject" if part_number is None else "UploadPart"
+        start = time.perf_counter()
+        body = BytesSlice(data, self.media_config.read_chunk_size)
+        if progress is not None:
+            progress.start()
+        try:
+            md5 = await asyncio.get_running_loop().run_in_executor(None, body.md5)
+            self.metrics.timing("md5", action, time.perf_counter() - start)
+            body.progress = progress
+            query = "useJson=true&Bucket={}&Key={}".format(media_msg["Bucket"], media_msg["Key"])
+            if part_number is not None:
+                query += "&uploadId={}&partNumber={}".format(media_msg["UploadId"], part_number)
+            url = "http://{}:{}/FileManager/{}?{}&Content-MD5={}".format(
+                self.media_config.host, self.media_config.port, action, query, md5)
+            response_err = await self.__put_body__(action, url, body)
+            if response_err.code != "ok":
+                body.seek(0)
+            elif part_number is not None:
+                self.metrics.timing("part", action, time.perf_counter() - start)
+            return response_err
+        finally:
+            if progress is not None:
+                progress.done()
+
+    # __find_duplicate__ 与 MediaAsset.__find_duplicate__ 相同，索引的读写放在线程池中执行
+    async def __find_duplicate__(self, md5, size):
+        loop = asyncio.get_running_loop()
+        media_id = await loop.run_in_executor(None, self.dedup.lookup, md5, size)
+        if media_id is None:
+            return None, None
+        media_infos, err = await self.describe_media_details([media_id])
+        if err.code != "ok":
+            logger.warning("describe dedup media %s failed: %s %s", media_id, err.code, err.message)
+            return None, None
+        media_info = media_infos[0] if media_infos else None
+        if media_info is None or self.check_status_failed(media_info.status):
+            await loop.run_in_executor(None, self.dedup.remove, md5, size, media_id)
+            return None, None
+        if not self.check_status_success(media_info.status):
+            return None, None
+        self.metrics.count("dedup_hits", "UploadFile")
+        return media_info, err
+
+    # check_status_failed 检查媒体状态是否失败
+    @staticmethod
+    def check_status_failed(state):
+        return MediaAsset.check_status_failed(state)
+
+    # check_status_success 检查媒体状态是否成功
+    @staticmethod
+    def check_status_success(state):
+        return MediaAsset.check_status_success(state)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import threading
+
+
+class UploadJournal(object):
+    # UploadJournal 分片上传的断点记录文件。
+    # 第一行记录文件信息和 ApplyUpload 返回的 MediaID/Bucket/Key/UploadId，
+    # 之后每个上传成功的分片追加一行 {"PartNumber": n, "MD5": "..."}。
+    def __init__(self, path):
+        self.path = path
+        self.parts = {}
+        self.part_size = None
+        self._lock = threading.Lock()
+
+    # open 返回本地文件 file_path 在 checkpoint_dir 下对应的断点记录
+    @staticmethod
+    def open(checkpoint_dir, file_path):
+        if not os.path.exists(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        name = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        return UploadJournal(os.path.join(checkpoint_dir, name + ".journal"))
+
+    # load 读取断点记录，文件大小、修改时间、分片大小、媒体名称或媒体元信息不一致时视为无效，返回 None。
+    # part_size 为 None 时沿用记录中的分片大小，保存在 self.part_size；media_meta 为 MediaMeta.to_map() 的结果
+    def load(self, file_size, mtime, part_size=None, media_name=None, media_meta=None):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r") as f:
+            lines = f.read().split("\n")
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return None
+        if header.get("Size") != file_size or header.get("MTime") != mtime or \
+                (part_size is not None and header.get("PartSize") != part_size) or \
+                header.get("Name") != media_name or header.get("MediaMeta") != media_meta:
+            return None
+
+        self.part_size = header["PartSize"]
+        self.parts = {}
+        for line in lines[1:]:
+            try:
+                part = json.loads(line)
+            except ValueError:
+                # 进程中断时最后一行可能没有写完整
+                continue
+            self.parts[part["PartNumber"]] = part["MD5"]
+        return {
+            "MediaID": header["MediaID"],
+            "Bucket": header["Bucket"],
+            "Key": header["Key"],
+            "UploadId": header["UploadId"]
+        }
+
+    # start 为新的上传创建断点记录，覆盖旧记录
+    def start(self, media_msg, file_size, mtime, part_size, media_name=None, media_meta=None):
+        header = {
+            "Size": file_size,
+            "MTime": mtime,
+            "PartSize": part_size,
+            "Name": media_name,
+            "MediaMeta": media_meta,
+            "MediaID": media_msg["MediaID"],
+            "Bucket": media_msg["Bucket"],
+            "Key": media_msg["Key"],
+            "UploadId": media_msg["UploadId"]
+        }
+        with self._lock:
+            self.parts = {}
+            self.part_size = part_size
+            with open(self.path, "w") as f:
+                f.write(json.dumps(header) + "\n")
+
+    # record_part 追加一个已上传成功的分片
+    def record_part(self, part_number, md5):
+        line = json.dumps({"PartNumber": part_number, "MD5": md5}) + "\n"
+        with self._lock:
+            self.parts[part_number] = md5
+            with open(self.path, "a") as f:
+                f.write(line)
+
+    # remove 上传提交成功后删除断点记录
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class DownloadJournal(object):
+    # DownloadJournal 断点下载的 sidecar 记录文件，与 .part 文件放在一起。
+    # 第一行记录下载地址、文件大小、ETag 和分段大小，
+    # 之后每写入一块数据追加一行 {"Start": 分段起始偏移, "Offset": 该分段已写入到的偏移}。
+    def __init__(self, path):
+        self.path = path
+        self.segments = {}
+        self._lock = threading.Lock()
+
+    # load 读取记录，下载地址、文件大小、ETag 或分段大小不一致时视为无效，返回 False
+    def load(self, download_url, file_size, etag, segment_size):
+        self.segments = {}
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r") as f:
+            lines = f.read().split("\n")
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return False
+        if header.get("URL") != download_url or header.get("Size") != file_size or \
+                header.get("ETag") != etag or header.get("SegmentSize") != segment_size:
+            return False
+
+        for line in lines[1:]:
+            try:
+                segment = json.loads(line)
+            except ValueError:
+                continue
+            self.segments[segment["Start"]] = max(segment["Offset"], self.segments.get(segment["Start"], 0))
+        return True
+
+    # start 为新的下载创建记录，覆盖旧记录
+    def start(self, download_url, file_size, etag, segment_size):
+        header = {
+            "URL": download_url,
+            "Size": file_size,
+            "ETag": etag,
+            "SegmentSize": segment_size
+        }
+        with self._lock:
+            self.segments = {}
+            with open(self.path, "w") as f:
+                f.write(json.dumps(header) + "\n")
+
+    # record 记录分段 start 已写入到 offset
+    def record(self, start, offset):
+        line = json.dumps({"Start": start, "Offset": offset}) + "\n"
+        with self._lock:
+            self.segments[start] = offset
+            with open(self.path, "a") as f:
+                f.write(line)
+
+    # remove 下载完成后删除记录
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonCodec(object):
+    # JsonCodec 标准库 json 编解码，dumps 直接返回请求 body 使用的 bytes
+    name = "json"
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def dumps(self, obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+# get_codec 按名字返回编解码器，"auto" 依次选择已安装的 orjson、ujson、标准库 json；
+# 传入 JsonCodec 对象时直接返回
+def get_codec(codec="auto"):
+    if isinstance(codec, JsonCodec):
+        return codec
+    if codec == "auto":
+        if orjson is not None:
+            return OrjsonCodec()
+        if ujson is not None:
+            return UjsonCodec()
+        return JsonCodec()
+    if codec == "orjson" and orjson is not None:
+        return OrjsonCodec()
+    if codec == "ujson" and ujson is not None:
+        return UjsonCodec()
+    if codec == "json":
+        return JsonCodec()
+    raise ValueError("json codec {} is not available".format(codec))
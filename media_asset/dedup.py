@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class DedupIndex(object):
+    # DedupIndex 本地 sqlite 去重索引，记录整个文件的 md5 + 大小对应的 MediaID。
+    # 同时按 (绝对路径, 大小, 修改时间) 记录文件的 md5，同一个文件再次上传时不需要重新读盘计算 md5。
+    # media_id 列不指定类型，按接口返回的类型原样保存。多个线程共用一个连接，所有操作加锁
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS medias ("
+                               "md5 TEXT NOT NULL, size INTEGER NOT NULL, media_id NOT NULL, "
+                               "created REAL NOT NULL, PRIMARY KEY (md5, size))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                               "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, md5 TEXT NOT NULL)")
+
+    # lookup 返回 md5 + size 对应的 MediaID，没有记录时返回 None
+    def lookup(self, md5, size):
+        with self._lock:
+            row = self._conn.execute("SELECT media_id FROM medias WHERE md5 = ? AND size = ?",
+                                     (md5, size)).fetchone()
+        return None if row is None else row[0]
+
+    # add 记录 md5 + size 对应的 MediaID，覆盖旧记录
+    def add(self, md5, size, media_id):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO medias (md5, size, media_id, created) VALUES (?, ?, ?, ?)",
+                               (md5, size, media_id, time.time()))
+
+    # remove 删除 md5 + size 的记录，media_id 不为空时只在记录的 MediaID 相同时删除
+    def remove(self, md5, size, media_id=None):
+        with self._lock, self._conn:
+            if media_id is None:
+                self._conn.execute("DELETE FROM medias WHERE md5 = ? AND size = ?", (md5, size))
+            else:
+                self._conn.execute("DELETE FROM medias WHERE md5 = ? AND size = ? AND media_id = ?",
+                                   (md5, size, media_id))
+
+    # file_md5 返回本地文件的 md5，文件大小和修改时间与记录一致时直接返回记录的值，否则按块读取文件计算。
+    # file_hash 不为空时计算的同时用文件内容更新 file_hash（使用记录的值时不更新，返回值相同）
+    def file_md5(self, file_path, chunk_size, file_hash=None):
+        path = os.path.abspath(file_path)
+        size = os.path.getsize(path)
+        mtime = os.path.getmtime(path)
+        if file_hash is None:
+            with self._lock:
+                row = self._conn.execute("SELECT md5 FROM files WHERE path = ? AND size = ? AND mtime = ?",
+                                         (path, size, mtime)).fetchone()
+            if row is not None:
+                return row[0]
+
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                md5.update(data)
+                if file_hash is not None:
+                    file_hash.update(data)
+        digest = md5.hexdigest()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, md5) VALUES (?, ?, ?, ?)",
+                               (path, size, mtime, digest))
+        return digest
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# open_dedup_index 按 MediaConfig.dedup_index 返回 (DedupIndex, 是否由 SDK 创建)，
+# 传入路径时创建 DedupIndex，客户端关闭时一起关闭；传入 DedupIndex 对象时直接使用，由调用方关闭
+def open_dedup_index(index):
+    if index is None:
+        return None, False
+    if isinstance(index, DedupIndex):
+        return index, False
+    return DedupIndex(index), True
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import threading
+
+# 网关限流时返回的错误码，同时匹配 "RequestLimitExceeded.xxx" 这样的子错误码
+THROTTLE_CODES = ("RequestLimitExceeded", "LimitExceeded")
+
+
+# is_congestion 判断一次请求的结果是否说明网关过载：http 429、5xx 或限流错误码。
+# 参数错误等业务错误不算过载，网络异常由调用方直接按过载处理
+def is_congestion(status_code=200, code=None):
+    if status_code == 429 or status_code >= 500:
+        return True
+    return code is not None and code.split(".", 1)[0] in THROTTLE_CODES
+
+
+class AimdController(object):
+    # AimdController 加性增、乘性减的控制量（令牌桶的速率或分片并发数）。
+    # 请求成功时加 increase（为 None 时加 1/value，即每轮并发整体加 1）；
+    # 过载或耗时 cost 超过基线的 tolerance 倍时乘以 backoff，cooldown 秒内最多减一次，同一波失败只算一次。
+    # 基线为观测到的最小 cost，每个样本上浮 1%，链路变化后能重新适应
+    def __init__(self, value, min_value, max_value, increase=None, backoff=0.5, tolerance=None, cooldown=1.0):
+        self.value = float(value)
+        self.min_value = min_value
+        self.max_value = max_value
+        self.increase = increase
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.cooldown = cooldown
+        self.baseline = None
+        self._last_decrease = None
+        self._lock = threading.Lock()
+
+    # feedback 根据一次请求的结果调整控制量，返回调整后的值
+    def feedback(self, congested=False, cost=None):
+        with self._lock:
+            if cost is not None and self.tolerance is not None:
+                if self.baseline is not None and cost > self.baseline * self.tolerance:
+                    congested = True
+                self.baseline = cost if self.baseline is None else min(cost, self.baseline * 1.01)
+            if congested:
+                now = time.monotonic()
+                if self._last_decrease is None or now - self._last_decrease >= self.cooldown:
+                    self.value = max(self.min_value, self.value * self.backoff)
+                    self._last_decrease = now
+            else:
+                step = self.increase if self.increase is not None else 1.0 / max(1.0, self.value)
+                self.value = min(self.max_value, self.value + step)
+            return self.value
+
+
+class TokenBucket(object):
+    # TokenBucket API 请求的令牌桶，每秒补充 rate 个令牌，最多积累 burst 个。
+    # 网关过载时速率减半（不低于 min_rate），之后每个成功的请求增加 rate 的 1%，逐步恢复到配置的速率
+    def __init__(self, rate, burst=None, min_rate=None):
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.controller = AimdController(rate, min_rate if min_rate is not None else rate / 20.0, rate, rate / 100.0)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.controller.value
+
+    # reserve 取一个令牌，返回需要等待的秒数。令牌不足时预支，等待结束时令牌正好补充到位，
+    # 同步调用方 time.sleep、异步调用方 asyncio.sleep 返回值
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def feedback(self, congested=False):
+        self.controller.feedback(congested)
+
+
+class AdaptiveLimiter(object):
+    # AdaptiveLimiter 同一个客户端上传分片的自适应并发上限，在 [min_limit, max_limit] 之间按 AIMD 调整。
+    # cost 为每 MB 的上传秒数，超过基线 tolerance 倍说明增加并发已经不能提高吞吐，只会排队
+    def __init__(self, max_limit, min_limit=1, backoff=0.5, tolerance=2.0, cooldown=1.0):
+        self.controller = AimdController(max_limit, min_limit, max_limit, None, backoff, tolerance, cooldown)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return max(1, int(self.controller.value))
+
+    # acquire 等待正在上传的分片数低于当前上限
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, congested=False, cost=None):
+        self.controller.feedback(congested, cost)
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+
+class AsyncAdaptiveLimiter(object):
+    # AsyncAdaptiveLimiter AdaptiveLimiter 的 asyncio 版本，acquire/release 是协程
+    def __init__(self, max_limit, min_limit=1, backoff=0.5, tolerance=2.0, cooldown=1.0):
+        self.controller = AimdController(max_limit, min_limit, max_limit, None, backoff, tolerance, cooldown)
+        self.in_flight = 0
+        self._cond = None
+
+    @property
+    def limit(self):
+        return max(1, int(self.controller.value))
+
+    # asyncio.Condition 需要在事件循环中创建，第一次使用时创建
+    def __get_cond__(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self):
+        cond = self.__get_cond__()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, congested=False, cost=None):
+        self.controller.feedback(congested, cost)
+        cond = self.__get_cond__()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
@@ -4,15 +4,63 @@
 import os
 import json
 import enum
+import time
+import random
 import hashlib
+import logging
+import itertools
+import copy
+import threading
 import requests
-import grequests
+from concurrent.futures import Future, ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from retrying import retry
 
 import sys
 
 sys.path.append(".")
 from .tisign.sign import *
+from .checkpoint import UploadJournal, DownloadJournal
+from .cache import TTLCache
+from .codec import JsonCodec, get_codec
+from .metrics import MetricsCollector, MemoryMetrics
+from .progress import Progress, ProgressTracker
+from .dedup import DedupIndex, open_dedup_index
+from .limiter import TokenBucket, AdaptiveLimiter, is_congestion
+
+# SDK 的日志默认不输出，需要时配置 logging.getLogger("media_asset")
+logger = logging.getLogger("media_asset")
+logger.addHandler(logging.NullHandler())
+
+# 日志中请求/响应 body 的最大字符数
+LOG_BODY_LIMIT = 1024
+
+
+class LogBody(object):
+    # LogBody 日志参数，只有日志真正输出时才格式化，超过 LOG_BODY_LIMIT 的部分被截断
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        data = self.data
+        if isinstance(data, bytes):
+            size = len(data)
+            data = data[:LOG_BODY_LIMIT * 4].decode("utf-8", "replace")
+        else:
+            data = str(data)
+            size = len(data)
+        if len(data) > LOG_BODY_LIMIT:
+            return "{}...(truncated, {} total)".format(data[:LOG_BODY_LIMIT], size)
+        return data
+
+
+# redact_header 返回隐藏了 Authorization(其中包含 secret_id)的请求头，用于日志输出
+def redact_header(header):
+    header = dict(header)
+    if "Authorization" in header:
+        header["Authorization"] = "***"
+    return header
 
 class MediaState(enum.Enum):
   UPLOADING = "上传中"
@@ -80,8 +128,65 @@ class MediaResponse(object):
             self.message = data["Error"]["Message"]
 
 
+MB = 1024 * 1024
+
+# 默认的分片大小，同时也是 PutObject 直传的文件大小上限
+BLOCK_SIZE = 32 * MB
+DOWNLOAD_CONCURRENCY = 4
+
+
+class FixedPartSizePolicy(object):
+    # FixedPartSizePolicy 固定的分片大小，小于 part_size 的文件使用 PutObject 直传
+    def __init__(self, part_size=BLOCK_SIZE):
+        self.part_size = part_size
+
+    # part_size_for 返回 file_size 大小的文件使用的分片大小，文件小于返回值时使用 PutObject 直传，
+    # file_size 为 None 表示大小未知（upload_stream）。
+    # concurrency 为分片上传并发数，max_part_size 为内存上限允许的最大分片，
+    # throughput 为观测到的单个连接的上传速率（字节/秒，没有观测值时为 None）
+    def part_size_for(self, file_size, concurrency, max_part_size, throughput=None):
+        return self.part_size
+
+
+class PartSizePolicy(object):
+    # PartSizePolicy 根据文件大小、上传并发数和观测到的上传速率选择分片大小：
+    # 1. 单个连接 target_seconds 秒内能传完的文件直接 PutObject（不超过 BLOCK_SIZE），没有观测值时为 BLOCK_SIZE；
+    # 2. 分片大小取单个连接 target_seconds 秒能传完的字节数，没有观测值时为 BLOCK_SIZE，
+    #    同时保证分片数不少于并发数，使所有连接都在上传；
+    # 3. 结果限制在 [min_part_size, max_part_size] 之间并按 MB 对齐，分片数不超过服务端上限 max_parts
+    def __init__(self, min_part_size=8 * MB, max_part_size=1024 * MB, max_parts=10000, target_seconds=4):
+        self.min_part_size = min_part_size
+        self.max_part_size = max_part_size
+        self.max_parts = max_parts
+        self.target_seconds = target_seconds
+
+    def part_size_for(self, file_size, concurrency, max_part_size, throughput=None):
+        if file_size is None:
+            # 大小未知时取允许的最大分片，max_parts 个分片能上传的数据最多
+            part_size = max(self.min_part_size, min(self.max_part_size, max_part_size))
+            return -(-part_size // MB) * MB
+
+        target = BLOCK_SIZE if not throughput else int(throughput * self.target_seconds)
+        if file_size < min(BLOCK_SIZE, max(self.min_part_size, target)):
+            return BLOCK_SIZE
+
+        part_size = min(target, -(-file_size // max(1, concurrency)))
+        part_size = max(self.min_part_size, min(part_size, self.max_part_size, max_part_size))
+        part_size = max(part_size, -(-file_size // self.max_parts))
+        return min(-(-part_size // MB) * MB, file_size)
+
+
 class MediaConfig(object):
-    def __init__(self, host, port, secret_id, secret_key, project, business, service, version):
+    def __init__(self, host, port, secret_id, secret_key, project, business, service, version,
+                 max_inflight_bytes=4 * BLOCK_SIZE, read_chunk_size=1024 * 1024,
+                 upload_concurrency=4, upload_retry_times=5, upload_retry_interval=0.05,
+                 checkpoint_dir=None, pool_size=10, keep_alive=True, connect_timeout=10, read_timeout=None,
+                 download_concurrency=DOWNLOAD_CONCURRENCY, download_segment_size=BLOCK_SIZE, download_retry_times=5,
+                 download_retry_interval=0.05, upload_files_concurrency=4, media_id_batch_size=100,
+                 api_concurrency=4, cache_size=0, cache_ttl=60, json_codec="auto",
+                 metrics=None, progress_interval=0.5, md5_concurrency=2, part_size_policy=None,
+                 dedup_index=None,
+                 api_rate=None, api_burst=None, adaptive_concurrency=False):
         self.host = host
         self.port = port
         self.secret_id = secret_id
@@ -90,6 +195,38 @@ class MediaConfig(object):
         self.business = business
         self.service = service
         self.version = version
+        self.max_inflight_bytes = max_inflight_bytes # 同时在途的分片字节数上限，决定并发上传的分片数
+        self.read_chunk_size = read_chunk_size # 流式读写文件时每次读写的字节数
+        self.upload_concurrency = upload_concurrency # 分片上传的并发数
+        self.upload_retry_times = upload_retry_times # 单个分片的最大尝试次数
+        self.upload_retry_interval = upload_retry_interval # 分片重试的初始等待秒数，每次重试翻倍
+        self.checkpoint_dir = checkpoint_dir # 断点续传记录目录，不使用断点续传传 None
+        self.pool_size = pool_size # 连接池大小，应不小于 upload_concurrency
+        self.keep_alive = keep_alive # 是否复用 tcp 连接
+        self.connect_timeout = connect_timeout # 建立连接超时秒数，None 表示不超时
+        self.read_timeout = read_timeout # 读取响应超时秒数，None 表示不超时
+        self.download_concurrency = download_concurrency # 分段下载的并发数，为 1 时顺序下载
+        self.download_segment_size = download_segment_size # 分段下载时每个 Range 请求的字节数
+        self.download_retry_times = download_retry_times # 单个分段的最大尝试次数
+        self.download_retry_interval = download_retry_interval # 分段重试的初始等待秒数，每次重试翻倍
+        self.upload_files_concurrency = upload_files_concurrency # upload_files 同时上传的文件数
+        self.media_id_batch_size = media_id_batch_size # describe_media_details/remove_medias 每个请求的媒体ID数
+        self.api_concurrency = api_concurrency # 拆分后的请求并发数
+        self.cache_size = cache_size # describe_categories/describe_media_details 结果缓存的条目数，0 表示不缓存
+        self.cache_ttl = cache_ttl # 缓存条目的有效秒数
+        self.json_codec = json_codec # json 编解码器："auto"、"orjson"、"ujson"、"json" 或 JsonCodec 对象
+        self.metrics = metrics # 指标收集器 MetricsCollector，None 表示不收集
+        self.progress_interval = progress_interval # upload_file/download_file 进度回调的最小间隔秒数
+        self.md5_concurrency = md5_concurrency # 提前计算分片 md5 的线程数，所有文件共用
+        # upload_file 选择分片大小和是否 PutObject 直传的策略，None 表示使用 PartSizePolicy()，
+        # 使用 FixedPartSizePolicy() 时与之前一样固定为 BLOCK_SIZE
+        self.part_size_policy = part_size_policy
+        # upload_file 的去重索引：sqlite 文件路径或 DedupIndex 对象，None 表示不去重
+        self.dedup_index = dedup_index
+        self.api_rate = api_rate # 同一个客户端 API 请求（不含上传分片和下载）每秒的请求数上限，None 表示不限速
+        self.api_burst = api_burst # API 请求令牌桶的容量，None 时与 api_rate 相同
+        # 为 True 时同一个客户端同时上传的分片数在 [1, upload_concurrency] 之间按网关的错误和延迟自动调整
+        self.adaptive_concurrency = adaptive_concurrency
 
 
 class MediaMeta(object):
@@ -109,12 +246,16 @@ class MediaMeta(object):
 
 
 class Category(object):
+    __slots__ = ("type", "tag_set")
+
     def __init__(self, data):
         self.type = data["Type"]
         self.tag_set = data["TagSet"]
 
 
 class Label(object):
+    __slots__ = ("type", "tag", "second_tag_set")
+
     def __init__(self, data):
         self.type = data["Type"]
         self.tag = data["Tag"]
@@ -138,6 +279,8 @@ class FilterBy(object):
 
 
 class FailedMediaInfo(object):
+    __slots__ = ("type", "failed_reason")
+
     def __init__(self, data):
         self.type = data["MediaID"]
         self.failed_reason = data["FailedReason"]
@@ -160,9 +303,11 @@ class UploadMedia(object):
         }
     
     def to_json(self):
-        return json.dumps(self.to_map)
+        return json.dumps(self.to_map())
 
 class UploadMediaInfo(object):
+    __slots__ = ("media_id", "failed_reason")
+
     def __init__(self, data):
         self.media_id = data["MediaID"]
         self.failed_reason = data["FailedReason"]
@@ -174,6 +319,10 @@ class UploadMediaInfo(object):
         }
 
 class MediaInfoSet(object):
+    __slots__ = ("media_id", "name", "duration", "size", "width", "height", "fps", "bit_rate", "format",
+                 "download_url", "failed_reason", "status", "media_type", "media_tag", "media_second_tag",
+                 "media_lang")
+
     def __init__(self, data):
         self.media_id = data.get("MediaID", 0)
         self.name = data.get("Name", "")
@@ -194,82 +343,652 @@ class MediaInfoSet(object):
         self.media_lang = data.get("MediaLang", "")
 
 
-@retry(stop_max_attempt_number=3)
-def post_http(header, url, req):
-    print(req)
-    response = requests.post(url=url, data=json.dumps(req), headers=header)
+# 网络异常时最多尝试 retry_times 次，重试前按指数退避等待并加入随机抖动，避免大量客户端同时重试，每次重试计入 retries 指标
+def post_http(header, url, req, session=requests, timeout=None, codec=JsonCodec(), metrics=MetricsCollector(),
+              rate_limiter=None, retry_times=3):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("POST %s header=%s body=%s", url, redact_header(header), LogBody(req))
+    action = header.get("X-TC-Action")
+    data = codec.dumps(req)
+    for i in range(retry_times):
+        # 每次尝试（包括重试）都从令牌桶取一个令牌，结果反馈给令牌桶调整速率
+        if rate_limiter is not None:
+            wait_time = rate_limiter.reserve()
+            if wait_time > 0:
+                metrics.timing("limit_wait", action, wait_time)
+                time.sleep(wait_time)
+        start = time.perf_counter()
+        try:
+            response = session.post(url=url, data=data, headers=header, timeout=timeout)
+            break
+        except Exception as e:
+            metrics.count("errors", action)
+            if rate_limiter is not None:
+                rate_limiter.feedback(True)
+            if i + 1 == retry_times:
+                raise
+            logger.warning("POST %s action=%s failed: %s, retry", url, action, e)
+            metrics.count("retries", action)
+            time.sleep(min(0.1 * 2 ** (i + 1), 2) + random.uniform(0, 0.1))
+    metrics.timing("request", action, time.perf_counter() - start)
+    metrics.count("bytes_sent", action, len(data))
+    metrics.count("bytes_received", action, len(response.content))
     if response.status_code != 200:
+        logger.warning("POST %s action=%s failed: http %d", url, action, response.status_code)
+        if rate_limiter is not None:
+            rate_limiter.feedback(is_congestion(response.status_code))
         return None, MediaResponse(
             {"RequestID": "", "Error": {"Code": str(response.status_code), "Message": "http failed"}})
 
-    response_map = json.loads(response.text)
-    print(response.text)
+    response_map = codec.loads(response.content)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("POST %s action=%s response=%s", url, action, LogBody(response.content))
+    if rate_limiter is not None:
+        error = response_map.get("Response", {}).get("Error")
+        rate_limiter.feedback(error is not None and is_congestion(code=error.get("Code")))
     return response_map, None
 
 
-@retry(stop_max_attempt_number=3)
-def get_http(header, url):
-    response = requests.get(url=url, headers=header)
+@retry(stop_max_attempt_number=3, wait_exponential_multiplier=100, wait_exponential_max=2000, wait_jitter_max=100)
+def get_http(header, url, session=requests, timeout=None):
+    response = session.get(url=url, headers=header, timeout=timeout)
     if response.status_code != 200:
+        logger.warning("GET %s failed: http %d", url, response.status_code)
         return None, MediaResponse(
             {"RequestID": "", "Error": {"Code": str(response.status_code), "Message": "http failed"}})
 
     return response.content, None
 
 
+# create_temp_file 在 directory 下创建名为 "prefix.随机串.tmp" 的新文件，返回 (以 "xb" 打开的文件对象, 路径)。
+# 与 open() 一样按 umask 设置权限，tempfile.mkstemp 的 0600 在重命名后会保留下来
+def create_temp_file(directory, prefix):
+    while True:
+        path = os.path.join(directory, "{}.{}.tmp".format(prefix, os.urandom(6).hex()))
+        try:
+            return open(path, "xb"), path
+        except FileExistsError:
+            continue
+
+
+# merge_batches 按 batches 的顺序合并各批次的 (result, err)，供 __fan_out__ 使用
+def merge_batches(batches, responses, on_error=None):
+    results = []
+    response_err = None
+    first_err = None
+    for batch, (result, err) in zip(batches, responses):
+        if err.code != "ok":
+            if on_error is None:
+                return None, err
+            first_err = first_err or err
+            result = on_error(batch, err)
+        else:
+            response_err = err
+        results.extend(result)
+    if response_err is None:
+        return None, first_err
+    return results, response_err
+
+
+# failed_removal 把删除请求失败的批次中的每个媒体ID记为删除失败
+def failed_removal(media_ids, err):
+    return [FailedMediaInfo({"MediaID": media_id, "FailedReason": err.message}) for media_id in media_ids]
+
+
 def get_md5(s):
     md = hashlib.md5()
     md.update(s)
     return md.hexdigest()
 
 
+class FileSlice(object):
+    # FileSlice 文件中 [offset, offset + length) 区间的只读流，直接作为 http body 按块发送，
+    # 不会把整个分片读入内存。progress 不为空时读取和回退的字节数计入上传进度
+    def __init__(self, file_path, offset, length, chunk_size=1024 * 1024):
+        self.file_path = file_path
+        self.offset = offset
+        self.length = length
+        self.chunk_size = chunk_size
+        self.progress = None
+        self._pos = 0
+        self._f = open(file_path, "rb")
+        self._f.seek(offset)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.chunk_size)
+            if not data:
+                break
+            yield data
+
+    def read(self, size=-1):
+        remain = self.length - self._pos
+        if remain <= 0:
+            return b""
+        if size is None or size < 0 or size > remain:
+            size = remain
+        data = self._f.read(size)
+        self._pos += len(data)
+        if self.progress is not None:
+            self.progress.add(len(data))
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += self.length
+        pos = min(max(pos, 0), self.length)
+        if self.progress is not None and pos != self._pos:
+            self.progress.add(pos - self._pos)
+        self._pos = pos
+        self._f.seek(self.offset + self._pos)
+        return self._pos
+
+    # md5 按块计算分片的md5，计算完成后回到分片开头。file_hash 不为空时同时用读到的数据更新 file_hash
+    def md5(self, file_hash=None):
+        md = hashlib.md5()
+        self.seek(0)
+        for data in self:
+            md.update(data)
+            if file_hash is not None:
+                file_hash.update(data)
+        self.seek(0)
+        return md.hexdigest()
+
+    def close(self):
+        self._f.close()
+
+
+class BytesSlice(FileSlice):
+    # BytesSlice 内存中的一段数据，接口与 FileSlice 相同，upload_stream 用它发送读入内存的分片。
+    # data 为 bytes/bytearray/memoryview，不复制数据
+    def __init__(self, data, chunk_size=1024 * 1024):
+        self.file_path = None
+        self.offset = 0
+        self.data = memoryview(data).cast("B")
+        self.length = len(self.data)
+        self.chunk_size = chunk_size
+        self.progress = None
+        self._pos = 0
+
+    def read(self, size=-1):
+        remain = self.length - self._pos
+        if remain <= 0:
+            return b""
+        if size is None or size < 0 or size > remain:
+            size = remain
+        data = self.data[self._pos:self._pos + size].tobytes()
+        self._pos += size
+        if self.progress is not None:
+            self.progress.add(size)
+        return data
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += self.length
+        pos = min(max(pos, 0), self.length)
+        if self.progress is not None and pos != self._pos:
+            self.progress.add(pos - self._pos)
+        self._pos = pos
+        return self._pos
+
+    def close(self):
+        pass
+
+
+# iter_stream_parts 依次产出 stream 中每 part_size 字节的数据，只有最后一个分片可以小于 part_size，
+# 空的 stream 产出一个空分片。stream 为 bytes/bytearray/memoryview 时产出其切片，不复制数据；
+# 否则为可读对象，支持 readinto 时直接读入分片的缓冲区。file_hash 不为空时按顺序用读到的数据更新 file_hash
+def iter_stream_parts(stream, part_size, file_hash=None):
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        view = memoryview(stream).cast("B")
+        for offset in range(0, max(1, len(view)), part_size):
+            part = view[offset:offset + part_size]
+            if file_hash is not None:
+                file_hash.update(part)
+            yield part
+        return
+
+    first = True
+    while True:
+        part = read_stream(stream, part_size)
+        if not part and not first:
+            return
+        first = False
+        if file_hash is not None:
+            file_hash.update(part)
+        yield part
+        if len(part) < part_size:
+            return
+
+
+# read_stream 从可读对象中读取 size 字节，流结束时返回的数据少于 size
+def read_stream(stream, size):
+    if hasattr(stream, "readinto"):
+        buf = bytearray(size)
+        view = memoryview(buf)
+        pos = 0
+        while pos < size:
+            n = stream.readinto(view[pos:])
+            if not n:
+                break
+            pos += n
+        return view[:pos]
+
+    chunks = []
+    pos = 0
+    while pos < size:
+        data = stream.read(size - pos)
+        if not data:
+            break
+        chunks.append(data)
+        pos += len(data)
+    return b"".join(chunks)
+
+
+class PartHasher(object):
+    # PartHasher 分片 md5 流水线：在 executor 中提前计算后续 lookahead 个分片的 md5，
+    # 与其它分片的读取和上传重叠，上传分片时 md5 通常已经算好。
+    # file_hash 不为空时 executor 必须是单线程的，按文件顺序计算所有分片（包括 skip 中的分片），
+    # 同时更新整个文件的 hash，不需要再读一遍文件
+    def __init__(self, executor, file_path, file_size, chunk_size, skip=(), file_hash=None, lookahead=1,
+                 metrics=MetricsCollector(), part_size=BLOCK_SIZE):
+        self.executor = executor
+        self.file_path = file_path
+        self.file_size = file_size
+        self.part_size = part_size
+        self.chunk_size = chunk_size
+        self.skip = skip
+        self.file_hash = file_hash
+        self.lookahead = lookahead
+        self.metrics = metrics
+        self.number = (file_size + part_size - 1) // part_size
+        self._next = 1
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.__schedule__(lookahead)
+
+    # future 返回编号为 part_number 的分片 md5 的 Future，并开始计算之后 lookahead 个分片
+    def future(self, part_number):
+        self.__schedule__(part_number + self.lookahead)
+        with self._lock:
+            return self._futures.pop(part_number)
+
+    # finish 计算剩余的所有分片并等待完成，用于得到整个文件的 hash
+    def finish(self):
+        self.__schedule__(self.number)
+        with self._lock:
+            futures = list(self._futures.values())
+        wait(futures)
+
+    # cancel 取消尚未开始计算的分片
+    def cancel(self):
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+
+    def __schedule__(self, last):
+        with self._lock:
+            while self._next <= min(last, self.number):
+                part_number = self._next
+                self._next += 1
+                if self.file_hash is None and part_number in self.skip:
+                    continue
+                self._futures[part_number] = self.executor.submit(self.__part_md5__, part_number)
+
+    def __part_md5__(self, part_number):
+        start = time.perf_counter()
+        offset = (part_number - 1) * self.part_size
+        part = FileSlice(self.file_path, offset, min(self.part_size, self.file_size - offset), self.chunk_size)
+        try:
+            return part.md5(self.file_hash)
+        finally:
+            part.close()
+            self.metrics.timing("md5", "UploadPart", time.perf_counter() - start)
+
+
 class MediaAsset(object):
     def __init__(self, media_config):
         self.media_config = media_config
         self.url = "http://{}:{}/gateway".format(media_config.host, media_config.port)
-
-    def __get_header__(self, action):
-        ts = TiSign(self.media_config.host,
-                    action,
-                    self.media_config.version,
-                    self.media_config.service,
-                    'application/json',
-                    'POST',
-                    self.media_config.secret_id,
-                    self.media_config.secret_key)
+        self.timeout = (media_config.connect_timeout, media_config.read_timeout)
+        self.codec = get_codec(media_config.json_codec)
+        self.metrics = media_config.metrics if media_config.metrics is not None else MetricsCollector()
+        self.part_size_policy = media_config.part_size_policy
+        if self.part_size_policy is None:
+            self.part_size_policy = PartSizePolicy()
+        # 最近上传的分片观测到的单个连接速率（字节/秒），用于选择分片大小
+        self.throughput = None
+        self._signers = {}
+        # 所有文件的分片共用一个线程池，upload_concurrency 为全局的分片并发数；
+        # 拆分后的接口请求共用另一个线程池
+        self._executors = {}
+        self._lock = threading.Lock()
+        self.cache = None
+        if media_config.cache_size > 0:
+            self.cache = TTLCache(media_config.cache_size, media_config.cache_ttl)
+        self.dedup, self._own_dedup = open_dedup_index(media_config.dedup_index)
+        # 同一个客户端的所有线程共用的 API 令牌桶和分片自适应并发上限
+        self.rate_limiter = None
+        if media_config.api_rate:
+            self.rate_limiter = TokenBucket(media_config.api_rate, media_config.api_burst)
+        self.part_limiter = None
+        if media_config.adaptive_concurrency:
+            self.part_limiter = AdaptiveLimiter(max(1, media_config.upload_concurrency))
+
+        # 所有请求共用一个连接池
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=media_config.pool_size,
+                                                pool_maxsize=media_config.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if not media_config.keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # close 关闭连接池和线程池
+    def close(self):
+        with self._lock:
+            for executor in self._executors.values():
+                executor.shutdown()
+            self._executors = {}
+        if self._own_dedup:
+            self.dedup.close()
+        self.session.close()
+
+    def __get_executor__(self, name, max_workers):
+        with self._lock:
+            if name not in self._executors:
+                self._executors[name] = ThreadPoolExecutor(max_workers=max_workers)
+            return self._executors[name]
+
+    # __fan_out__ 把 media_ids 按 media_id_batch_size 拆分后并发调用 func，按输入顺序合并结果，
+    # 任意一批失败时返回第一个失败批次的错误。on_error 不为空时用 on_error(batch, err) 的返回值代替失败批次的结果，
+    # 只有所有批次都失败时才返回错误
+    def __fan_out__(self, func, media_ids, on_error=None):
+        batch_size = self.media_config.media_id_batch_size
+        batches = [media_ids[i:i + batch_size] for i in range(0, len(media_ids), batch_size)]
+        if len(batches) <= 1:
+            return func(media_ids)
+
+        executor = self.__get_executor__("api", self.media_config.api_concurrency)
+        return merge_batches(batches, executor.map(func, batches), on_error)
+
+    # __get_header__ 构造带签名的请求头，每种 action/content_type/http_method 复用同一个 TiSign
+    def __get_header__(self, action, content_type='application/json', http_method='POST'):
+        start = time.perf_counter()
+        key = (action, content_type, http_method)
+        ts = self._signers.get(key)
+        if ts is None:
+            ts = TiSign(self.media_config.host,
+                        action,
+                        self.media_config.version,
+                        self.media_config.service,
+                        content_type,
+                        http_method,
+                        self.media_config.secret_id,
+                        self.media_config.secret_key)
+            self._signers[key] = ts
 
         http_header_dict, authorization = ts.build_header_with_signature()
+        self.metrics.timing("sign", action, time.perf_counter() - start)
         return http_header_dict, authorization
 
-    # DownloadFile 通过媒体信息返回的url下载文件到本地
-    def download_file(self, download_url, dir2, file_name):
-        resp, err = self.download_t_buf(download_url)
-        if err.code != "ok":
-            return err
-
+    # download_file 通过媒体信息返回的url下载文件到本地，边下载边写入临时文件，下载完成后重命名为 file_name。
+    # download_concurrency 大于 1 时按 download_segment_size 分段并发下载。
+    # resume 为 True 时下载到 file_name.part 并在 file_name.part.json 中记录进度，
+    # 失败后再次调用从上次写入的位置继续下载。
+    # progress 为进度回调，下载过程中每隔 progress_interval 秒以 Progress 为参数调用一次，结束时再调用一次
+    def download_file(self, download_url, dir2, file_name, resume=False, progress=None):
         if not os.path.exists(dir2):
             os.makedirs(dir2)
 
-        with open("{}/{}".format(dir2, file_name), "wb") as f:
-            f.write(resp)
+        start = time.perf_counter()
+        tracker = None
+        if progress is not None:
+            tracker = ProgressTracker(progress, interval=self.media_config.progress_interval)
+        journal = None
+        if resume:
+            tmp_path = os.path.join(dir2, file_name + ".part")
+            journal = DownloadJournal(tmp_path + ".json")
+            if not os.path.exists(tmp_path):
+                open(tmp_path, "wb").close()
+        else:
+            f, tmp_path = create_temp_file(dir2, file_name)
+            f.close()
+
+        if self.media_config.download_concurrency > 1 or journal is not None:
+            err = self.__download_ranges__(download_url, tmp_path, journal, tracker)
+        else:
+            err = self.__download_stream__(download_url, tmp_path, tracker)
+        if tracker is not None:
+            tracker.finish()
+        if err.code != "ok":
+            if journal is None:
+                os.remove(tmp_path)
+            return err
 
+        os.replace(tmp_path, os.path.join(dir2, file_name))
+        if journal is not None:
+            journal.remove()
+        self.metrics.timing("download", "DownloadFile", time.perf_counter() - start)
+        return err
+
+    # __download_stream__ 顺序下载文件到 file_path
+    def __download_stream__(self, download_url, file_path, progress=None):
+        response, err = self.__get_download__(download_url)
+        if err.code != "ok":
+            return err
+        return self.__write_response__(response, file_path, progress)
+
+    # __write_response__ 把整个响应写入 file_path，progress 的总字节数取自 Content-Length，写入期间计为一个正在传输的分段
+    def __write_response__(self, response, file_path, progress=None):
+        chunks = self.__iter_response__(response, self.media_config.read_chunk_size)
+        if progress is not None:
+            content_length = response.headers.get("Content-Length", "")
+            if response.status_code == 200 and content_length.isdigit():
+                progress.begin(int(content_length))
+            progress.start()
+        try:
+            with open(file_path, "wb") as f:
+                for data in chunks:
+                    f.write(data)
+                    if progress is not None:
+                        progress.add(len(data))
+        except (requests.RequestException, OSError) as e:
+            chunks.close()
+            return MediaResponse({"RequestID": "", "Error": {"Code": "download failed", "Message": str(e)}})
+        finally:
+            if progress is not None:
+                progress.done()
         return MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
 
+    # __download_ranges__ 先用 Range: bytes=0-0 获取文件大小，再并发下载各个分段并按偏移写入 file_path，
+    # 服务端不支持 Range 时退化为顺序下载。journal 不为空时跳过已写入的数据并记录新的进度
+    def __download_ranges__(self, download_url, file_path, journal=None, progress=None):
+        url = "http://{}:{}{}".format(self.media_config.host, self.media_config.port, download_url)
+        http_header_dict, authorization = self.__get_header__("DownloadFile", "application/octet-stream", 'GET')
+        http_header_dict["Range"] = "bytes=0-0"
+        try:
+            response = self.session.get(url=url, headers=http_header_dict, stream=True, timeout=self.timeout)
+        except requests.RequestException as e:
+            return MediaResponse({"RequestID": "", "Error": {"Code": "download failed", "Message": str(e)}})
+
+        if response.status_code == 416:
+            # 空文件
+            response.close()
+            return MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+        content_range = response.headers.get("Content-Range", "")
+        if response.status_code == 200 or (response.status_code == 206 and content_range.endswith("/*")):
+            return self.__write_response__(response, file_path, progress)
+        response.close()
+        if response.status_code != 206:
+            return MediaResponse(
+                {"RequestID": "", "Error": {"Code": str(response.status_code), "Message": "http failed"}})
+
+        file_size = content_range.rsplit("/", 1)[-1]
+        if not content_range.startswith("bytes 0-") or not file_size.isdigit():
+            return MediaResponse({"RequestID": "", "Error": {"Code": "download failed",
+                                                             "Message": "invalid Content-Range: " + content_range}})
+        file_size = int(file_size)
+        segment_size = self.media_config.download_segment_size
+        etag = response.headers.get("ETag", "")
+        with open(file_path, "r+b") as f:
+            # .part 文件在开始时已按 file_size 预分配，大小不符说明 .part 文件被删除或截断，记录不再可信
+            if journal is not None and not (journal.load(download_url, file_size, etag, segment_size) and
+                                            os.fstat(f.fileno()).st_size == file_size):
+                # 文件已变化或没有有效记录，从头下载
+                f.truncate(0)
+                journal.start(download_url, file_size, etag, segment_size)
+            f.truncate(file_size)
+        if progress is not None:
+            done = 0 if journal is None else sum(offset - start for start, offset in journal.segments.items())
+            progress.begin(file_size, done)
+
+        stop = threading.Event()
+        reached = {}
+        response_err = MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+        with ThreadPoolExecutor(max_workers=max(1, self.media_config.download_concurrency)) as executor:
+            futures = [executor.submit(self.__download_segment__, url, file_path, start,
+                                       min(start + segment_size, file_size) - 1, stop, journal, reached,
+                                       progress)
+                       for start in range(0, file_size, segment_size)]
+            for future in as_completed(futures):
+                err = future.result()
+                if err.code != "ok" and response_err.code == "ok":
+                    response_err = err
+                    stop.set()
+        # 文件已按 file_size 预分配，按各分段写到的位置判断是否下载完整
+        if response_err.code == "ok" and any(reached.get(start) != min(start + segment_size, file_size)
+                                             for start in range(0, file_size, segment_size)):
+            return MediaResponse({"RequestID": "", "Error": {"Code": "download failed", "Message": "size mismatch"}})
+        return response_err
+
+    # __download_segment__ 下载一个分段，progress 不为空时下载期间计入正在传输的分段数
+    def __download_segment__(self, url, file_path, start, end, stop, journal=None, reached=None, progress=None):
+        if progress is None:
+            return self.__download_range__(url, file_path, start, end, stop, journal, reached)
+        progress.start()
+        try:
+            return self.__download_range__(url, file_path, start, end, stop, journal, reached, progress)
+        finally:
+            progress.done()
+
+    # __download_range__ 下载 [start, end] 区间写入 file_path 的对应偏移，失败后从已写入的位置继续重试。
+    # reached 不为空时记录分段写到的位置
+    def __download_range__(self, url, file_path, start, end, stop, journal=None, reached=None, progress=None):
+        segment_start = start
+        if journal is not None:
+            start = journal.segments.get(segment_start, start)
+        if reached is not None:
+            reached[segment_start] = min(start, end + 1)
+        try_times = self.media_config.download_retry_times
+        sleep_time = self.media_config.download_retry_interval
+        with open(file_path, "r+b") as f:
+            while start <= end and not stop.is_set():
+                http_header_dict, authorization = self.__get_header__("DownloadFile", "application/octet-stream", 'GET')
+                http_header_dict["Range"] = "bytes={}-{}".format(start, end)
+                f.seek(start)
+                request_start, offset = time.perf_counter(), start
+                try:
+                    response = self.session.get(url=url, headers=http_header_dict, stream=True, timeout=self.timeout)
+                    try:
+                        if response.status_code == 206 and not response.headers.get("Content-Range", "").startswith(
+                                "bytes {}-".format(start)):
+                            response_err = MediaResponse(
+                                {"RequestID": "", "Error": {"Code": "download failed", "Message": "range mismatch"}})
+                        elif response.status_code == 206:
+                            for data in response.iter_content(self.media_config.read_chunk_size):
+                                f.write(data[:end + 1 - start])
+                                if progress is not None:
+                                    progress.add(min(len(data), end + 1 - start))
+                                start += len(data)
+                                if reached is not None:
+                                    reached[segment_start] = min(start, end + 1)
+                                if journal is not None:
+                                    f.flush()
+                                    journal.record(segment_start, min(start, end + 1))
+                            if start > end:
+                                self.metrics.timing("request", "DownloadFile", time.perf_counter() - request_start)
+                                self.metrics.count("bytes_received", "DownloadFile", start - offset)
+                                return MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+                            response_err = MediaResponse(
+                                {"RequestID": "", "Error": {"Code": "download failed", "Message": "incomplete range"}})
+                        else:
+                            response_err = MediaResponse(
+                                {"RequestID": "", "Error": {"Code": str(response.status_code), "Message": "http failed"}})
+                    finally:
+                        response.close()
+                except requests.RequestException as e:
+                    response_err = MediaResponse({"RequestID": "", "Error": {"Code": "download failed", "Message": str(e)}})
+                    self.metrics.count("errors", "DownloadFile")
+                self.metrics.count("bytes_received", "DownloadFile", start - offset)
+                try_times -= 1
+                if try_times <= 0:
+                    logger.error("download range %d-%d failed: %s %s", start, end, response_err.code, response_err.message)
+                    return response_err
+                logger.warning("download range %d-%d failed: %s %s, retry in %.2fs",
+                               start, end, response_err.code, response_err.message, sleep_time)
+                self.metrics.count("retries", "DownloadFile")
+                time.sleep(sleep_time)
+                sleep_time *= 2
+        if start > end:
+            return MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+        return MediaResponse({"RequestID": "", "Error": {"Code": "canceled", "Message": "download canceled"}})
+
+    # iter_download 通过媒体信息返回的url下载文件，返回按块产出文件内容的迭代器，
+    # 内存中只保留一个块，适合直接写入转码等管道
+    def iter_download(self, download_url, chunk_size=None):
+        response, err = self.__get_download__(download_url)
+        if err.code != "ok":
+            return None, err
+        return self.__iter_response__(response, chunk_size or self.media_config.read_chunk_size), err
+
+    # __get_download__ 发起下载请求，返回状态码为 200 的流式响应
+    def __get_download__(self, download_url):
+        http_header_dict, authorization = self.__get_header__("DownloadFile", "application/octet-stream", 'GET')
+        url = "http://{}:{}{}".format(self.media_config.host, self.media_config.port, download_url)
+
+        try:
+            response = self.session.get(url=url, headers=http_header_dict, stream=True, timeout=self.timeout)
+        except requests.RequestException as e:
+            return None, MediaResponse({"RequestID": "", "Error": {"Code": "download failed", "Message": str(e)}})
+        if response.status_code != 200:
+            response.close()
+            return None, MediaResponse(
+                {"RequestID": "", "Error": {"Code": str(response.status_code), "Message": "http failed"}})
+        return response, MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+
+    def __iter_response__(self, response, chunk_size):
+        received = 0
+        try:
+            for data in response.iter_content(chunk_size):
+                received += len(data)
+                yield data
+        finally:
+            response.close()
+            self.metrics.count("bytes_received", "DownloadFile", received)
+
     # download_t_buf 通过媒体信息返回的url下载文件到内存
     def download_t_buf(self, download_url):
-        ts = TiSign(self.media_config.host,
-                    "DownloadFile",
-                    self.media_config.version,
-                    self.media_config.service,
-                    "application/octet-stream",
-                    'GET',
-                    self.media_config.secret_id,
-                    self.media_config.secret_key)
-
-        http_header_dict, authorization = ts.build_header_with_signature()
+        http_header_dict, authorization = self.__get_header__("DownloadFile", "application/octet-stream", 'GET')
         url = "http://{}:{}{}".format(self.media_config.host, self.media_config.port, download_url)
 
-        resp, err = get_http(http_header_dict, url)
+        resp, err = get_http(http_header_dict, url, self.session, self.timeout)
         if err is not None:
             return None, err
         return resp, MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
@@ -288,7 +1007,8 @@ class MediaAsset(object):
         }
 
         http_header_dict, authorization = self.__get_header__("DescribeMedias")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
         if err is not None:
             return None, None, err
 
@@ -296,13 +1016,81 @@ class MediaAsset(object):
         if response_err.code != "ok":
             return None, None, response_err
 
-        media_info = []
-        for v in resp["Response"]["MediaInfoSet"]:
-            media_info.append(MediaInfoSet(v))
+        media_info = [MediaInfoSet(v) for v in resp["Response"]["MediaInfoSet"]]
         return media_info, resp["Response"]["TotalCount"], response_err
 
-    # describe_media_details 获取指定媒体集的详情
+    # iter_medias 按页遍历符合 filter_by 的全部媒体，逐个产出 (media_info, response_err)，内存中最多保留两页。
+    # prefetch 为 True 时在调用方处理当前页的同时预取下一页，请求失败时产出 (None, response_err) 后结束
+    def iter_medias(self, filter_by, page_size=100, prefetch=True):
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page_number = 1
+            media_infos, total, err = self.describe_medias(page_number, page_size, filter_by)
+            while True:
+                if err.code != "ok":
+                    yield None, err
+                    return
+
+                more = len(media_infos) > 0 and page_number * page_size < total
+                next_page = None
+                if more and executor is not None:
+                    next_page = executor.submit(self.describe_medias, page_number + 1, page_size, filter_by)
+                for media_info in media_infos:
+                    yield media_info, err
+                if not more:
+                    return
+
+                page_number += 1
+                if next_page is not None:
+                    media_infos, total, err = next_page.result()
+                else:
+                    media_infos, total, err = self.describe_medias(page_number, page_size, filter_by)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    # describe_media_details 获取指定媒体集的详情，媒体ID较多时拆分为多个请求并发获取。
+    # 开启缓存时只请求缓存中没有的媒体，状态已终结(成功、失败、删除、清理)的媒体会被缓存，
+    # 缓存保存和返回的都是副本，调用方修改返回的对象不影响缓存
     def describe_media_details(self, media_ids):
+        if self.cache is None:
+            return self.__fan_out__(self.__describe_media_details__, media_ids)
+
+        media_map = {}
+        missing_ids = []
+        for media_id in media_ids:
+            media_info = self.cache.get(("media", media_id))
+            if media_info is None:
+                missing_ids.append(media_id)
+            else:
+                media_map[media_id] = copy.deepcopy(media_info)
+
+        response_err = MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+        if missing_ids:
+            media_infos, response_err = self.__fan_out__(self.__describe_media_details__, missing_ids)
+            if response_err.code != "ok":
+                return None, response_err
+            for media_info in media_infos:
+                media_map[media_info.media_id] = media_info
+                if self.check_status_success(media_info.status) or self.check_status_failed(media_info.status):
+                    self.cache.set(("media", media_info.media_id), copy.deepcopy(media_info))
+
+        return [media_map[media_id] for media_id in media_ids if media_id in media_map], response_err
+
+    # cache_stats 返回缓存的命中次数、未命中次数和条目数，未开启缓存时返回 None
+    def cache_stats(self):
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    # __invalidate__ 媒体信息变化后删除缓存
+    def __invalidate__(self, media_ids):
+        if self.cache is None:
+            return
+        for media_id in media_ids:
+            self.cache.delete(("media", media_id))
+
+    def __describe_media_details__(self, media_ids):
         req = {
             "TIBusinessID": self.media_config.business,
             "TIProjectID": self.media_config.project,
@@ -311,7 +1099,8 @@ class MediaAsset(object):
         }
 
         http_header_dict, authorization = self.__get_header__("DescribeMediaDetails")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
         if err is not None:
             return None, err
 
@@ -319,13 +1108,17 @@ class MediaAsset(object):
         if response_err.code != "ok":
             return None, response_err
 
-        media_info = []
-        for v in resp["Response"]["MediaInfoSet"]:
-            media_info.append(MediaInfoSet(v))
+        media_info = [MediaInfoSet(v) for v in resp["Response"]["MediaInfoSet"]]
         return media_info, response_err
 
-    # remove_medias 删除指定媒体集
+    # remove_medias 删除指定媒体集，媒体ID较多时拆分为多个请求并发删除。
+    # 部分批次的请求失败时，这些批次的媒体ID作为删除失败的媒体返回，FailedReason 为请求的错误信息
     def remove_medias(self, media_ids):
+        failed_media, response_err = self.__fan_out__(self.__remove_medias__, media_ids, failed_removal)
+        self.__invalidate__(media_ids)
+        return failed_media, response_err
+
+    def __remove_medias__(self, media_ids):
         req = {
             "TIBusinessID": self.media_config.business,
             "TIProjectID": self.media_config.project,
@@ -334,7 +1127,8 @@ class MediaAsset(object):
         }
 
         http_header_dict, authorization = self.__get_header__("RemoveMedias")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
         if err is not None:
             return None, err
 
@@ -347,8 +1141,13 @@ class MediaAsset(object):
             failed_media.append(FailedMediaInfo(v))
         return failed_media, response_err
 
-    # describe_categories 返回可选媒体类型列表
+    # describe_categories 返回可选媒体类型列表，开启缓存时在 cache_ttl 内复用上次的结果，返回的是缓存的副本
     def describe_categories(self):
+        if self.cache is not None:
+            categories = self.cache.get(("categories",))
+            if categories is not None:
+                return copy.deepcopy(categories)
+
         req = {
             "TIBusinessID": self.media_config.business,
             "TIProjectID": self.media_config.project,
@@ -356,13 +1155,14 @@ class MediaAsset(object):
         }
 
         http_header_dict, authorization = self.__get_header__("DescribeCategories")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
         if err is not None:
-            return None, None, err
+            return None, None, None, err
 
         response_err = MediaResponse(resp["Response"])
         if response_err.code != "ok":
-            return None, None, response_err
+            return None, None, None, response_err
 
         category = []
         lang = []
@@ -373,6 +1173,8 @@ class MediaAsset(object):
             label.append(Label(v))
         for v in resp["Response"]["LangSet"]:
             lang.append(v)
+        if self.cache is not None:
+            self.cache.set(("categories",), copy.deepcopy((category, label, lang, response_err)))
         return category, label, lang, response_err
 
     # modify_media 修改媒体信息
@@ -387,7 +1189,9 @@ class MediaAsset(object):
         }
 
         http_header_dict, authorization = self.__get_header__("ModifyMedia")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
+        self.__invalidate__([media_id])
         if err is None:
             return MediaResponse(resp["Response"])
         return err
@@ -403,26 +1207,31 @@ class MediaAsset(object):
         }
 
         http_header_dict, authorization = self.__get_header__("ModifyExpireTime")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
+        self.__invalidate__([media_id])
         if err is None:
             return MediaResponse(resp["Response"])
         return err
 
-    def apply_upload(self, media_name, media_meta, file_size):
+    # apply_upload 申请上传，文件小于 part_size 时申请 PutObject 直传，part_size 为 None 时使用 BLOCK_SIZE
+    def apply_upload(self, media_name, media_meta, file_size, part_size=None):
         req = {
             "TIBusinessID": self.media_config.business,
             "TIProjectID": self.media_config.project,
             "Name": media_name,
             "MediaMeta": media_meta.to_map(),
-            "Size": str(file_size),
             "Inner": False,
             "Action": "ApplyUpload"
         }
-        block_Size = 32 * 1024 * 1024
-        if file_size < block_Size:
-            req["UsePutObject"] = 1
+        # 大小未知（upload_stream）时不传 Size，使用分片上传
+        if file_size is not None:
+            req["Size"] = str(file_size)
+            if file_size < (part_size or BLOCK_SIZE):
+                req["UsePutObject"] = 1
         http_header_dict, authorization = self.__get_header__("ApplyUpload")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
         if err is not None:
             return None, err
 
@@ -432,118 +1241,193 @@ class MediaAsset(object):
 
         return resp["Response"], response_err
 
-    def do_upload(self, file_path, file_size, media_msg):
-
-        block_Size = 32 * 1024 * 1024
-        number = int(file_size / block_Size) + 1
-
-        coroutine_num = 4
-        if number < coroutine_num:
-            coroutine_num = number
-
-        req_list = []
-        f = open(file_path, "rb")
-
-        if file_size < block_Size:
-            ts = TiSign(self.media_config.host,
-              "PutObject",
-              self.media_config.version,
-              self.media_config.service,
-              "application/octet-stream",
-              'PUT',
-              self.media_config.secret_id,
-              self.media_config.secret_key)
-            filebuf = f.read()
+    # do_upload 上传文件内容，journal 不为空时跳过其中已上传的分片并记录新完成的分片，
+    # progress 为 ProgressTracker 时累加已发送的字节数，
+    # file_hash 为 hashlib 对象时按文件顺序用整个文件的内容更新 file_hash。
+    # part_size 必须与 apply_upload 时相同，文件小于 part_size 时使用 PutObject 直传
+    def do_upload(self, file_path, file_size, media_msg, journal=None, progress=None, file_hash=None,
+                  part_size=None):
+        part_size = part_size or BLOCK_SIZE
+        if file_size < part_size:
+            return self.__put_object__(file_path, file_size, media_msg, progress, file_hash)
+
+        number = (file_size + part_size - 1) // part_size
+        if progress is not None:
+            done = 0 if journal is None else sum(min(part_size, file_size - (i - 1) * part_size)
+                                                 for i in journal.parts)
+            progress.begin(file_size, done)
+        # 每个在途分片按 part_size 计入内存上限
+        window = max(1, min(self.media_config.upload_concurrency,
+                            self.media_config.max_inflight_bytes // part_size, number))
+
+        # 分片 md5 由 PartHasher 在 md5 线程池中提前计算，计算整个文件的 hash 时改为单线程按顺序计算
+        skip = set() if journal is None else set(journal.parts)
+        if file_hash is None:
+            hash_executor = self.__get_executor__("md5", self.media_config.md5_concurrency)
+        else:
+            hash_executor = ThreadPoolExecutor(max_workers=1)
+        hasher = PartHasher(hash_executor, file_path, file_size, self.media_config.read_chunk_size, skip, file_hash,
+                            window, self.metrics, part_size)
+
+        # 滑动窗口：任意分片完成后立即提交下一个分片，出现失败后不再提交新分片
+        part_numbers = iter([i for i in range(1, number + 1) if i not in skip])
+        response_err = MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+        executor = self.__get_executor__("part", self.media_config.upload_concurrency)
+        running = set()
+        try:
+            for part_number in itertools.islice(part_numbers, window):
+                running.add(executor.submit(self.__upload_part__, file_path, file_size, media_msg, part_number,
+                                            journal, progress, hasher, part_size))
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    err = future.result()
+                    if err.code != "ok" and response_err.code == "ok":
+                        response_err = err
+                if response_err.code != "ok":
+                    continue
+                for part_number in itertools.islice(part_numbers, len(done)):
+                    running.add(executor.submit(self.__upload_part__, file_path, file_size, media_msg, part_number,
+                                                journal, progress, hasher, part_size))
+            if response_err.code == "ok" and file_hash is not None:
+                hasher.finish()
+        finally:
+            hasher.cancel()
+            if file_hash is not None:
+                hash_executor.shutdown()
+        return response_err
+
+    # __upload_part__ 上传编号为 part_number 的分片，分片内容流式读取。
+    # hasher 不为空时使用其提前计算好的 md5
+    def __upload_part__(self, file_path, file_size, media_msg, part_number, journal=None, progress=None,
+                        hasher=None, part_size=BLOCK_SIZE):
+        start = time.perf_counter()
+        offset = (part_number - 1) * part_size
+        part = FileSlice(file_path, offset, min(part_size, file_size - offset), self.media_config.read_chunk_size)
+        if progress is not None:
+            progress.start()
+        try:
+            if hasher is not None:
+                md5 = hasher.future(part_number).result()
+                self.metrics.timing("md5_wait", "UploadPart", time.perf_counter() - start)
+            else:
+                md5 = part.md5()
+                self.metrics.timing("md5", "UploadPart", time.perf_counter() - start)
+            # 计算 md5 时的读取不计入进度
+            part.progress = progress
+            query = "useJson=true&Bucket={}&Key={}&uploadId={}&partNumber={}&Content-MD5={}".format(
+                media_msg["Bucket"], media_msg["Key"], media_msg["UploadId"], part_number, md5)
+            url = "http://{}:{}/FileManager/UploadPart?{}".format(self.media_config.host, self.media_config.port,
+                                                                  query)
+            response_err = self.__put_body__("UploadPart", url, part)
+            if response_err.code == "ok":
+                self.metrics.timing("part", "UploadPart", time.perf_counter() - start)
+                if journal is not None:
+                    journal.record_part(part_number, md5)
+            else:
+                # 上传失败的分片从进度中扣除
+                part.seek(0)
+            return response_err
+        finally:
+            if progress is not None:
+                progress.done()
+            part.close()
+
+    # __put_object__ 小文件通过 PutObject 一次上传，文件内容流式发送
+    def __put_object__(self, file_path, file_size, media_msg, progress=None, file_hash=None):
+        body = FileSlice(file_path, 0, file_size, self.media_config.read_chunk_size)
+        if progress is not None:
+            progress.begin(file_size)
+            progress.start()
+        try:
+            start = time.perf_counter()
+            md5 = body.md5(file_hash)
+            self.metrics.timing("md5", "PutObject", time.perf_counter() - start)
+            body.progress = progress
             query = "useJson=true&Bucket={}&Key={}&Content-MD5={}".format(
-                        media_msg["Bucket"], media_msg["Key"], get_md5(filebuf))
+                        media_msg["Bucket"], media_msg["Key"], md5)
             url = "http://{}:{}/FileManager/PutObject?{}".format(self.media_config.host, self.media_config.port,
-                                                                          query)
-            http_header_dict, authorization = ts.build_header_with_signature()
-            
-            try_times = 5
-            sleep_time = 0.05
-            while try_times > 0:
-                response_err = MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": ""}})
-                resp = requests.put(url=url, headers=http_header_dict, data=filebuf)
+                                                                      query)
+            response_err = self.__put_body__("PutObject", url, body)
+            if response_err.code != "ok":
+                body.seek(0)
+            return response_err
+        finally:
+            if progress is not None:
+                progress.done()
+            body.close()
+
+    # __put_body__ PUT 上传 body，失败后按带随机抖动的指数退避重试，每次重试重新签名并回到 body 开头。
+    # 开启自适应并发时每次尝试前等待并发名额，退避等待期间不占用名额
+    def __put_body__(self, action, url, body):
+        try_times = self.media_config.upload_retry_times
+        sleep_time = self.media_config.upload_retry_interval
+        while True:
+            http_header_dict, authorization = self.__get_header__(action, "application/octet-stream", 'PUT')
+            body.seek(0)
+            self.__acquire_part__(action)
+            congested, size, elapsed = True, 0, 0
+            start = time.perf_counter()
+            try:
+                resp = self.session.put(url=url, headers=http_header_dict, data=body, timeout=self.timeout)
+            except requests.RequestException as e:
+                response_err = MediaResponse({"RequestID": "", "Error": {"Code": "http put failed", "Message": str(e)}})
+                self.metrics.count("errors", action)
+            else:
+                elapsed = time.perf_counter() - start
+                self.metrics.timing("request", action, elapsed)
+                self.metrics.count("bytes_sent", action, len(body))
                 if resp.status_code == 200:
-                    dic = json.loads(resp.text)
+                    dic = self.codec.loads(resp.content)
                     response_err = MediaResponse(dic["Response"])
+                    congested = is_congestion(code=response_err.code)
                     if response_err.code == "ok":
+                        self.__observe_throughput__(len(body), elapsed)
+                        size = len(body)
                         return response_err
-                    else:
-                        response_err = MediaResponse({"RequestID": "", "Error": {"Code": response_err.code, "Message": resp.text}})
+                    response_err = MediaResponse({"RequestID": "", "Error": {"Code": response_err.code, "Message": resp.text}})
                 else:
-                    response_err = MediaResponse({"RequestID": "", "Error": {"Code": "http put failed", "Message": resp.status}})
-                try_times -= 1
-                time.sleep(sleep_time)
-                sleep_time *= 2
-                
-            return response_err
-        else:
-            ts = TiSign(self.media_config.host,
-              "UploadPart",
-              self.media_config.version,
-              self.media_config.service,
-              "application/octet-stream",
-              'PUT',
-              self.media_config.secret_id,
-              self.media_config.secret_key)
-            for i in range(number):
-                http_header_dict, authorization = ts.build_header_with_signature()
-                if i + 1 == number:
-                    data = f.read(file_size % block_Size)
-                    query = "useJson=true&Bucket={}&Key={}&uploadId={}&partNumber={}&Content-MD5={}".format(
-                        media_msg["Bucket"], media_msg["Key"], media_msg["UploadId"], i + 1, get_md5(data))
-                    url = "http://{}:{}/FileManager/UploadPart?{}".format(self.media_config.host, self.media_config.port,
-                                                                          query)
-                    req_list.append(grequests.put(url=url, headers=http_header_dict, data=data))
-                elif (i + 1) % coroutine_num == 0:
-                    data = f.read(block_Size)
-                    query = "useJson=true&Bucket={}&Key={}&uploadId={}&partNumber={}&Content-MD5={}".format(
-                        media_msg["Bucket"], media_msg["Key"], media_msg["UploadId"], i + 1, get_md5(data))
-                    url = "http://{}:{}/FileManager/UploadPart?{}".format(self.media_config.host, self.media_config.port,
-                                                                          query)
-                    req_list.append(grequests.put(url=url, headers=http_header_dict, data=data))
-                else:
-                    data = f.read(block_Size)
-                    query = "useJson=true&Bucket={}&Key={}&uploadId={}&partNumber={}&Content-MD5={}".format(
-                        media_msg["Bucket"], media_msg["Key"], media_msg["UploadId"], i + 1, get_md5(data))
-                    url = "http://{}:{}/FileManager/UploadPart?{}".format(self.media_config.host, self.media_config.port,
-                                                                          query)
-
-                    req_list.append(grequests.put(url=url, headers=http_header_dict, data=data))
-                    continue
-                try_times = 5
-                sleep_time = 0.05
-                while try_times > 0:
-                    res_list = grequests.map(req_list)
-                    new_req_list = []
-                    new_res_list = []
-                    for i in range(len(req_list)):
-                        if res_list[i].status_code != 200:
-                          new_req_list.append(req_list[i])
-                          new_res_list.append(res_list[i])
-                        else:
-                          dic = json.loads(res_list[i].text)
-                          response_err = MediaResponse(dic["Response"])
-                          if response_err.code != "ok":
-                            new_req_list.append(req_list[i])
-                            new_res_list.append(res_list[i])
-                    req_list = new_req_list
-                    res_list = new_res_list
-                    if len(req_list) == 0:
-                      break
-                    try_times -= 1
-                    time.sleep(sleep_time)
-                    sleep_time *= 2
-
-                if len(req_list) != 0:
-                  if res_list[0].status_code != 200:
-                    dic = json.loads(res_list[0].text)
-                    return MediaResponse(dic["Response"])
-                  else:
-                    return MediaResponse({"RequestID": "", "Error": {"Code": "http put failed", "Message": res_list[0].status}})
-        return MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "http failed"}})
+                    response_err = MediaResponse({"RequestID": "", "Error": {"Code": str(resp.status_code), "Message": "http put failed"}})
+                    congested = is_congestion(resp.status_code)
+            finally:
+                self.__release_part__(congested, size, elapsed)
+            try_times -= 1
+            if try_times <= 0:
+                logger.error("%s failed: %s %s", action, response_err.code, response_err.message)
+                return response_err
+            wait_time = sleep_time * random.uniform(0.5, 1.5)
+            logger.warning("%s failed: %s %s, retry in %.2fs", action, response_err.code, response_err.message, wait_time)
+            self.metrics.count("retries", action)
+            time.sleep(wait_time)
+            sleep_time *= 2
+
+    # __acquire_part__ 开启自适应并发时等待上传名额
+    def __acquire_part__(self, action):
+        if self.part_limiter is None:
+            return
+        start = time.perf_counter()
+        self.part_limiter.acquire()
+        self.metrics.timing("limit_wait", action, time.perf_counter() - start)
+
+    # __release_part__ 一次上传尝试结束后释放名额，body 不小于 1MB 时以每 MB 的秒数作为延迟信号
+    def __release_part__(self, congested, size=0, seconds=0):
+        if self.part_limiter is None:
+            return
+        self.part_limiter.release(congested, seconds * MB / size if size >= MB else None)
+
+    # __observe_throughput__ 用上传成功的 body 更新单个连接的上传速率，小于 1MB 的 body 主要是延迟，不计入
+    def __observe_throughput__(self, size, seconds):
+        if size < MB or seconds <= 0:
+            return
+        rate = size / seconds
+        throughput = self.throughput
+        self.throughput = rate if throughput is None else throughput * 0.7 + rate * 0.3
+
+    # __part_size__ 按 part_size_policy 选择 file_size 大小的文件的分片大小
+    def __part_size__(self, file_size):
+        concurrency = max(1, self.media_config.upload_concurrency)
+        max_part_size = max(MB, self.media_config.max_inflight_bytes // concurrency)
+        return self.part_size_policy.part_size_for(file_size, concurrency, max_part_size, self.throughput)
 
     def commit_upload(self, media_msg):
         req = {
@@ -557,7 +1441,8 @@ class MediaAsset(object):
         }
 
         http_header_dict, authorization = self.__get_header__("CommitUpload")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
         if err is None:
             return MediaResponse(resp["Response"])
         return err
@@ -571,7 +1456,8 @@ class MediaAsset(object):
         }
 
         http_header_dict, authorization = self.__get_header__("CreateMedias")
-        resp, err = post_http(http_header_dict, self.url, req)
+        resp, err = post_http(http_header_dict, self.url, req, self.session, self.timeout, self.codec, self.metrics,
+                               self.rate_limiter)
         if err is None:
             media_infos = []
             for v in resp["Response"]["UploadMediaInfoSet"]:
@@ -580,25 +1466,153 @@ class MediaAsset(object):
         return None, err
     
     # upload_file 通过媒体信息返回的url下载文件到本地
-    def upload_file(self, file_path, media_name, media_meta):
+    # progress 为进度回调，上传过程中每隔 progress_interval 秒以 Progress 为参数调用一次，结束时再调用一次。
+    # file_hash 为 hashlib 对象（如 hashlib.md5()）时，上传的同时用整个文件的内容更新 file_hash，
+    # 上传成功后 file_hash.hexdigest() 即为文件的 md5，可用于 UploadMedia 的 md5
+    def upload_file(self, file_path, media_name, media_meta, progress=None, file_hash=None):
 
         if not os.path.exists(file_path):
             return None, MediaResponse(
                 {"RequestID": "", "Error": {"Code": "failed", "Message": "file path is failed."}})
 
         file_size = os.path.getsize(file_path)
+        start = time.perf_counter()
+
+        # 开启去重时先计算整个文件的 md5，索引中的相同文件仍是上传完成状态时直接返回该媒体，不再上传。
+        # file_hash 在这里已经更新过，上传时不再更新
+        file_md5 = None
+        if self.dedup is not None:
+            file_md5 = self.dedup.file_md5(file_path, self.media_config.read_chunk_size, file_hash)
+            self.metrics.timing("md5", "UploadFile", time.perf_counter() - start)
+            file_hash = None
+            media_info, err = self.__find_duplicate__(file_md5, file_size)
+            if media_info is not None:
+                return media_info, err
+
+        # 开启断点续传时，从断点记录恢复上次的上传，沿用记录中的分片大小，跳过 apply_upload 和已上传的分片。
+        # 名称或元信息与记录不同时视为新的上传
+        journal = None
+        media_msg = None
+        part_size = None
+        mtime = os.path.getmtime(file_path)
+        if self.media_config.checkpoint_dir is not None:
+            journal = UploadJournal.open(self.media_config.checkpoint_dir, file_path)
+            media_msg = journal.load(file_size, mtime, None, media_name, media_meta.to_map())
+            part_size = journal.part_size
+        resumed = media_msg is not None
+
+        tracker = None
+        if progress is not None:
+            tracker = ProgressTracker(progress, file_size, self.media_config.progress_interval)
+        while True:
+            if media_msg is None:
+                part_size = self.__part_size__(file_size)
+                media_msg, err = self.apply_upload(media_name, media_meta, file_size, part_size)
+                if err.code != "ok":
+                    break
+                if file_size < part_size:
+                    # PutObject 直传不需要断点记录
+                    journal = None
+                if journal is not None:
+                    journal.start(media_msg, file_size, mtime, part_size, media_name, media_meta.to_map())
+
+            err = self.do_upload(file_path, file_size, media_msg, journal, tracker, file_hash, part_size)
+            if err.code == "ok":
+                err = self.commit_upload(media_msg)
+            if err.code == "ok" or not resumed or self.__transient_error__(err):
+                break
+            # 网关拒绝了断点记录中的上传（如 UploadId 已过期或被取消），删除记录后重新申请上传。
+            # file_hash 已经用部分内容更新过，无法重新计算，只删除记录
+            journal.remove()
+            if file_hash is not None:
+                break
+            logger.warning("resumed upload of %s failed: %s %s, start over", file_path, err.code, err.message)
+            media_msg = None
+            resumed = False
+        if tracker is not None:
+            tracker.finish()
+        if err.code != "ok":
+            return None, err
+        if journal is not None:
+            journal.remove()
+        if file_md5 is not None:
+            self.dedup.add(file_md5, file_size, media_msg["MediaID"])
+        self.metrics.timing("upload", "UploadFile", time.perf_counter() - start)
 
-        media_msg, err = self.apply_upload(media_name, media_meta, file_size)
+        media_info, err = self.describe_media_details([media_msg["MediaID"]])
         if err.code != "ok":
             return None, err
 
-        err = self.do_upload(file_path, file_size, media_msg)
+        return media_info[0], err
+
+    # __find_duplicate__ 在去重索引中查找 md5 + size 相同的媒体，不经过缓存查询媒体的最新状态，
+    # 上传完成时返回 (media_info, response_err)，否则返回 (None, None)。
+    # 媒体已失败、删除、清理或不存在时删除索引记录；查询失败或媒体还在处理中时保留记录，重新上传
+    def __find_duplicate__(self, md5, size):
+        media_id = self.dedup.lookup(md5, size)
+        if media_id is None:
+            return None, None
+        media_infos, err = self.__describe_media_details__([media_id])
+        if err.code != "ok":
+            logger.warning("describe dedup media %s failed: %s %s", media_id, err.code, err.message)
+            return None, None
+        media_info = media_infos[0] if media_infos else None
+        if media_info is None or self.check_status_failed(media_info.status):
+            self.dedup.remove(md5, size, media_id)
+            return None, None
+        if not self.check_status_success(media_info.status):
+            return None, None
+        self.metrics.count("dedup_hits", "UploadFile")
+        return media_info, err
+
+    # __transient_error__ 判断错误是否由网络异常、http 429 或 5xx、限流错误码导致，这类错误保留断点记录，下次继续上传
+    @staticmethod
+    def __transient_error__(err):
+        if err.code == "http put failed":
+            return True
+        return is_congestion(int(err.code) if err.code.isdigit() else 200, err.code)
+
+    # upload_stream 上传可读对象（实现 read 或 readinto，如转码进程的输出、对象存储的读取流）或 bytes/memoryview
+    # 的内容，不需要先写入本地文件。size 为 None 表示大小未知，读完第一个分片前流就结束时使用 PutObject 直传，否则分片上传。
+    # 按顺序读取 stream，每读出一个分片就提交上传，同时在内存中的分片不超过 max_inflight_bytes。
+    # progress、file_hash 与 upload_file 相同，大小未知时 Progress.total 为 None
+    def upload_stream(self, stream, media_name, media_meta, size=None, progress=None, file_hash=None):
+        start = time.perf_counter()
+        if isinstance(stream, (bytes, bytearray, memoryview)):
+            size = memoryview(stream).nbytes
+        part_size = self.__part_size__(size)
+        parts = iter_stream_parts(stream, part_size, file_hash)
+        try:
+            first = next(parts)
+        except (OSError, ValueError) as e:
+            return None, MediaResponse({"RequestID": "", "Error": {"Code": "read failed", "Message": str(e)}})
+        # 流在第一个分片内结束，或者传入的 size 小于分片大小时使用 PutObject，第一个分片必须正好是整个流
+        if len(first) < part_size or (size is not None and size < part_size):
+            size_err = self.__check_stream_size__(size, len(first))
+            if size_err is not None:
+                return None, size_err
+            size = len(first)
+
+        media_msg, err = self.apply_upload(media_name, media_meta, size, part_size)
+        if err.code != "ok":
+            return None, err
+
+        tracker = None
+        if progress is not None:
+            tracker = ProgressTracker(progress, size, self.media_config.progress_interval)
+        if size is not None and size < part_size:
+            err = self.__upload_buffer__(media_msg, None, first, tracker)
+        else:
+            err = self.__upload_parts__(media_msg, itertools.chain([first], parts), size, part_size, tracker)
+        if tracker is not None:
+            tracker.finish()
         if err.code != "ok":
             return None, err
 
         err = self.commit_upload(media_msg)
         if err.code != "ok":
             return None, err
+        self.metrics.timing("upload", "UploadStream", time.perf_counter() - start)
 
         media_info, err = self.describe_media_details([media_msg["MediaID"]])
         if err.code != "ok":
@@ -606,6 +1620,180 @@ class MediaAsset(object):
 
         return media_info[0], err
 
+    # __upload_parts__ 滑动窗口上传 parts 产出的分片，读取下一个分片与已提交分片的上传同时进行
+    def __upload_parts__(self, media_msg, parts, size, part_size, progress=None):
+        window = max(1, min(self.media_config.upload_concurrency, self.media_config.max_inflight_bytes // part_size))
+        response_err = MediaResponse({"RequestID": "", "Error": {"Code": "ok", "Message": "success"}})
+        executor = self.__get_executor__("part", self.media_config.upload_concurrency)
+        numbered = enumerate(parts, 1)
+        running = set()
+        total = 0
+        try:
+            while True:
+                for part_number, data in itertools.islice(numbered, window - len(running)):
+                    total += len(data)
+                    if size is not None and total > size:
+                        # 流比 size 长时立即停止，不再上传多出的数据
+                        wait(running)
+                        return self.__check_stream_size__(size, total)
+                    running.add(executor.submit(self.__upload_buffer__, media_msg, part_number, data, progress))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    err = future.result()
+                    if err.code != "ok" and response_err.code == "ok":
+                        response_err = err
+                if response_err.code != "ok":
+                    # 出现失败后不再读取新的分片，等待已提交的分片结束
+                    wait(running)
+                    return response_err
+        except (OSError, ValueError) as e:
+            wait(running)
+            return MediaResponse({"RequestID": "", "Error": {"Code": "read failed", "Message": str(e)}})
+        return self.__check_stream_size__(size, total) or response_err
+
+    # __check_stream_size__ 传入了 size 时检查实际读到的字节数，不一致时返回错误
+    @staticmethod
+    def __check_stream_size__(size, total):
+        if size is None or size == total:
+            return None
+        return MediaResponse({"RequestID": "", "Error": {
+            "Code": "size mismatch", "Message": "read {} bytes from stream, expect {}".format(total, size)}})
+
+    # __upload_buffer__ 上传内存中的分片，part_number 为 None 时通过 PutObject 上传
+    def __upload_buffer__(self, media_msg, part_number, data, progress=None):
+        action = "PutObject" if part_number is None else "UploadPart"
+        start = time.perf_counter()
+        body = BytesSlice(data, self.media_config.read_chunk_size)
+        if progress is not None:
+            progress.start()
+        try:
+            md5 = body.md5()
+            self.metrics.timing("md5", action, time.perf_counter() - start)
+            body.progress = progress
+            query = "useJson=true&Bucket={}&Key={}".format(media_msg["Bucket"], media_msg["Key"])
+            if part_number is not None:
+                query += "&uploadId={}&partNumber={}".format(media_msg["UploadId"], part_number)
+            url = "http://{}:{}/FileManager/{}?{}&Content-MD5={}".format(
+                self.media_config.host, self.media_config.port, action, query, md5)
+            response_err = self.__put_body__(action, url, body)
+            if response_err.code != "ok":
+                body.seek(0)
+            elif part_number is not None:
+                self.metrics.timing("part", action, time.perf_counter() - start)
+            return response_err
+        finally:
+            if progress is not None:
+                progress.done()
+
+    # upload_files 批量上传本地文件，items 为 (file_path, media_name, media_meta) 列表。
+    # 同时上传 upload_files_concurrency 个文件，大文件的分片共用分片线程池。
+    # 返回按完成顺序产出 (items 中的下标, media_info, response_err) 的迭代器，
+    # 单个文件上传时抛出的异常（如重试后仍然失败的网络异常）作为该文件的错误返回，不影响其它文件
+    def upload_files(self, items):
+        executor = ThreadPoolExecutor(max_workers=self.media_config.upload_files_concurrency)
+        futures = {}
+        try:
+            for i, (file_path, media_name, media_meta) in enumerate(items):
+                futures[executor.submit(self.upload_file, file_path, media_name, media_meta)] = i
+            for future in as_completed(futures):
+                try:
+                    media_info, err = future.result()
+                except Exception as e:
+                    logger.warning("upload_files item %d failed: %s", futures[future], e)
+                    media_info, err = None, MediaResponse(
+                        {"RequestID": "", "Error": {"Code": "upload failed", "Message": str(e)}})
+                yield futures[future], media_info, err
+        finally:
+            # 调用方提前结束遍历时取消还未开始的文件
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+
+    # wait_for_medias 在后台线程中等待 media_ids 中的媒体进入终态(成功、失败、删除、清理)，
+    # 返回 {media_id: Future}，Future 的结果为 (media_info, response_err)。
+    # 每轮只发送一次批量 describe_media_details，已进入终态的媒体不再查询；
+    # 一轮中没有媒体进入终态时查询间隔翻倍(不超过 max_interval)并加入随机抖动。
+    # callback 不为空时在每个媒体完成时调用 callback(media_id, media_info, response_err)。
+    # 到达 timeout 时再查询一次，仍未完成的媒体以 "timeout" 错误结束。callback 抛出的异常只记录日志；
+    # 查询时出现其它异常时，所有未完成的 Future 以该异常结束
+    def wait_for_medias(self, media_ids, timeout=None, callback=None, interval=1, max_interval=30):
+        futures = {}
+        for media_id in media_ids:
+            futures[media_id] = Future()
+
+        thread = threading.Thread(target=self.__poll_medias__,
+                                  args=(futures, timeout, callback, interval, max_interval))
+        thread.daemon = True
+        thread.start()
+        return futures
+
+    def __poll_medias__(self, futures, timeout, callback, interval, max_interval):
+        try:
+            self.__poll_loop__(futures, timeout, callback, interval, max_interval)
+        except Exception as e:
+            logger.exception("wait_for_medias failed")
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    def __poll_loop__(self, futures, timeout, callback, interval, max_interval):
+        def finish(media_id, media_info, response_err):
+            if not futures[media_id].done():
+                futures[media_id].set_result((media_info, response_err))
+            if callback is not None:
+                try:
+                    callback(media_id, media_info, response_err)
+                except Exception:
+                    logger.exception("wait_for_medias callback failed for media %s", media_id)
+
+        deadline = None if timeout is None else time.time() + timeout
+        pending = list(futures.keys())
+        last_info = {}
+        sleep_time = interval
+        last_poll = False
+        while pending:
+            done = []
+            try:
+                media_infos, response_err = self.__fan_out__(self.__describe_media_details__, pending)
+            except requests.RequestException as e:
+                media_infos, response_err = None, MediaResponse(
+                    {"RequestID": "", "Error": {"Code": "http failed", "Message": str(e)}})
+            if response_err.code == "ok":
+                found = {}
+                for media_info in media_infos:
+                    found[media_info.media_id] = media_info
+                for media_id in pending:
+                    media_info = found.get(media_id)
+                    if media_info is None:
+                        done.append(media_id)
+                        finish(media_id, None, MediaResponse(
+                            {"RequestID": "", "Error": {"Code": "not found", "Message": "media not found"}}))
+                    elif self.check_status_success(media_info.status) or self.check_status_failed(media_info.status):
+                        done.append(media_id)
+                        finish(media_id, media_info, response_err)
+                    else:
+                        last_info[media_id] = media_info
+                pending = [media_id for media_id in pending if media_id not in done]
+            if not pending or last_poll:
+                break
+
+            if done:
+                sleep_time = interval
+            else:
+                sleep_time = min(sleep_time * 2, max_interval)
+            wait_time = sleep_time * random.uniform(0.8, 1.2)
+            if deadline is not None and time.time() + wait_time >= deadline:
+                # 等到截止时间再查询最后一次
+                wait_time = max(0, deadline - time.time())
+                last_poll = True
+            time.sleep(wait_time)
+
+        for media_id in pending:
+            finish(media_id, last_info.get(media_id), MediaResponse(
+                {"RequestID": "", "Error": {"Code": "timeout", "Message": "wait for media timeout"}}))
+
     # check_status_failed 检查媒体状态是否失败
     @staticmethod 
     def check_status_failed(state):
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import deque
+
+
+class MetricsCollector(object):
+    # MetricsCollector 指标回调接口，默认实现不做任何记录。
+    # 对接 Prometheus 等系统时继承此类并实现 timing/count，两个方法会在上传、下载线程中并发调用。
+    # SDK 上报的指标（action 为接口名，如 DescribeMedias、UploadPart、PutObject、DownloadFile）：
+    #   timing: request 单次 http 请求耗时, sign 签名耗时, md5 计算分片 md5 耗时（包含读盘，
+    #           action 为 UploadFile 时为开启去重后计算整个文件 md5 的耗时）,
+    #           md5_wait 上传分片前等待提前计算的 md5 的耗时, limit_wait 等待令牌桶/自适应并发名额的耗时,
+    #           part 单个分片从读取到上传成功的总耗时（包含重试）, upload/download 整个文件上传/下载耗时
+    #           （upload_stream 的 action 为 UploadStream）
+    #   count:  bytes_sent 发送字节数, bytes_received 接收字节数, retries 重试次数, errors 请求异常次数,
+    #           dedup_hits upload_file 命中去重索引、没有上传的文件数
+
+    # timing 记录一次耗时，seconds 为秒
+    def timing(self, name, action, seconds):
+        pass
+
+    # count 累加计数
+    def count(self, name, action, value=1):
+        pass
+
+
+class MemoryMetrics(MetricsCollector):
+    # MemoryMetrics 内存中的指标收集器，每个 (name, action) 保留最近 max_samples 个耗时样本，
+    # summary() 返回耗时分位数和计数
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self._timings = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def timing(self, name, action, seconds):
+        key = (name, action)
+        with self._lock:
+            samples = self._timings.get(key)
+            if samples is None:
+                samples = self._timings[key] = [0, 0.0, deque(maxlen=self.max_samples)]
+            samples[0] += 1
+            samples[1] += seconds
+            samples[2].append(seconds)
+
+    def count(self, name, action, value=1):
+        key = (name, action)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + value
+
+    # summary 返回 {name: {action: 统计}}，耗时统计包含 count/mean/p50/p90/p99/max（秒），计数直接返回累加值
+    def summary(self):
+        with self._lock:
+            timings = [(key, total_count, total, sorted(samples))
+                       for key, (total_count, total, samples) in self._timings.items()]
+            counts = dict(self._counts)
+
+        result = {}
+        for (name, action), total_count, total, samples in timings:
+            result.setdefault(name, {})[action] = {
+                "count": total_count,
+                "mean": total / total_count,
+                "p50": percentile(samples, 50),
+                "p90": percentile(samples, 90),
+                "p99": percentile(samples, 99),
+                "max": samples[-1],
+            }
+        for (name, action), value in counts.items():
+            result.setdefault(name, {})[action] = value
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._timings = {}
+            self._counts = {}
+
+
+# percentile 返回已排序样本的第 p 百分位数（最近秩法）
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    rank = max(1, -(-len(samples) * p // 100))
+    return samples[int(rank) - 1]
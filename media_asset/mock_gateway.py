@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+# 本地模拟的媒体管理系统网关，只依赖标准库，用于在没有真实网关时测试和压测 SDK。
+#
+#   python -m media_asset.mock_gateway [--port 8080] [--latency 0.01] [--bandwidth 100MB] [--error-rate 0.01]
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+from .media_asset import MediaConfig, MediaState, MediaType, MediaTag, MediaSecondTag, MediaLang
+
+# 读写 body 时每块的字节数，带宽限制按块计算
+IO_CHUNK_SIZE = 256 * 1024
+
+
+class MockGateway(object):
+    # MockGateway 在后台线程中运行的模拟网关，实现 MediaAsset 使用的所有接口：
+    #   POST /gateway: ApplyUpload, CommitUpload, CreateMedias, DescribeMedias, DescribeMediaDetails,
+    #                  RemoveMedias, DescribeCategories, ModifyMedia, ModifyExpireTime
+    #   PUT /FileManager/UploadPart, /FileManager/PutObject，校验 Content-MD5
+    #   GET /FileManager/GetObject，支持 Range
+    # latency 为每个请求增加的秒数，bandwidth 为每个连接的带宽（字节/秒，None 表示不限），
+    # error_rate 为 UploadPart/PutObject/GetObject 返回 500 的概率，用于测试重试。
+    # 上传的文件保存在 data_dir 中（默认为临时目录，stop 时删除），不占用内存。
+    # CreateMedias 创建的媒体在 process_time 秒后变为上传完成
+    def __init__(self, host="127.0.0.1", port=0, latency=0, bandwidth=None, error_rate=0, data_dir=None,
+                 process_time=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.process_time = process_time
+        self._own_data_dir = data_dir is None
+        self.data_dir = data_dir if data_dir is not None else tempfile.mkdtemp(prefix="mock-gateway-")
+        self.medias = {}
+        self.uploads = {}
+        self.calls = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # start 在后台线程中启动网关，port 为 0 时使用随机端口
+    def start(self):
+        for name in ("objects", "parts"):
+            path = os.path.join(self.data_dir, name)
+            if not os.path.exists(path):
+                os.makedirs(path)
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.gateway = self
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._own_data_dir:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    # config 返回指向此网关的 MediaConfig，kwargs 为 MediaConfig 的可选参数
+    def config(self, **kwargs):
+        return MediaConfig(self.host, self.port, "mock-secret-id", "mock-secret-key", 1, 1, "mock-service",
+                           "2021-02-26", **kwargs)
+
+    # add_medias 直接创建 count 个已上传完成的空媒体，用于测试列表接口，返回媒体ID列表
+    def add_medias(self, count, name="mock"):
+        media_ids = []
+        with self._lock:
+            for i in range(count):
+                media = self.__new_media__("{}-{}".format(name, i), {}, MediaState.COMPLETED.value)
+                media_ids.append(media["MediaID"])
+        return media_ids
+
+    # call_count 返回 action 被调用的次数
+    def call_count(self, action):
+        with self._lock:
+            return self.calls.get(action, 0)
+
+    def __record__(self, action):
+        with self._lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+
+    # __new_media__ 创建媒体记录，调用时需持有 _lock
+    def __new_media__(self, name, media_meta, status, size=0):
+        media_id = self._next_id
+        self._next_id += 1
+        media = {
+            "MediaID": media_id,
+            "Name": name,
+            "Duration": 0,
+            "Size": size,
+            "Width": 0,
+            "Height": 0,
+            "FPS": 0,
+            "BitRate": 0,
+            "Format": "",
+            "DownLoadURL": "",
+            "FailedReason": "",
+            "Status": status,
+            "MediaType": media_meta.get("MediaType", ""),
+            "MediaTag": media_meta.get("MediaTag", ""),
+            "MediaSecondTag": media_meta.get("MediaSecondTag", ""),
+            "MediaLang": media_meta.get("MediaLang", ""),
+            "ReadyTime": 0
+        }
+        self.medias[media_id] = media
+        return media
+
+    # __media_info__ 返回对外的媒体信息，调用时需持有 _lock
+    def __media_info__(self, media):
+        if media["Status"] == MediaState.DOWNLOADING.value and media["ReadyTime"] <= time.time():
+            media["Status"] = MediaState.COMPLETED.value
+        return {k: v for k, v in media.items() if k != "ReadyTime"}
+
+    def object_path(self, key):
+        return os.path.join(self.data_dir, "objects", key)
+
+    def part_path(self, key, part_number):
+        return os.path.join(self.data_dir, "parts", "{}.{}".format(key, part_number))
+
+    # handle_action 处理 /gateway 的请求，返回 Response 的内容
+    def handle_action(self, action, req):
+        handler = getattr(self, "action_" + action, None)
+        if handler is None:
+            return {"Error": {"Code": "InvalidAction", "Message": "unknown action " + str(action)}}
+        with self._lock:
+            return handler(req)
+
+    def action_ApplyUpload(self, req):
+        media = self.__new_media__(req["Name"], req.get("MediaMeta", {}), MediaState.UPLOADING.value,
+                                   int(req.get("Size") or 0))
+        key = "media-{}".format(media["MediaID"])
+        self.uploads[key] = media["MediaID"]
+        return {"MediaID": media["MediaID"], "Bucket": "mock", "Key": key,
+                "UploadId": hashlib.md5(key.encode("utf-8")).hexdigest()}
+
+    def action_CommitUpload(self, req):
+        key = req["Key"]
+        media = self.medias.get(req["MediaID"])
+        if media is None or self.uploads.get(key) != req["MediaID"]:
+            return {"Error": {"Code": "InvalidParameter", "Message": "upload not found"}}
+        part_number = 1
+        if os.path.exists(self.part_path(key, part_number)):
+            with open(self.object_path(key), "wb") as f:
+                while os.path.exists(self.part_path(key, part_number)):
+                    with open(self.part_path(key, part_number), "rb") as part:
+                        shutil.copyfileobj(part, f, IO_CHUNK_SIZE)
+                    os.remove(self.part_path(key, part_number))
+                    part_number += 1
+        if not os.path.exists(self.object_path(key)):
+            return {"Error": {"Code": "InvalidParameter", "Message": "no data uploaded"}}
+        del self.uploads[key]
+        media["Size"] = os.path.getsize(self.object_path(key))
+        media["Status"] = MediaState.COMPLETED.value
+        media["DownLoadURL"] = "/FileManager/GetObject?Bucket=mock&Key=" + key
+        return {}
+
+    def action_CreateMedias(self, req):
+        infos = []
+        for upload_media in req["UploadMediaSet"]:
+            media = self.__new_media__(upload_media["Name"], upload_media.get("MediaMeta", {}),
+                                       MediaState.DOWNLOADING.value)
+            media["ReadyTime"] = time.time() + self.process_time
+            infos.append({"MediaID": media["MediaID"], "FailedReason": ""})
+        return {"UploadMediaInfoSet": infos}
+
+    def action_DescribeMedias(self, req):
+        medias = [self.__media_info__(m) for m in self.medias.values()
+                  if m["Status"] != MediaState.DELETED.value]
+        page_number, page_size = req["PageNumber"], req["PageSize"]
+        return {"MediaInfoSet": medias[(page_number - 1) * page_size:page_number * page_size],
+                "TotalCount": len(medias)}
+
+    def action_DescribeMediaDetails(self, req):
+        return {"MediaInfoSet": [self.__media_info__(self.medias[i]) for i in req["MediaIDSet"] if i in self.medias]}
+
+    def action_RemoveMedias(self, req):
+        failed = []
+        for media_id in req["MediaIDSet"]:
+            if media_id in self.medias:
+                self.medias[media_id]["Status"] = MediaState.DELETED.value
+            else:
+                failed.append({"MediaID": media_id, "FailedReason": "media not found"})
+        return {"FailedMediaSet": failed}
+
+    def action_DescribeCategories(self, req):
+        return {
+            "CategorySet": [{"Type": t.value, "TagSet": [tag.value for tag in MediaTag]} for t in MediaType],
+            "LabelSet": [{"Type": t.value, "Tag": tag.value, "SecondTagSet": [s.value for s in MediaSecondTag]}
+                         for t in MediaType for tag in MediaTag],
+            "LangSet": [lang.value for lang in MediaLang]
+        }
+
+    def action_ModifyMedia(self, req):
+        media = self.medias.get(req["MediaID"])
+        if media is None:
+            return {"Error": {"Code": "InvalidParameter", "Message": "media not found"}}
+        media["MediaTag"] = req["MediaTag"]
+        media["MediaSecondTag"] = req["MediaSecondTag"]
+        return {}
+
+    def action_ModifyExpireTime(self, req):
+        if req["MediaID"] not in self.medias:
+            return {"Error": {"Code": "InvalidParameter", "Message": "media not found"}}
+        return {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和 body 分两次写入，不关闭 Nagle 算法时每个请求会多出几十毫秒的延迟
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def gateway(self):
+        return self.server.gateway
+
+    def __throttle__(self, size):
+        if self.gateway.bandwidth:
+            time.sleep(size / float(self.gateway.bandwidth))
+
+    # __read_body__ 按块读取请求 body 并交给 consume
+    def __read_body__(self, consume):
+        remain = int(self.headers.get("Content-Length", 0))
+        while remain > 0:
+            data = self.rfile.read(min(IO_CHUNK_SIZE, remain))
+            if not data:
+                break
+            remain -= len(data)
+            self.__throttle__(len(data))
+            consume(data)
+
+    def __send__(self, code, body, headers=None):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __response__(self, response):
+        response.setdefault("RequestID", "mock-{}".format(random.getrandbits(32)))
+        self.__send__(200, {"Response": response})
+
+    def __inject_error__(self):
+        return self.gateway.error_rate > 0 and random.random() < self.gateway.error_rate
+
+    def do_POST(self):
+        chunks = []
+        self.__read_body__(chunks.append)
+        time.sleep(self.gateway.latency)
+        if urlparse(self.path).path != "/gateway":
+            return self.__send__(404, b"not found")
+        action = self.headers.get("X-TC-Action", "")
+        self.gateway.__record__(action)
+        if not self.headers.get("Authorization"):
+            return self.__response__({"Error": {"Code": "AuthFailure", "Message": "missing authorization"}})
+        try:
+            req = json.loads(b"".join(chunks))
+        except ValueError:
+            return self.__response__({"Error": {"Code": "InvalidParameter", "Message": "invalid json"}})
+        self.__response__(self.gateway.handle_action(action, req))
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        query = dict(parse_qsl(url.query))
+        action = url.path.rsplit("/", 1)[-1]
+        self.gateway.__record__(action)
+        time.sleep(self.gateway.latency)
+        if action not in ("UploadPart", "PutObject"):
+            self.__read_body__(lambda data: None)
+            return self.__send__(404, b"not found")
+        if self.__inject_error__():
+            self.__read_body__(lambda data: None)
+            return self.__send__(500, b"injected error")
+
+        key = query.get("Key", "")
+        if action == "UploadPart" and key not in self.gateway.uploads:
+            self.__read_body__(lambda data: None)
+            return self.__response__({"Error": {"Code": "InvalidParameter", "Message": "upload not found"}})
+        if action == "UploadPart":
+            path = self.gateway.part_path(key, int(query.get("partNumber", 0)))
+        else:
+            path = self.gateway.object_path(key)
+        md5 = hashlib.md5()
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            def consume(data):
+                md5.update(data)
+                f.write(data)
+            self.__read_body__(consume)
+        if md5.hexdigest() != query.get("Content-MD5"):
+            os.remove(tmp_path)
+            return self.__response__({"Error": {"Code": "InvalidDigest", "Message": "Content-MD5 mismatch"}})
+        os.replace(tmp_path, path)
+        self.__response__({})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict(parse_qsl(url.query))
+        self.gateway.__record__("GetObject")
+        time.sleep(self.gateway.latency)
+        path = self.gateway.object_path(query.get("Key", ""))
+        if url.path != "/FileManager/GetObject" or not query.get("Key") or not os.path.exists(path):
+            return self.__send__(404, b"not found")
+        if self.__inject_error__():
+            return self.__send__(500, b"injected error")
+
+        size = os.path.getsize(path)
+        headers = {"ETag": '"{}-{}"'.format(size, int(os.path.getmtime(path)))}
+        start, end, code = 0, size - 1, 200
+        content_range = self.headers.get("Range", "")
+        if content_range.startswith("bytes="):
+            first, _, last = content_range[6:].partition("-")
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if start >= size:
+                headers["Content-Range"] = "bytes */{}".format(size)
+                return self.__send__(416, b"", headers)
+            code = 206
+            headers["Content-Range"] = "bytes {}-{}/{}".format(start, end, size)
+
+        self.send_response(code)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            remain = end - start + 1
+            while remain > 0:
+                data = f.read(min(IO_CHUNK_SIZE, remain))
+                if not data:
+                    break
+                remain -= len(data)
+                self.__throttle__(len(data))
+                self.wfile.write(data)
+
+
+# parse_size 解析 "100MB"、"512KB" 这样的字节数
+def parse_size(value):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟的媒体管理系统网关")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="监听端口，0 表示随机端口")
+    parser.add_argument("--latency", type=float, default=0, help="每个请求增加的秒数")
+    parser.add_argument("--bandwidth", type=parse_size, default=None, help="每个连接的带宽，如 100MB")
+    parser.add_argument("--error-rate", type=float, default=0, help="上传分片/下载返回 500 的概率")
+    parser.add_argument("--data-dir", default=None, help="保存上传文件的目录，默认使用临时目录")
+    args = parser.parse_args(argv)
+
+    gateway = MockGateway(args.host, args.port, args.latency, args.bandwidth, args.error_rate, args.data_dir)
+    gateway.start()
+    # 第一行输出监听地址，便于其它进程读取随机端口
+    print("{}:{}".format(gateway.host, gateway.port))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+
+class Progress(object):
+    # Progress 传给进度回调的传输进度。
+    # bytes_done 已传输字节数, total 总字节数（未知时为 None）, rate 最近一个回调间隔内的速率（字节/秒）,
+    # avg_rate 从开始到现在的平均速率, in_flight 正在传输的分片/分段数, elapsed 已用秒数, finished 是否已结束
+    __slots__ = ("bytes_done", "total", "rate", "avg_rate", "in_flight", "elapsed", "finished")
+
+    def __init__(self, bytes_done, total, rate, avg_rate, in_flight, elapsed, finished):
+        self.bytes_done = bytes_done
+        self.total = total
+        self.rate = rate
+        self.avg_rate = avg_rate
+        self.in_flight = in_flight
+        self.elapsed = elapsed
+        self.finished = finished
+
+    # eta 按最近速率估算的剩余秒数，无法估算时返回 None
+    @property
+    def eta(self):
+        if self.total is None or self.rate <= 0:
+            return None
+        return max(0, self.total - self.bytes_done) / self.rate
+
+
+class ProgressTracker(object):
+    # ProgressTracker 在上传/下载线程中累加进度，距上次回调超过 interval 秒时才调用 callback，
+    # 结束时无论间隔都会再调用一次。bytes_done 为已写入/已发送的字节数，重试时可以传入负数回退
+    def __init__(self, callback, total=None, interval=0.5, bytes_done=0):
+        self.callback = callback
+        self.total = total
+        self.interval = interval
+        self.bytes_done = bytes_done
+        self.in_flight = 0
+        self._start = time.monotonic()
+        self._last_time = self._start
+        self._last_bytes = bytes_done
+        self._base_bytes = bytes_done
+        self._lock = threading.Lock()
+
+    # begin 确定总字节数和已完成的字节数（断点续传时）后调用，速率从此时开始计算
+    def begin(self, total, bytes_done=0):
+        with self._lock:
+            self.total = total
+            self.bytes_done = bytes_done
+            self._start = self._last_time = time.monotonic()
+            self._last_bytes = self._base_bytes = bytes_done
+
+    def add(self, size):
+        with self._lock:
+            self.bytes_done += size
+            progress = self.__due__(time.monotonic())
+        if progress is not None:
+            self.callback(progress)
+
+    # start 开始传输一个分片/分段
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    # done 一个分片/分段传输结束
+    def done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    # finish 传输结束时调用，立即回调最终进度
+    def finish(self):
+        with self._lock:
+            progress = self.__snapshot__(time.monotonic(), True)
+        self.callback(progress)
+
+    # __due__ 距上次回调超过 interval 时返回当前进度并记为已回调，否则返回 None
+    def __due__(self, now):
+        if now - self._last_time < self.interval:
+            return None
+        return self.__snapshot__(now, False)
+
+    def __snapshot__(self, now, finished):
+        elapsed = now - self._start
+        window = now - self._last_time
+        rate = max(0.0, (self.bytes_done - self._last_bytes) / window) if window > 0 else 0.0
+        avg_rate = (self.bytes_done - self._base_bytes) / elapsed if elapsed > 0 else 0.0
+        if finished:
+            rate = avg_rate
+        self._last_time = now
+        self._last_bytes = self.bytes_done
+        return Progress(self.bytes_done, self.total, rate, avg_rate, self.in_flight, elapsed, finished)
@@ -2,7 +2,6 @@
 
 from datetime import datetime
 import hashlib
-import sys
 import hmac
 import time
 
@@ -16,6 +15,8 @@ class TiSign(object):
     _secret_id = ''
     _secret_key = ''
     _header = {}
+    # 常量request_payload的hash，所有请求相同
+    _payload_hash = hashlib.sha256(b'').hexdigest()
 
     def __init__(self, host, action, version, service, content_type, http_method, secret_id, secret_key):
         # 请求header的host字段
@@ -33,27 +34,18 @@ class TiSign(object):
         # secret_id, secret_key，Ti平台生成的签名凭证，非常重要，请妥善保管
         self._secret_id = secret_id
         self._secret_key = secret_key
+        # 按 (UTC日期, 服务名) 缓存第3.1-3.3步派生的签名密钥
+        self._signing_keys = {}
 
-    def build_header_with_signature(self):
-      # 请求unix时间搓，精确到秒
-        self.xtc_timestamp = int(time.time())
-        self._header = {
-            "Host":           self.host,
-            "X-TC-Action":    self.xtc_action,
-            "X-TC-Version":   self.xtc_version,
-            "X-TC-Service":   self.xtc_service,
-            "X-TC-Timestamp": str(self.xtc_timestamp),
-            "Content-Type":   self.content_type,
-        }
-
+        # canonical_request 除时间外都是常量，提前拼接
         # 1. 构造canonical_request 字符串
         # 1.1 拼接关键header信息，包括content-type和根域名host
         canonical_headers = 'content-type:%s\nhost:%s\n' % (
             self.content_type, self.host)
         # 1.2 对常量request_payload进行hash计算
-        if sys.version_info[0] == 3 and isinstance(self._request_payload, type("")):
-            self._request_payload = self._request_payload.encode("utf8")
-        payload_hash = hashlib.sha256(self._request_payload).hexdigest()
+        payload_hash = self._payload_hash
+        if self._request_payload:
+            payload_hash = hashlib.sha256(self._request_payload.encode("utf8")).hexdigest()
         # 1.3 按照固定格式拼接所有请求信息
         canonical_request = '%s\n%s\n%s\n%s\n%s\n%s' % (self.http_method,
                                                         self._canonical_uri,
@@ -61,35 +53,38 @@ class TiSign(object):
                                                         canonical_headers,
                                                         self._signed_headers,
                                                         payload_hash)
+        # 2.3 对第1步构造的 canonical_request 进行hash计算
+        self._hash_canonical_request = hashlib.sha256(canonical_request.encode("utf8")).hexdigest()
+
+    # build_header_with_signature 构造带签名的请求头。
+    # 每次调用返回新的header字典，同一个 TiSign 可以在多个线程中复用
+    def build_header_with_signature(self):
+      # 请求unix时间搓，精确到秒
+        xtc_timestamp = int(time.time())
+        header = {
+            "Host":           self.host,
+            "X-TC-Action":    self.xtc_action,
+            "X-TC-Version":   self.xtc_version,
+            "X-TC-Service":   self.xtc_service,
+            "X-TC-Timestamp": str(xtc_timestamp),
+            "Content-Type":   self.content_type,
+        }
 
         # 2. 构造用于计算签名的字符串
         # 2.1 构造请求时间，根据请求header的X-TC-Timestamp字段(unix时间搓，精确到秒)，计算UTC标准日期
-        date = datetime.utcfromtimestamp(
-            int(self.xtc_timestamp)).strftime('%Y-%m-%d')
+        date = datetime.utcfromtimestamp(xtc_timestamp).strftime('%Y-%m-%d')
         # 2.2 构造凭证范围，固定格式为：Date/service/tc3_request
         credential_scope = date + '/' + self.xtc_service + '/tc3_request'
-        # 2.3 对第1步构造的 canonical_request 进行hash计算
-        if sys.version_info[0] == 3:
-            canonical_request = canonical_request.encode("utf8")
-        hash_canonical_request = hashlib.sha256(canonical_request).hexdigest()
         # 2.4 按照固定格式构造用于签名的字符串
         string2sign = '%s\n%s\n%s\n%s' % (self._algorithm,
-                                          self.xtc_timestamp,
+                                          xtc_timestamp,
                                           credential_scope,
-                                          hash_canonical_request)
+                                          self._hash_canonical_request)
 
         # 3. 对第2步构造的字符串进行签名
-        # 3.1 用平台分配secret_key对步骤2计算的标准UTC时间进行hash计算，生成secret_date
-        secret_date = self._hmac_sha256(
-            ('TC3' + self._secret_key).encode('utf-8'), date)
-        # 3.2 用3.1生成的secret_date对请求服务名进行hash计算，生成secret_service
-        secret_service = self._hmac_sha256(
-            secret_date.digest(), self.xtc_service)
-        # 3.3 用3.2生成的secret_service对tc3_request常量字符串进行hash计算, 生成新secret_key
-        secret_key = self._hmac_sha256(secret_service.digest(), 'tc3_request')
         # 3.4 用3.3生成的secretKey对第2构造的签名字符串进行hash计算，并生成最终的签名字符串
         signature = self._hmac_sha256(
-            secret_key.digest(), string2sign).hexdigest()
+            self._signing_key(date), string2sign).hexdigest()
 
         # 4. 构造http请求头的authorization字段
         # 4.1 按照固定格式构造authorization字符串
@@ -97,8 +92,27 @@ class TiSign(object):
         authorization += " Credential=%s/%s" % (
             self._secret_id, credential_scope)
         authorization += ", SignedHeaders=content-type;host, Signature=%s" % signature
-        self._header["Authorization"] = authorization
-        return self._header, authorization
+        header["Authorization"] = authorization
+
+        self.xtc_timestamp = xtc_timestamp
+        self._header = header
+        return header, authorization
+
+    # _signing_key 返回 date 当天的签名密钥，同一天内只计算一次
+    def _signing_key(self, date):
+        key = self._signing_keys.get((date, self.xtc_service))
+        if key is None:
+            # 3.1 用平台分配secret_key对步骤2计算的标准UTC时间进行hash计算，生成secret_date
+            secret_date = self._hmac_sha256(
+                ('TC3' + self._secret_key).encode('utf-8'), date)
+            # 3.2 用3.1生成的secret_date对请求服务名进行hash计算，生成secret_service
+            secret_service = self._hmac_sha256(
+                secret_date.digest(), self.xtc_service)
+            # 3.3 用3.2生成的secret_service对tc3_request常量字符串进行hash计算, 生成新secret_key
+            key = self._hmac_sha256(secret_service.digest(), 'tc3_request').digest()
+            # 只保留当天的密钥
+            self._signing_keys = {(date, self.xtc_service): key}
+        return key
 
     def _hmac_sha256(self, key, msg):
         return hmac.new(key, msg.encode('utf-8'), hashlib.sha256)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+
+import pytest
+
+from media_asset.media_asset import MediaMeta, FixedPartSizePolicy
+
+MB = 1024 * 1024
+
+
+class ErrorInjector(object):
+    # ErrorInjector 替换 MockGateway 的随机错误，按调用顺序决定 UploadPart/PutObject/GetObject 是否返回 500。
+    # fail 以第几次调用（从 0 开始）为参数，返回 True 时该次调用失败
+    def __init__(self, fail):
+        self.fail = fail
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+            failed = bool(self.fail(index))
+            if failed:
+                self.failures += 1
+        return failed
+
+
+@pytest.fixture
+def mock_gateway():
+    return pytest.importorskip("media_asset.mock_gateway")
+
+
+@pytest.fixture
+def gateway(mock_gateway):
+    with mock_gateway.MockGateway() as gw:
+        yield gw
+
+
+@pytest.fixture
+def inject_errors(mock_gateway, monkeypatch):
+    def install(fail):
+        injector = ErrorInjector(fail)
+        monkeypatch.setattr(mock_gateway._Handler, "__inject_error__", injector)
+        return injector
+    return install
+
+
+@pytest.fixture
+def small_parts(gateway, monkeypatch):
+    # gateway.config() 的分片大小固定为 1MB，测试分片上传时不需要很大的文件
+    config = gateway.config
+
+    def small_parts_config(**kwargs):
+        kwargs.setdefault("part_size_policy", FixedPartSizePolicy(MB))
+        return config(**kwargs)
+
+    monkeypatch.setattr(gateway, "config", small_parts_config)
+    return MB
+
+
+@pytest.fixture
+def media_meta():
+    return MediaMeta("视频", "新闻", "", "普通话")
+
+
+@pytest.fixture
+def make_file(tmp_path):
+    def make(size, name="media.bin"):
+        path = str(tmp_path / name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+    return make
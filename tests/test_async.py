@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+
+from media_asset.async_media_asset import AsyncMediaAsset
+
+MB = 1024 * 1024
+FILE_SIZE = 10 * MB + 5
+
+
+def run(config, func):
+    async def main():
+        async with AsyncMediaAsset(config) as media_asset:
+            return await func(media_asset)
+    return asyncio.run(main())
+
+
+def upload_config(gateway, **kwargs):
+    kwargs.setdefault("upload_retry_interval", 0)
+    return gateway.config(max_inflight_bytes=4 * MB, **kwargs)
+
+
+def test_async_upload_and_download(gateway, media_meta, make_file, small_parts, tmp_path):
+    big, small = make_file(FILE_SIZE, "big.bin"), make_file(1000, "small.bin")
+
+    async def upload_and_download(media_asset):
+        results = await asyncio.gather(media_asset.upload_file(big, "big", media_meta),
+                                       media_asset.upload_file(small, "small", media_meta))
+        for (media_info, err), name in zip(results, ["big.bin", "small.bin"]):
+            assert err.code == "ok", err.message
+            err = await media_asset.download_file(media_info.download_url, str(tmp_path / "out"), name)
+            assert err.code == "ok", err.message
+            data, err = await media_asset.download_t_buf(media_info.download_url)
+            assert data == (tmp_path / name).read_bytes()
+
+    run(upload_config(gateway), upload_and_download)
+    assert gateway.call_count("UploadPart") == 11
+    assert gateway.call_count("PutObject") == 1
+    for name in ["big.bin", "small.bin"]:
+        assert (tmp_path / "out" / name).read_bytes() == (tmp_path / name).read_bytes()
+
+
+def test_async_upload_parts_retry(gateway, media_meta, make_file, inject_errors, small_parts):
+    path = make_file(FILE_SIZE)
+    # 失败总数少于 upload_retry_times，同一个分片的重试不会全部失败
+    injector = inject_errors(lambda index: index % 3 == 1 and index < 12)
+    media_info, err = run(upload_config(gateway), lambda media_asset: media_asset.upload_file(path, "retry", media_meta))
+    assert err.code == "ok", err.message
+    assert gateway.call_count("UploadPart") == 11 + injector.failures
+
+
+def test_async_upload_resume(gateway, media_meta, make_file, inject_errors, small_parts, tmp_path):
+    path = make_file(FILE_SIZE)
+    config = upload_config(gateway, checkpoint_dir=str(tmp_path / "checkpoint"), upload_concurrency=1,
+                           upload_retry_times=1)
+    upload = lambda media_asset: media_asset.upload_file(path, "resume", media_meta)
+
+    inject_errors(lambda index: index >= 4)
+    media_info, err = run(config, upload)
+    assert err.code == "500"
+
+    inject_errors(lambda index: False)
+    applies, parts = gateway.call_count("ApplyUpload"), gateway.call_count("UploadPart")
+    media_info, err = run(config, upload)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("ApplyUpload") == applies
+    assert gateway.call_count("UploadPart") - parts == 7
+    assert os.listdir(config.checkpoint_dir) == []
+
+    # 网关不再认可记录中的上传时重新申请上传
+    inject_errors(lambda index: index >= 4)
+    media_info, err = run(config, upload)
+    assert err.code == "500"
+    inject_errors(lambda index: False)
+    gateway.uploads.clear()
+    applies = gateway.call_count("ApplyUpload")
+    media_info, err = run(config, upload)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("ApplyUpload") - applies == 1
+
+
+def test_async_medias(gateway):
+    media_ids = gateway.add_medias(3)
+
+    async def medias(media_asset):
+        media_infos, err = await media_asset.describe_media_details(media_ids)
+        assert err.code == "ok", err.message
+        assert [media_info.media_id for media_info in media_infos] == media_ids
+        failed, err = await media_asset.remove_medias(media_ids[:1])
+        assert err.code == "ok", err.message
+        assert failed == []
+        category, label, lang, err = await media_asset.describe_categories()
+        assert err.code == "ok", err.message
+        return await media_asset.describe_media_details(media_ids[:1])
+
+    media_infos, err = run(gateway.config(), medias)
+    assert media_infos[0].status == "素材已删除"
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import media_asset.cache
+from media_asset.cache import TTLCache
+from media_asset.media_asset import MediaAsset
+from media_asset.async_media_asset import AsyncMediaAsset
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(media_asset.cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_ttl_cache_expire(clock):
+    cache = TTLCache(10, 60)
+    cache.set("a", 1)
+    clock[0] += 59
+    assert cache.get("a") == 1
+    clock[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 0}
+
+
+def test_ttl_cache_lru(clock):
+    cache = TTLCache(2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # 超过容量时淘汰最久未使用的 b
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    cache.delete("a")
+    assert cache.get("a") is None
+
+
+def cache_config(gateway):
+    return gateway.config(cache_size=100)
+
+
+def test_media_details_cache(gateway):
+    media_ids = gateway.add_medias(3)
+    with MediaAsset(cache_config(gateway)) as media_asset:
+        media_infos, err = media_asset.describe_media_details(media_ids)
+        assert err.code == "ok", err.message
+        media_infos, err = media_asset.describe_media_details(media_ids[:2] + [media_ids[2]])
+        assert err.code == "ok", err.message
+        assert [media_info.media_id for media_info in media_infos] == media_ids
+        assert gateway.call_count("DescribeMediaDetails") == 1
+        assert media_asset.cache_stats() == {"hits": 3, "misses": 3, "size": 3}
+
+
+def test_media_details_cache_terminal_only(gateway):
+    media_id = gateway.add_medias(1)[0]
+    gateway.medias[media_id]["Status"] = "上传中"
+    with MediaAsset(cache_config(gateway)) as media_asset:
+        media_asset.describe_media_details([media_id])
+        # 状态还会变化的媒体不缓存，轮询状态时总是请求网关
+        media_asset.describe_media_details([media_id])
+        assert gateway.call_count("DescribeMediaDetails") == 2
+
+
+def test_media_details_cache_invalidate(gateway):
+    media_ids = gateway.add_medias(3)
+    with MediaAsset(cache_config(gateway)) as media_asset:
+        media_asset.describe_media_details(media_ids)
+        media_asset.modify_media(media_ids[0], "新闻", "")
+        media_asset.modify_expire_time(media_ids[1], 10)
+        media_asset.describe_media_details(media_ids)
+        assert gateway.call_count("DescribeMediaDetails") == 2
+        media_asset.remove_medias(media_ids)
+        media_infos, err = media_asset.describe_media_details(media_ids)
+        assert gateway.call_count("DescribeMediaDetails") == 3
+        assert {media_info.status for media_info in media_infos} == {"素材已删除"}
+
+
+def test_media_details_cache_returns_copies(gateway):
+    media_id = gateway.add_medias(1)[0]
+    with MediaAsset(cache_config(gateway)) as media_asset:
+        media_infos, err = media_asset.describe_media_details([media_id])
+        media_infos[0].name = "changed"
+        media_infos, err = media_asset.describe_media_details([media_id])
+        assert media_infos[0].name == "mock-0"
+        media_infos[0].name = "changed"
+        media_infos, err = media_asset.describe_media_details([media_id])
+        assert media_infos[0].name == "mock-0"
+        assert gateway.call_count("DescribeMediaDetails") == 1
+
+
+def test_categories_cache(gateway):
+    with MediaAsset(cache_config(gateway)) as media_asset:
+        category, label, lang, err = media_asset.describe_categories()
+        assert err.code == "ok", err.message
+        category.clear()
+        lang.append("changed")
+        # 修改返回的列表不影响缓存
+        category, label, lang, err = media_asset.describe_categories()
+        assert err.code == "ok", err.message
+        assert len(category) > 0
+        assert "changed" not in lang
+        assert gateway.call_count("DescribeCategories") == 1
+
+
+def test_cache_disabled(gateway):
+    media_ids = gateway.add_medias(1)
+    with MediaAsset(gateway.config()) as media_asset:
+        media_asset.describe_media_details(media_ids)
+        media_asset.describe_media_details(media_ids)
+        assert media_asset.cache_stats() is None
+    assert gateway.call_count("DescribeMediaDetails") == 2
+
+
+def test_async_cache_warning(gateway):
+    with pytest.warns(UserWarning, match="cache_size"):
+        AsyncMediaAsset(cache_config(gateway))
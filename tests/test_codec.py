@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import media_asset.codec
+from media_asset.codec import JsonCodec, OrjsonCodec, UjsonCodec, get_codec
+from media_asset.media_asset import MediaAsset
+
+PAYLOAD = {"Name": "测试媒体", "MediaIDSet": [1, 2, 3], "Inner": False, "Size": "5242883", "Meta": None}
+
+
+def available_codecs():
+    codecs = [JsonCodec()]
+    if media_asset.codec.orjson is not None:
+        codecs.append(OrjsonCodec())
+    if media_asset.codec.ujson is not None:
+        codecs.append(UjsonCodec())
+    return codecs
+
+
+@pytest.mark.parametrize("codec", available_codecs(), ids=lambda codec: codec.name)
+def test_codec_round_trip(codec):
+    data = codec.dumps(PAYLOAD)
+    assert isinstance(data, bytes)
+    assert codec.loads(data) == PAYLOAD
+    # 各编解码器的输出可以互相解析
+    assert JsonCodec().loads(data) == PAYLOAD
+    assert codec.loads(JsonCodec().dumps(PAYLOAD)) == PAYLOAD
+
+
+def test_get_codec_auto(monkeypatch):
+    monkeypatch.setattr(media_asset.codec, "orjson", None)
+    monkeypatch.setattr(media_asset.codec, "ujson", None)
+    assert type(get_codec()) is JsonCodec
+    monkeypatch.setattr(media_asset.codec, "ujson", object())
+    assert type(get_codec("auto")) is UjsonCodec
+    monkeypatch.setattr(media_asset.codec, "orjson", object())
+    assert type(get_codec("auto")) is OrjsonCodec
+
+
+def test_get_codec_by_name(monkeypatch):
+    codec = JsonCodec()
+    assert get_codec(codec) is codec
+    assert type(get_codec("json")) is JsonCodec
+    monkeypatch.setattr(media_asset.codec, "orjson", None)
+    with pytest.raises(ValueError):
+        get_codec("orjson")
+    with pytest.raises(ValueError):
+        get_codec("yaml")
+
+
+@pytest.mark.parametrize("codec", available_codecs(), ids=lambda codec: codec.name)
+def test_codec_requests(gateway, media_meta, make_file, codec):
+    path = make_file(1000)
+    with MediaAsset(gateway.config(json_codec=codec)) as media_asset:
+        media_info, err = media_asset.upload_file(path, "测试媒体", media_meta)
+        assert err.code == "ok", err.message
+        assert media_info.name == "测试媒体"
+        category, label, lang, err = media_asset.describe_categories()
+        assert err.code == "ok", err.message
+        assert "普通话" in lang
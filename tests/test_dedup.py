@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import asyncio
+import hashlib
+
+import pytest
+
+from media_asset.media_asset import MediaAsset, MediaState
+from media_asset.async_media_asset import AsyncMediaAsset
+from media_asset.dedup import DedupIndex
+from media_asset.metrics import MemoryMetrics
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = DedupIndex(str(tmp_path / "index" / "dedup.db"))
+    yield index
+    index.close()
+
+
+def copy_file(path, name):
+    target = os.path.join(os.path.dirname(path), name)
+    shutil.copyfile(path, target)
+    return target
+
+
+def test_dedup_index(index):
+    assert index.lookup("abc", 10) is None
+    index.add("abc", 10, 1)
+    index.add("abc", 11, 2)
+    assert index.lookup("abc", 10) == 1
+    assert index.lookup("abc", 11) == 2
+    # 只在记录的 MediaID 相同时删除
+    index.remove("abc", 10, 3)
+    assert index.lookup("abc", 10) == 1
+    index.remove("abc", 10, 1)
+    assert index.lookup("abc", 10) is None
+    index.remove("abc", 11)
+    assert index.lookup("abc", 11) is None
+
+
+def test_dedup_file_md5(index, make_file):
+    path = make_file(1000)
+    data = open(path, "rb").read()
+    assert index.file_md5(path, 100) == hashlib.md5(data).hexdigest()
+
+    # 大小和修改时间不变时使用记录的 md5，不重新读盘
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        f.write(b"\0" * 10)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert index.file_md5(path, 100) == hashlib.md5(data).hexdigest()
+
+    # 传入 file_hash 时重新计算并更新 file_hash
+    file_hash = hashlib.md5()
+    changed = open(path, "rb").read()
+    assert index.file_md5(path, 100, file_hash) == hashlib.md5(changed).hexdigest()
+    assert file_hash.hexdigest() == hashlib.md5(changed).hexdigest()
+
+
+def test_upload_dedup_hit(gateway, media_meta, make_file, index):
+    path = make_file(2000)
+    metrics = MemoryMetrics()
+    with MediaAsset(gateway.config(dedup_index=index, metrics=metrics)) as media_asset:
+        first, err = media_asset.upload_file(path, "first", media_meta)
+        assert err.code == "ok", err.message
+        second, err = media_asset.upload_file(copy_file(path, "copy.bin"), "second", media_meta)
+        assert err.code == "ok", err.message
+    # 内容相同的文件直接返回第一次上传的媒体
+    assert second.media_id == first.media_id
+    assert second.name == "first"
+    assert gateway.call_count("ApplyUpload") == 1
+    assert metrics.summary()["dedup_hits"]["UploadFile"] == 1
+
+
+def test_upload_dedup_miss(gateway, media_meta, make_file, index):
+    first_path, second_path = make_file(2000, "first.bin"), make_file(2000, "second.bin")
+    with MediaAsset(gateway.config(dedup_index=index)) as media_asset:
+        first, err = media_asset.upload_file(first_path, "first", media_meta)
+        assert err.code == "ok", err.message
+        second, err = media_asset.upload_file(second_path, "second", media_meta)
+        assert err.code == "ok", err.message
+    assert second.media_id != first.media_id
+    assert gateway.call_count("ApplyUpload") == 2
+
+
+def test_upload_dedup_stale(gateway, media_meta, make_file, index):
+    path = make_file(2000)
+    file_md5 = hashlib.md5(open(path, "rb").read()).hexdigest()
+    with MediaAsset(gateway.config(dedup_index=index)) as media_asset:
+        first, err = media_asset.upload_file(path, "first", media_meta)
+        assert err.code == "ok", err.message
+        failed_media_set, err = media_asset.remove_medias([first.media_id])
+        assert err.code == "ok", err.message
+
+        # 索引中的媒体已删除时删除记录，重新上传并记录新的媒体
+        second, err = media_asset.upload_file(path, "second", media_meta)
+        assert err.code == "ok", err.message
+    assert second.media_id != first.media_id
+    assert gateway.call_count("ApplyUpload") == 2
+    assert index.lookup(file_md5, 2000) == second.media_id
+
+
+def test_upload_dedup_not_completed(gateway, media_meta, make_file, index):
+    path = make_file(2000)
+    file_md5 = hashlib.md5(open(path, "rb").read()).hexdigest()
+    with MediaAsset(gateway.config(dedup_index=index)) as media_asset:
+        first, err = media_asset.upload_file(path, "first", media_meta)
+        assert err.code == "ok", err.message
+        gateway.medias[first.media_id]["Status"] = MediaState.UPLOADING.value
+
+        # 媒体还没有上传完成时重新上传，记录改为新的媒体
+        second, err = media_asset.upload_file(path, "second", media_meta)
+        assert err.code == "ok", err.message
+    assert second.media_id != first.media_id
+    assert index.lookup(file_md5, 2000) == second.media_id
+
+
+def test_async_upload_dedup(gateway, media_meta, make_file, tmp_path):
+    path = make_file(2000)
+    index_path = str(tmp_path / "dedup.db")
+
+    async def upload_twice():
+        async with AsyncMediaAsset(gateway.config(dedup_index=index_path)) as media_asset:
+            first, err = await media_asset.upload_file(path, "first", media_meta)
+            assert err.code == "ok", err.message
+            second, err = await media_asset.upload_file(copy_file(path, "copy.bin"), "second", media_meta)
+            assert err.code == "ok", err.message
+            return first, second
+
+    first, second = asyncio.run(upload_twice())
+    assert second.media_id == first.media_id
+    assert gateway.call_count("ApplyUpload") == 1
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+import asyncio
+import warnings
+
+import pytest
+
+from media_asset.media_asset import MediaAsset
+from media_asset.async_media_asset import AsyncMediaAsset
+
+MB = 1024 * 1024
+FILE_SIZE = 5 * MB + 3
+
+
+def upload(gateway, path, media_meta):
+    with MediaAsset(gateway.config()) as media_asset:
+        media_info, err = media_asset.upload_file(path, "download", media_meta)
+    assert err.code == "ok", err.message
+    return media_info
+
+
+def download_config(gateway, **kwargs):
+    return gateway.config(read_chunk_size=256 * 1024, **kwargs)
+
+
+def test_download_stream(gateway, media_meta, make_file, tmp_path):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    umask = os.umask(0o022)
+    os.umask(umask)
+    with MediaAsset(download_config(gateway)) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin")
+    assert err.code == "ok", err.message
+    assert (tmp_path / "out" / "a.bin").read_bytes() == open(path, "rb").read()
+    assert os.listdir(str(tmp_path / "out")) == ["a.bin"]
+    # 临时文件与 open() 一样按 umask 设置权限
+    assert stat.S_IMODE(os.stat(str(tmp_path / "out" / "a.bin")).st_mode) == 0o666 & ~umask
+
+
+def test_download_not_found(gateway, tmp_path):
+    with MediaAsset(download_config(gateway)) as media_asset:
+        err = media_asset.download_file("/FileManager/GetObject?Bucket=mock&Key=missing", str(tmp_path / "out"),
+                                        "a.bin")
+    assert err.code == "404"
+    assert not os.path.exists(str(tmp_path / "out" / "a.bin"))
+
+
+def test_iter_download(gateway, media_meta, make_file):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    with MediaAsset(download_config(gateway)) as media_asset:
+        chunks, err = media_asset.iter_download(media_info.download_url, chunk_size=MB)
+        assert err.code == "ok", err.message
+        data = list(chunks)
+    assert max(len(chunk) for chunk in data) <= MB
+    assert b"".join(data) == open(path, "rb").read()
+
+
+def test_async_download(gateway, media_meta, make_file, tmp_path):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+
+    async def download():
+        async with AsyncMediaAsset(download_config(gateway)) as media_asset:
+            err = await media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin")
+            assert err.code == "ok", err.message
+            chunks, err = await media_asset.iter_download(media_info.download_url)
+            assert err.code == "ok", err.message
+            return b"".join([data async for data in chunks])
+
+    assert asyncio.run(download()) == open(path, "rb").read()
+    assert (tmp_path / "out" / "a.bin").read_bytes() == open(path, "rb").read()
+    assert os.listdir(str(tmp_path / "out")) == ["a.bin"]
+
+
+def ranged_config(gateway, **kwargs):
+    kwargs.setdefault("download_concurrency", 3)
+    kwargs.setdefault("download_retry_interval", 0)
+    return download_config(gateway, download_segment_size=MB, **kwargs)
+
+
+def rewrite_content_range(mock_gateway, monkeypatch, rewrite):
+    # rewrite 返回新的 Content-Range，返回 None 时不发送该头
+    send_header = mock_gateway._Handler.send_header
+
+    def patched(handler, keyword, value):
+        if keyword == "Content-Range":
+            value = rewrite(value)
+            if value is None:
+                return
+        send_header(handler, keyword, value)
+
+    monkeypatch.setattr(mock_gateway._Handler, "send_header", patched)
+
+
+def test_download_ranges(gateway, media_meta, make_file, tmp_path):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    with MediaAsset(ranged_config(gateway)) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin")
+    assert err.code == "ok", err.message
+    # 一次探测请求加 6 个分段
+    assert gateway.call_count("GetObject") == 7
+    assert (tmp_path / "out" / "a.bin").read_bytes() == open(path, "rb").read()
+    assert os.listdir(str(tmp_path / "out")) == ["a.bin"]
+
+
+def test_download_ranges_retry(gateway, media_meta, make_file, inject_errors, tmp_path):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    injector = inject_errors(lambda index: index in (2, 4))
+    with MediaAsset(ranged_config(gateway)) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin")
+    assert err.code == "ok", err.message
+    assert injector.failures == 2
+    assert gateway.call_count("GetObject") == 7 + 2
+    assert (tmp_path / "out" / "a.bin").read_bytes() == open(path, "rb").read()
+
+
+def test_download_ranges_failed(gateway, media_meta, make_file, inject_errors, tmp_path):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    inject_errors(lambda index: index >= 1)
+    with MediaAsset(ranged_config(gateway, download_retry_times=2)) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin")
+    assert err.code == "500"
+    assert os.listdir(str(tmp_path / "out")) == []
+
+
+def test_download_probe_without_content_range(gateway, mock_gateway, media_meta, make_file, tmp_path, monkeypatch):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    rewrite_content_range(mock_gateway, monkeypatch, lambda value: None)
+    with MediaAsset(ranged_config(gateway)) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin")
+    assert err.code == "download failed"
+    assert os.listdir(str(tmp_path / "out")) == []
+
+
+def test_download_range_mismatch(gateway, mock_gateway, media_meta, make_file, tmp_path, monkeypatch):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    rewritten = []
+
+    # 第一个非 0 起点的分段返回从 0 开始的区间，不能写入该分段的偏移
+    def rewrite(value):
+        if not rewritten and not value.startswith("bytes 0-"):
+            rewritten.append(value)
+            return "bytes 0-" + value.split("-", 1)[1]
+        return value
+
+    rewrite_content_range(mock_gateway, monkeypatch, rewrite)
+    with MediaAsset(ranged_config(gateway)) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin")
+    assert err.code == "ok", err.message
+    assert len(rewritten) == 1
+    assert gateway.call_count("GetObject") == 7 + 1
+    assert (tmp_path / "out" / "a.bin").read_bytes() == open(path, "rb").read()
+
+    rewrite_content_range(mock_gateway, monkeypatch, lambda value: "bytes 0-" + value.split("-", 1)[1])
+    with MediaAsset(ranged_config(gateway, download_retry_times=2)) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "b.bin")
+    assert err.code == "download failed"
+    assert err.message == "range mismatch"
+    assert os.listdir(str(tmp_path / "out")) == ["a.bin"]
+
+
+def test_async_download_concurrency_warning(gateway):
+    with pytest.warns(UserWarning, match="download_concurrency"):
+        AsyncMediaAsset(gateway.config(download_concurrency=8))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        AsyncMediaAsset(gateway.config())
+        AsyncMediaAsset(gateway.config(download_concurrency=1))
+
+
+def test_download_empty_file(gateway, media_meta, make_file, tmp_path):
+    media_info = upload(gateway, make_file(0), media_meta)
+    with MediaAsset(ranged_config(gateway)) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin")
+    assert err.code == "ok", err.message
+    assert (tmp_path / "out" / "a.bin").read_bytes() == b""
+
+
+def resume_config(gateway):
+    # 顺序下载各个分段，按调用顺序注入错误
+    return ranged_config(gateway, download_concurrency=1, download_retry_times=1)
+
+
+def interrupt_download(gateway, inject_errors, config, media_info, out):
+    # 探测请求和前 3 个分段成功，之后的请求都失败
+    inject_errors(lambda index: index > 3)
+    with MediaAsset(config) as media_asset:
+        err = media_asset.download_file(media_info.download_url, out, "a.bin", resume=True)
+    assert err.code == "500"
+    assert sorted(os.listdir(out)) == ["a.bin.part", "a.bin.part.json"]
+    inject_errors(lambda index: False)
+
+
+def test_download_resume(gateway, media_meta, make_file, inject_errors, tmp_path):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    out = str(tmp_path / "out")
+    config = resume_config(gateway)
+    interrupt_download(gateway, inject_errors, config, media_info, out)
+
+    calls = gateway.call_count("GetObject")
+    with MediaAsset(config) as media_asset:
+        err = media_asset.download_file(media_info.download_url, out, "a.bin", resume=True)
+    assert err.code == "ok", err.message
+    # 探测请求加剩下的 3 个分段
+    assert gateway.call_count("GetObject") - calls == 4
+    assert os.listdir(out) == ["a.bin"]
+    assert (tmp_path / "out" / "a.bin").read_bytes() == open(path, "rb").read()
+
+
+def test_download_resume_changed_file(gateway, media_meta, make_file, inject_errors, tmp_path):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    out = str(tmp_path / "out")
+    config = resume_config(gateway)
+    interrupt_download(gateway, inject_errors, config, media_info, out)
+
+    # 服务端文件变化后 ETag 不同，断点记录失效，从头下载
+    key = media_info.download_url.rsplit("=", 1)[1]
+    with open(gateway.object_path(key), "wb") as f:
+        f.write(os.urandom(FILE_SIZE + 1))
+    os.utime(gateway.object_path(key), (0, 0))
+    with MediaAsset(config) as media_asset:
+        err = media_asset.download_file(media_info.download_url, out, "a.bin", resume=True)
+    assert err.code == "ok", err.message
+    assert (tmp_path / "out" / "a.bin").read_bytes() == open(gateway.object_path(key), "rb").read()
+
+
+@pytest.mark.parametrize("damage", ["remove", "truncate"])
+def test_download_resume_damaged_part(gateway, media_meta, make_file, inject_errors, tmp_path, damage):
+    path = make_file(FILE_SIZE)
+    media_info = upload(gateway, path, media_meta)
+    out = str(tmp_path / "out")
+    config = resume_config(gateway)
+    interrupt_download(gateway, inject_errors, config, media_info, out)
+
+    # .part 文件被删除或截断后不能沿用记录，否则已记录的分段会是空洞
+    part_path = os.path.join(out, "a.bin.part")
+    if damage == "remove":
+        os.remove(part_path)
+    else:
+        with open(part_path, "r+b") as f:
+            f.truncate(MB)
+    calls = gateway.call_count("GetObject")
+    with MediaAsset(config) as media_asset:
+        err = media_asset.download_file(media_info.download_url, out, "a.bin", resume=True)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("GetObject") - calls == 7
+    assert (tmp_path / "out" / "a.bin").read_bytes() == open(path, "rb").read()
+
+
+def test_async_download_resume_not_supported(gateway, tmp_path):
+    async def download():
+        async with AsyncMediaAsset(download_config(gateway)) as media_asset:
+            await media_asset.download_file("/FileManager/GetObject?Bucket=mock&Key=a", str(tmp_path), "a.bin",
+                                            resume=True)
+
+    with pytest.raises(NotImplementedError):
+        asyncio.run(download())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from media_asset.media_asset import MediaAsset, PartHasher
+from media_asset.async_media_asset import AsyncMediaAsset
+from media_asset.metrics import MemoryMetrics
+
+MB = 1024 * 1024
+FILE_SIZE = 4 * MB + 11
+
+
+def part_md5s(path, part_size):
+    with open(path, "rb") as f:
+        data = f.read()
+    return {i // part_size + 1: hashlib.md5(data[i:i + part_size]).hexdigest() for i in range(0, len(data), part_size)}
+
+
+def file_md5(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def test_part_hasher(make_file):
+    path = make_file(FILE_SIZE)
+    expected = part_md5s(path, MB)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        hasher = PartHasher(executor, path, FILE_SIZE, 256 * 1024, skip={2}, lookahead=2, part_size=MB)
+        assert hasher.future(1).result() == expected[1]
+        assert hasher.future(3).result() == expected[3]
+        # 不计算整个文件的 hash 时跳过 skip 中的分片
+        with pytest.raises(KeyError):
+            hasher.future(2)
+        assert hasher.future(5).result() == expected[5]
+        assert hasher.future(4).result() == expected[4]
+
+
+def test_part_hasher_file_hash(make_file):
+    path = make_file(FILE_SIZE)
+    expected = part_md5s(path, MB)
+    file_hash = hashlib.md5()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        hasher = PartHasher(executor, path, FILE_SIZE, 256 * 1024, skip={1, 4}, file_hash=file_hash, part_size=MB)
+        assert hasher.future(2).result() == expected[2]
+        assert hasher.future(3).result() == expected[3]
+        hasher.finish()
+    # skip 中的分片也按顺序计入整个文件的 hash
+    assert file_hash.hexdigest() == file_md5(path)
+
+
+@pytest.mark.parametrize("size", [1000, FILE_SIZE])
+def test_upload_file_hash(gateway, media_meta, make_file, small_parts, size):
+    path = make_file(size)
+    file_hash = hashlib.md5()
+    metrics = MemoryMetrics()
+    with MediaAsset(gateway.config(metrics=metrics)) as media_asset:
+        media_info, err = media_asset.upload_file(path, "hash", media_meta, file_hash=file_hash)
+    assert err.code == "ok", err.message
+    assert file_hash.hexdigest() == file_md5(path)
+    if size > small_parts:
+        assert metrics.summary()["md5_wait"]["UploadPart"]["count"] == 5
+
+
+def test_upload_file_hash_resumed(gateway, media_meta, make_file, inject_errors, small_parts, tmp_path):
+    path = make_file(FILE_SIZE)
+    config = gateway.config(checkpoint_dir=str(tmp_path / "checkpoint"), upload_concurrency=1, upload_retry_times=1,
+                            upload_retry_interval=0)
+    inject_errors(lambda index: index >= 2)
+    media_info, err = MediaAsset(config).upload_file(path, "hash", media_meta)
+    assert err.code == "500"
+
+    inject_errors(lambda index: False)
+    parts = gateway.call_count("UploadPart")
+    file_hash = hashlib.md5()
+    media_info, err = MediaAsset(config).upload_file(path, "hash", media_meta, file_hash=file_hash)
+    assert err.code == "ok", err.message
+    # 只上传剩下的分片，已上传的分片也计入整个文件的 hash
+    assert gateway.call_count("UploadPart") - parts == 3
+    assert file_hash.hexdigest() == file_md5(path)
+
+
+def test_async_upload_file_hash(gateway, media_meta, make_file, small_parts):
+    path = make_file(FILE_SIZE)
+    file_hash = hashlib.md5()
+
+    async def upload():
+        async with AsyncMediaAsset(gateway.config()) as media_asset:
+            return await media_asset.upload_file(path, "hash", media_meta, file_hash=file_hash)
+
+    media_info, err = asyncio.run(upload())
+    assert err.code == "ok", err.message
+    assert file_hash.hexdigest() == file_md5(path)
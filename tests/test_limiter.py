@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+import types
+import asyncio
+import threading
+
+import pytest
+
+import media_asset.limiter
+from media_asset.media_asset import MediaAsset, MediaResponse, post_http
+from media_asset.limiter import AimdController, TokenBucket, AdaptiveLimiter, AsyncAdaptiveLimiter, is_congestion
+from media_asset.metrics import MemoryMetrics
+
+MB = 1024 * 1024
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(media_asset.limiter, "time", types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_is_congestion():
+    assert is_congestion(429)
+    assert is_congestion(503)
+    assert not is_congestion(404)
+    assert not is_congestion()
+    assert is_congestion(code="RequestLimitExceeded")
+    assert is_congestion(code="LimitExceeded.Business")
+    assert not is_congestion(code="InvalidParameter")
+
+
+def test_aimd_controller(clock):
+    controller = AimdController(8, 1, 10, increase=1, backoff=0.5, cooldown=1.0)
+    assert controller.feedback() == 9
+    assert controller.feedback(congested=True) == 4.5
+    # cooldown 内同一波失败只减一次
+    assert controller.feedback(congested=True) == 4.5
+    clock.now += 1
+    assert controller.feedback(congested=True) == 2.25
+    clock.now += 1
+    controller.feedback(congested=True)
+    clock.now += 1
+    assert controller.feedback(congested=True) == 1
+    for i in range(20):
+        controller.feedback()
+    assert controller.feedback() == 10
+
+
+def test_aimd_controller_cost(clock):
+    controller = AimdController(4, 1, 8, backoff=0.5, tolerance=2.0)
+    # 默认每次成功加 1/value
+    assert controller.feedback(cost=1.0) == pytest.approx(4.25)
+    assert controller.baseline == 1.0
+    assert controller.feedback(cost=1.5) == pytest.approx(4.25 + 1 / 4.25)
+    # 耗时超过基线 tolerance 倍视为过载
+    assert controller.feedback(cost=2.5) == pytest.approx((4.25 + 1 / 4.25) / 2)
+    # 基线每个样本上浮 1%
+    assert controller.baseline == pytest.approx(1.0201)
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(10, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # 令牌用完后预支，等待时间按速率计算
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+    clock.now += 0.5
+    assert bucket.reserve() == 0
+    # 容量不超过 burst
+    clock.now += 100
+    assert [bucket.reserve() for i in range(3)] == [0, 0, pytest.approx(0.1)]
+
+
+def test_token_bucket_feedback(clock):
+    bucket = TokenBucket(10, min_rate=2)
+    bucket.feedback(congested=True)
+    assert bucket.rate == 5
+    clock.now += 1
+    bucket.feedback(congested=True)
+    clock.now += 1
+    bucket.feedback(congested=True)
+    assert bucket.rate == 2
+    # 每个成功的请求增加配置速率的 1%，不超过配置的速率
+    bucket.feedback()
+    assert bucket.rate == pytest.approx(2.1)
+    for i in range(200):
+        bucket.feedback()
+    assert bucket.rate == 10
+
+
+def test_adaptive_limiter(clock):
+    limiter = AdaptiveLimiter(3)
+    for i in range(3):
+        limiter.acquire()
+    assert limiter.in_flight == 3
+
+    acquired = threading.Event()
+
+    def acquire():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    # 达到上限时等待，过载后上限减半
+    assert not acquired.wait(0.1)
+    limiter.release(congested=True)
+    assert limiter.limit == 1
+    assert not acquired.wait(0.1)
+    # 成功后上限加 1/limit，回到 2
+    limiter.release()
+    assert limiter.limit == 2
+    assert acquired.wait(1)
+    thread.join()
+    assert limiter.in_flight == 2
+
+
+def test_async_adaptive_limiter():
+    limiter = AsyncAdaptiveLimiter(2)
+    running = []
+    peak = []
+
+    async def part(congested):
+        await limiter.acquire()
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        await limiter.release(congested)
+
+    async def main():
+        await asyncio.gather(*[part(False) for i in range(6)])
+        assert max(peak) == 2
+        await asyncio.gather(*[part(True) for i in range(2)])
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+    assert limiter.limit == 1
+
+
+class ThrottledSession(object):
+    # ThrottledSession 返回固定状态码和响应体的会话
+    def __init__(self, status_code, content):
+        self.response = types.SimpleNamespace(status_code=status_code, content=content)
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        return self.response
+
+
+def test_post_http_rate_limiter(clock):
+    header = {"X-TC-Action": "DescribeMedias"}
+    bucket = TokenBucket(10)
+    metrics = MemoryMetrics()
+    session = ThrottledSession(200, b'{"Response": {"Error": {"Code": "RequestLimitExceeded", "Message": ""}}}')
+    post_http(header, "http://127.0.0.1/gateway", {}, session, metrics=metrics, rate_limiter=bucket)
+    assert bucket.rate == 5
+
+    clock.now += 1
+    session = ThrottledSession(200, b'{"Response": {"RequestId": "1"}}')
+    post_http(header, "http://127.0.0.1/gateway", {}, session, metrics=metrics, rate_limiter=bucket)
+    assert bucket.rate == pytest.approx(5.1)
+
+
+def test_transient_error():
+    def error(code):
+        return MediaResponse({"RequestID": "", "Error": {"Code": code, "Message": ""}})
+
+    assert MediaAsset.__transient_error__(error("http put failed"))
+    assert MediaAsset.__transient_error__(error("503"))
+    assert MediaAsset.__transient_error__(error("429"))
+    assert MediaAsset.__transient_error__(error("RequestLimitExceeded"))
+    assert not MediaAsset.__transient_error__(error("404"))
+    assert not MediaAsset.__transient_error__(error("InvalidParameter"))
+
+
+def test_upload_adaptive_concurrency(gateway, media_meta, make_file, inject_errors, small_parts):
+    path = make_file(6 * MB + 1)
+    inject_errors(lambda index: index in (1, 2))
+    config = gateway.config(adaptive_concurrency=True, upload_concurrency=4, max_inflight_bytes=8 * MB,
+                            upload_retry_interval=0, api_rate=100)
+    with MediaAsset(config) as media_asset:
+        media_info, err = media_asset.upload_file(path, "adaptive", media_meta)
+        assert err.code == "ok", err.message
+        # 重试后上传成功，所有名额都已释放
+        assert 1 <= media_asset.part_limiter.limit <= 4
+        assert media_asset.part_limiter.in_flight == 0
+        assert media_asset.rate_limiter.rate == 100
+
+
+def test_upload_adaptive_concurrency_failed(gateway, media_meta, make_file, inject_errors, small_parts):
+    path = make_file(6 * MB + 1)
+    inject_errors(lambda index: index >= 1)
+    config = gateway.config(adaptive_concurrency=True, upload_concurrency=4, max_inflight_bytes=8 * MB,
+                            upload_retry_times=1, upload_retry_interval=0)
+    with MediaAsset(config) as media_asset:
+        media_info, err = media_asset.upload_file(path, "adaptive", media_meta)
+        assert err.code == "500"
+        # 分片失败（http 5xx）后并发上限减半，失败的分片也释放名额
+        assert media_asset.part_limiter.limit < 4
+        assert media_asset.part_limiter.in_flight == 0
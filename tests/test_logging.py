@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from media_asset.media_asset import MediaAsset, LogBody, LOG_BODY_LIMIT, redact_header
+
+
+def test_log_body_truncated():
+    assert str(LogBody(b"short")) == "short"
+    text = str(LogBody("x" * (LOG_BODY_LIMIT + 10)))
+    assert text == "x" * LOG_BODY_LIMIT + "...(truncated, {} total)".format(LOG_BODY_LIMIT + 10)
+
+
+def test_redact_header():
+    header = {"Authorization": "TC3-HMAC-SHA256 Credential=AKID/...", "Host": "127.0.0.1"}
+    assert redact_header(header) == {"Authorization": "***", "Host": "127.0.0.1"}
+    # 不修改原始请求头
+    assert header["Authorization"].startswith("TC3")
+
+
+def test_request_logging(gateway, caplog, capsys):
+    with caplog.at_level(logging.DEBUG, logger="media_asset"):
+        with MediaAsset(gateway.config()) as media_asset:
+            category, label, lang, err = media_asset.describe_categories()
+    assert err.code == "ok", err.message
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("DescribeCategories" in message and "'Authorization': '***'" in message for message in messages)
+    assert not any("Credential=" in message for message in messages)
+    # 不再向标准输出打印请求和响应
+    assert capsys.readouterr().out == ""
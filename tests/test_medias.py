@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+
+import pytest
+
+from media_asset.media_asset import MediaAsset, FilterBy
+from media_asset.async_media_asset import AsyncMediaAsset
+
+
+def filter_all():
+    return FilterBy("", [], [], [])
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_iter_medias(gateway, prefetch):
+    media_ids = gateway.add_medias(250)
+    with MediaAsset(gateway.config()) as media_asset:
+        results = list(media_asset.iter_medias(filter_all(), page_size=100, prefetch=prefetch))
+    assert all(err.code == "ok" for media_info, err in results)
+    assert [media_info.media_id for media_info, err in results] == media_ids
+    assert gateway.call_count("DescribeMedias") == 3
+
+
+def test_iter_medias_exact_pages(gateway):
+    gateway.add_medias(200)
+    with MediaAsset(gateway.config()) as media_asset:
+        assert len(list(media_asset.iter_medias(filter_all(), page_size=100))) == 200
+    # TotalCount 正好是整页时不再请求空页
+    assert gateway.call_count("DescribeMedias") == 2
+
+
+def test_iter_medias_empty(gateway):
+    with MediaAsset(gateway.config()) as media_asset:
+        assert list(media_asset.iter_medias(filter_all())) == []
+    assert gateway.call_count("DescribeMedias") == 1
+
+
+def test_iter_medias_failed_page(gateway, monkeypatch):
+    gateway.add_medias(250)
+    describe_medias = gateway.action_DescribeMedias
+
+    def fail_second_page(req):
+        if req["PageNumber"] == 2:
+            return {"Error": {"Code": "InternalError", "Message": "page failed"}}
+        return describe_medias(req)
+
+    monkeypatch.setattr(gateway, "action_DescribeMedias", fail_second_page)
+    with MediaAsset(gateway.config()) as media_asset:
+        results = list(media_asset.iter_medias(filter_all(), page_size=100))
+    # 第一页正常产出，失败的页产出 (None, err) 后结束
+    assert len(results) == 101
+    assert all(err.code == "ok" for media_info, err in results[:100])
+    assert results[-1][0] is None
+    assert results[-1][1].code == "InternalError"
+
+
+def test_iter_medias_early_exit(gateway):
+    gateway.add_medias(250)
+    with MediaAsset(gateway.config()) as media_asset:
+        medias = media_asset.iter_medias(filter_all(), page_size=100)
+        first, err = next(medias)
+        medias.close()
+    assert err.code == "ok"
+    assert first.media_id == 1
+
+
+def batch_config(gateway):
+    return gateway.config(media_id_batch_size=10, api_concurrency=3)
+
+
+def slow_first_batch(gateway, monkeypatch):
+    # 第一批最后返回，结果仍按输入顺序合并
+    describe = gateway.action_DescribeMediaDetails
+
+    def slow(req):
+        if req["MediaIDSet"][0] == 1:
+            time.sleep(0.2)
+        return describe(req)
+
+    monkeypatch.setattr(gateway, "action_DescribeMediaDetails", slow)
+
+
+def fail_batch(gateway, monkeypatch, action, media_id):
+    # 包含 media_id 的批次返回错误
+    handle = getattr(gateway, "action_" + action)
+
+    def failed(req):
+        if media_id in req["MediaIDSet"]:
+            return {"Error": {"Code": "InternalError", "Message": "batch failed"}}
+        return handle(req)
+
+    monkeypatch.setattr(gateway, "action_" + action, failed)
+
+
+def test_describe_media_details_batches(gateway, monkeypatch):
+    media_ids = gateway.add_medias(25)
+    slow_first_batch(gateway, monkeypatch)
+    with MediaAsset(batch_config(gateway)) as media_asset:
+        media_infos, err = media_asset.describe_media_details(media_ids)
+    assert err.code == "ok", err.message
+    assert [media_info.media_id for media_info in media_infos] == media_ids
+    assert gateway.call_count("DescribeMediaDetails") == 3
+
+
+def test_describe_media_details_single_batch(gateway):
+    media_ids = gateway.add_medias(10)
+    with MediaAsset(batch_config(gateway)) as media_asset:
+        media_infos, err = media_asset.describe_media_details(media_ids)
+    assert err.code == "ok", err.message
+    assert len(media_infos) == 10
+    assert gateway.call_count("DescribeMediaDetails") == 1
+
+
+def test_describe_media_details_batch_failed(gateway, monkeypatch):
+    media_ids = gateway.add_medias(25)
+    fail_batch(gateway, monkeypatch, "DescribeMediaDetails", 15)
+    with MediaAsset(batch_config(gateway)) as media_asset:
+        media_infos, err = media_asset.describe_media_details(media_ids)
+    assert media_infos is None
+    assert err.code == "InternalError"
+
+
+def test_remove_medias_batch_failed(gateway, monkeypatch):
+    media_ids = gateway.add_medias(25)
+    fail_batch(gateway, monkeypatch, "RemoveMedias", 15)
+    with MediaAsset(batch_config(gateway)) as media_asset:
+        failed_media, err = media_asset.remove_medias(media_ids + [100])
+    # 成功批次的结果保留，失败批次的每个媒体ID记为删除失败
+    assert err.code == "ok", err.message
+    assert [(info.type, info.failed_reason) for info in failed_media] == \
+        [(i, "batch failed") for i in range(11, 21)] + [(100, "media not found")]
+    assert [gateway.medias[i]["Status"] for i in media_ids].count("素材已删除") == 15
+
+
+def test_remove_medias_all_batches_failed(gateway, monkeypatch):
+    media_ids = gateway.add_medias(25)
+    monkeypatch.setattr(gateway, "action_RemoveMedias",
+                        lambda req: {"Error": {"Code": "InternalError", "Message": "batch failed"}})
+    with MediaAsset(batch_config(gateway)) as media_asset:
+        failed_media, err = media_asset.remove_medias(media_ids)
+    assert failed_media is None
+    assert err.code == "InternalError"
+
+
+def test_async_batches(gateway, monkeypatch):
+    media_ids = gateway.add_medias(25)
+    slow_first_batch(gateway, monkeypatch)
+    fail_batch(gateway, monkeypatch, "RemoveMedias", 15)
+
+    async def run():
+        async with AsyncMediaAsset(batch_config(gateway)) as media_asset:
+            media_infos, err = await media_asset.describe_media_details(media_ids)
+            assert err.code == "ok", err.message
+            assert [media_info.media_id for media_info in media_infos] == media_ids
+            return await media_asset.remove_medias(media_ids)
+
+    failed_media, err = asyncio.run(run())
+    assert err.code == "ok", err.message
+    assert [info.type for info in failed_media] == list(range(11, 21))
+    assert gateway.call_count("DescribeMediaDetails") == 3
+    assert gateway.call_count("RemoveMedias") == 3
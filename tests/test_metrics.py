@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import aiohttp
+import pytest
+import requests
+
+from media_asset.media_asset import MediaAsset, post_http
+from media_asset.async_media_asset import async_post_http
+from media_asset.metrics import MemoryMetrics, percentile
+
+MB = 1024 * 1024
+HEADER = {"X-TC-Action": "DescribeCategories"}
+
+
+class FakeResponse(object):
+    status_code = 200
+    status = 200
+    content = b'{"Response": {}}'
+
+    async def read(self):
+        return self.content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FlakySession(object):
+    # FlakySession 前 failures 次请求抛出 error，之后返回成功的响应
+    def __init__(self, failures, error):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return FakeResponse()
+
+
+def test_percentile():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 90) == 90
+    assert percentile(samples, 99) == 99
+    assert percentile(samples, 100) == 100
+    assert percentile([3.0], 50) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_memory_metrics_summary():
+    metrics = MemoryMetrics(max_samples=100)
+    for i in range(1, 201):
+        metrics.timing("request", "UploadPart", i)
+    metrics.count("retries", "UploadPart")
+    metrics.count("bytes_sent", "UploadPart", 10)
+    metrics.count("bytes_sent", "UploadPart", 5)
+
+    summary = metrics.summary()
+    stats = summary["request"]["UploadPart"]
+    # count 和 mean 包含所有样本，分位数只基于最近 max_samples 个样本
+    assert stats["count"] == 200
+    assert stats["mean"] == pytest.approx(100.5)
+    assert (stats["p50"], stats["p90"], stats["p99"], stats["max"]) == (150, 190, 199, 200)
+    assert summary["retries"]["UploadPart"] == 1
+    assert summary["bytes_sent"]["UploadPart"] == 15
+
+    metrics.reset()
+    assert metrics.summary() == {}
+
+
+def test_post_http_retries():
+    metrics = MemoryMetrics()
+    session = FlakySession(1, requests.ConnectionError("reset"))
+    resp, err = post_http(HEADER, "http://127.0.0.1/gateway", {}, session, metrics=metrics)
+    assert err is None
+    assert session.calls == 2
+    summary = metrics.summary()
+    assert summary["errors"]["DescribeCategories"] == 1
+    assert summary["retries"]["DescribeCategories"] == 1
+    assert summary["request"]["DescribeCategories"]["count"] == 1
+
+
+def test_post_http_retries_exhausted():
+    metrics = MemoryMetrics()
+    session = FlakySession(3, requests.ConnectionError("reset"))
+    with pytest.raises(requests.ConnectionError):
+        post_http(HEADER, "http://127.0.0.1/gateway", {}, session, metrics=metrics)
+    # 最后一次失败不再重试
+    summary = metrics.summary()
+    assert summary["errors"]["DescribeCategories"] == 3
+    assert summary["retries"]["DescribeCategories"] == 2
+
+
+def test_async_post_http_retries():
+    metrics = MemoryMetrics()
+    session = FlakySession(1, aiohttp.ClientConnectionError("reset"))
+    resp, err = asyncio.run(async_post_http(session, HEADER, "http://127.0.0.1/gateway", {}, metrics=metrics))
+    assert err is None
+    assert session.calls == 2
+    summary = metrics.summary()
+    assert summary["errors"]["DescribeCategories"] == 1
+    assert summary["retries"]["DescribeCategories"] == 1
+
+
+def test_upload_metrics(gateway, media_meta, make_file, inject_errors, small_parts):
+    path = make_file(3 * MB + 10)
+    injector = inject_errors(lambda index: index == 1)
+    metrics = MemoryMetrics()
+    with MediaAsset(gateway.config(upload_retry_interval=0, metrics=metrics)) as media_asset:
+        media_info, err = media_asset.upload_file(path, "metrics", media_meta)
+    assert err.code == "ok", err.message
+    summary = metrics.summary()
+    assert summary["part"]["UploadPart"]["count"] == 4
+    assert summary["md5"]["UploadPart"]["count"] == 4
+    assert summary["upload"]["UploadFile"]["count"] == 1
+    assert summary["retries"]["UploadPart"] == injector.failures
+    assert summary["bytes_sent"]["UploadPart"] >= 3 * MB + 10
+    assert summary["request"]["ApplyUpload"]["count"] == 1
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from media_asset.media_asset import MediaAsset, PartSizePolicy, FixedPartSizePolicy, BLOCK_SIZE
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+
+def test_fixed_part_size_policy():
+    policy = FixedPartSizePolicy(5 * MB)
+    assert policy.part_size_for(MB, 4, 64 * MB) == 5 * MB
+    assert policy.part_size_for(100 * GB, 4, 64 * MB, throughput=100 * MB) == 5 * MB
+    assert FixedPartSizePolicy().part_size_for(MB, 4, 64 * MB) == BLOCK_SIZE
+
+
+@pytest.mark.parametrize("file_size, concurrency, max_part_size, expected", [
+    # 没有观测值时小于 BLOCK_SIZE 的文件 PutObject 直传
+    (BLOCK_SIZE - 1, 4, 1024 * MB, BLOCK_SIZE),
+    # 分片数不少于并发数
+    (100 * MB, 4, 1024 * MB, 25 * MB),
+    (GB, 4, 1024 * MB, BLOCK_SIZE),
+    # 不超过内存上限允许的分片大小，也不小于 min_part_size
+    (GB, 4, 16 * MB, 16 * MB),
+    (40 * MB, 8, 1024 * MB, 8 * MB),
+    # 按 MB 向上对齐
+    (100 * MB + 1, 4, 1024 * MB, 26 * MB),
+])
+def test_part_size_policy(file_size, concurrency, max_part_size, expected):
+    assert PartSizePolicy().part_size_for(file_size, concurrency, max_part_size) == expected
+
+
+def test_part_size_policy_max_parts():
+    # 分片数不超过 max_parts，即使超过内存上限
+    part_size = PartSizePolicy().part_size_for(1024 * GB, 4, 64 * MB)
+    assert part_size == 105 * MB
+    assert -(-1024 * GB // part_size) <= 10000
+    assert PartSizePolicy(max_parts=10).part_size_for(95 * MB, 4, 8 * MB) == 10 * MB
+
+
+def test_part_size_policy_throughput():
+    policy = PartSizePolicy(target_seconds=4)
+    # 快速连接：分片为 target_seconds 秒能传完的字节数
+    assert policy.part_size_for(10 * GB, 4, 1024 * MB, throughput=50 * MB) == 200 * MB
+    assert policy.part_size_for(10 * GB, 4, 1024 * MB, throughput=500 * MB) == 1024 * MB
+    # PutObject 的上限不超过 BLOCK_SIZE
+    assert policy.part_size_for(BLOCK_SIZE - 1, 4, 1024 * MB, throughput=500 * MB) == BLOCK_SIZE
+    # 达到 BLOCK_SIZE 的文件按并发数分片
+    assert policy.part_size_for(BLOCK_SIZE, 4, 1024 * MB, throughput=500 * MB) == BLOCK_SIZE // 4
+    # 慢速连接：只有 min_part_size 以下的文件直传，分片不小于 min_part_size
+    assert policy.part_size_for(6 * MB, 4, 1024 * MB, throughput=MB) == BLOCK_SIZE
+    assert policy.part_size_for(20 * MB, 4, 1024 * MB, throughput=MB) == 8 * MB
+    assert policy.part_size_for(8 * MB + 10, 4, 1024 * MB, throughput=MB) == 8 * MB
+
+
+def test_observe_throughput(gateway):
+    with MediaAsset(gateway.config()) as media_asset:
+        # 小于 1MB 的 body 不计入
+        media_asset.__observe_throughput__(MB - 1, 0.001)
+        assert media_asset.throughput is None
+        media_asset.__observe_throughput__(10 * MB, 1)
+        assert media_asset.throughput == 10 * MB
+        media_asset.__observe_throughput__(20 * MB, 1)
+        assert media_asset.throughput == pytest.approx(13 * MB)
+
+
+def test_upload_part_size_policy(gateway, media_meta, make_file):
+    path = make_file(5 * MB + 3)
+    config = gateway.config(part_size_policy=FixedPartSizePolicy(2 * MB), max_inflight_bytes=8 * MB)
+    with MediaAsset(config) as media_asset:
+        media_info, err = media_asset.upload_file(path, "policy", media_meta)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("UploadPart") == 3
+    assert gateway.call_count("PutObject") == 0
+
+
+def test_upload_resume_keeps_part_size(gateway, media_meta, make_file, inject_errors, tmp_path):
+    path = make_file(5 * MB + 3)
+    config = gateway.config(part_size_policy=FixedPartSizePolicy(MB), checkpoint_dir=str(tmp_path / "checkpoint"),
+                            upload_concurrency=1, upload_retry_times=1, upload_retry_interval=0)
+    inject_errors(lambda index: index >= 2)
+    media_info, err = MediaAsset(config).upload_file(path, "resume", media_meta)
+    assert err.code == "500"
+
+    # 恢复上传时沿用记录中的 1MB 分片，而不是新的策略
+    inject_errors(lambda index: False)
+    config.part_size_policy = FixedPartSizePolicy(4 * MB)
+    parts = gateway.call_count("UploadPart")
+    media_info, err = MediaAsset(config).upload_file(path, "resume", media_meta)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("UploadPart") - parts == 4
+    assert os.listdir(config.checkpoint_dir) == []
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import types
+import asyncio
+
+import pytest
+
+import media_asset.progress
+from media_asset.media_asset import MediaAsset, FileSlice
+from media_asset.async_media_asset import AsyncMediaAsset
+from media_asset.progress import ProgressTracker
+
+MB = 1024 * 1024
+FILE_SIZE = 3 * MB + 7
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(media_asset.progress, "time", types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+class Recorder(object):
+    # Recorder 记录每次回调时的进度
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, progress):
+        self.calls.append(progress)
+
+    @property
+    def last(self):
+        return self.calls[-1]
+
+
+def test_progress_throttled(clock):
+    recorder = Recorder()
+    tracker = ProgressTracker(recorder, 1000, interval=0.5)
+    tracker.add(100)
+    clock.now += 0.2
+    tracker.add(100)
+    # 距上次回调不到 interval 秒时不回调
+    assert recorder.calls == []
+
+    clock.now += 0.4
+    tracker.add(100)
+    assert len(recorder.calls) == 1
+    progress = recorder.last
+    assert (progress.bytes_done, progress.total, progress.finished) == (300, 1000, False)
+    assert progress.rate == pytest.approx(300 / 0.6)
+    assert progress.eta == pytest.approx(700 / (300 / 0.6))
+
+    clock.now += 0.1
+    tracker.add(100)
+    assert len(recorder.calls) == 1
+    # 结束时不论间隔都回调
+    tracker.finish()
+    assert len(recorder.calls) == 2
+    assert recorder.last.finished
+    assert recorder.last.bytes_done == 400
+    assert recorder.last.avg_rate == pytest.approx(400 / 0.7)
+
+
+def test_progress_begin_resumed(clock):
+    recorder = Recorder()
+    tracker = ProgressTracker(recorder, interval=0)
+    clock.now += 5
+    # 断点续传时已完成的字节不计入速率
+    tracker.begin(1000, 600)
+    clock.now += 2
+    tracker.add(200)
+    progress = recorder.last
+    assert (progress.bytes_done, progress.total) == (800, 1000)
+    assert progress.avg_rate == pytest.approx(100)
+    assert progress.elapsed == pytest.approx(2)
+
+
+def test_file_slice_progress_rollback(tmp_path):
+    path = str(tmp_path / "media.bin")
+    with open(path, "wb") as f:
+        f.write(b"x" * 1000)
+    tracker = ProgressTracker(lambda progress: None, 500, interval=60)
+    part = FileSlice(path, 100, 500, chunk_size=128)
+    try:
+        part.progress = tracker
+        part.read(300)
+        assert tracker.bytes_done == 300
+        # 重试前回到分片开头，已计入的字节被回退
+        part.seek(0)
+        assert tracker.bytes_done == 0
+        part.read()
+        assert tracker.bytes_done == 500
+    finally:
+        part.close()
+
+
+def test_upload_progress(gateway, media_meta, make_file, inject_errors, small_parts):
+    path = make_file(FILE_SIZE)
+    injector = inject_errors(lambda index: index == 1)
+    recorder = Recorder()
+    config = gateway.config(upload_retry_interval=0, progress_interval=0, upload_concurrency=2)
+    with MediaAsset(config) as media_asset:
+        media_info, err = media_asset.upload_file(path, "progress", media_meta, progress=recorder)
+    assert err.code == "ok", err.message
+    assert injector.failures == 1
+    assert all(progress.total == FILE_SIZE for progress in recorder.calls)
+    assert all(0 <= progress.bytes_done <= FILE_SIZE for progress in recorder.calls)
+    assert max(progress.in_flight for progress in recorder.calls) >= 1
+    # 失败分片的字节被回退，结束时正好是文件大小
+    final = recorder.last
+    assert final.finished
+    assert (final.bytes_done, final.in_flight) == (FILE_SIZE, 0)
+
+
+@pytest.mark.parametrize("download_concurrency", [1, 3])
+def test_download_progress(gateway, media_meta, make_file, tmp_path, download_concurrency):
+    path = make_file(FILE_SIZE)
+    with MediaAsset(gateway.config()) as media_asset:
+        media_info, err = media_asset.upload_file(path, "download", media_meta)
+    assert err.code == "ok", err.message
+
+    recorder = Recorder()
+    config = gateway.config(download_concurrency=download_concurrency, download_segment_size=MB,
+                            read_chunk_size=256 * 1024, progress_interval=0)
+    with MediaAsset(config) as media_asset:
+        err = media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin", progress=recorder)
+    assert err.code == "ok", err.message
+    # 顺序下载的总字节数取自 Content-Length，下载期间计为一个正在传输的分段
+    assert all(progress.total == FILE_SIZE for progress in recorder.calls)
+    assert all(progress.in_flight >= 1 for progress in recorder.calls[:-1])
+    final = recorder.last
+    assert final.finished
+    assert (final.bytes_done, final.in_flight) == (FILE_SIZE, 0)
+
+
+def test_async_download_progress(gateway, media_meta, make_file, tmp_path):
+    path = make_file(FILE_SIZE)
+    recorder = Recorder()
+
+    async def upload_and_download():
+        async with AsyncMediaAsset(gateway.config(progress_interval=0)) as media_asset:
+            media_info, err = await media_asset.upload_file(path, "download", media_meta, progress=recorder)
+            assert err.code == "ok", err.message
+            upload_calls = len(recorder.calls)
+            err = await media_asset.download_file(media_info.download_url, str(tmp_path / "out"), "a.bin",
+                                                  progress=recorder)
+            assert err.code == "ok", err.message
+            return upload_calls
+
+    upload_calls = asyncio.run(upload_and_download())
+    assert recorder.calls[upload_calls - 1].bytes_done == FILE_SIZE
+    downloads = recorder.calls[upload_calls:]
+    assert all(progress.total == FILE_SIZE for progress in downloads)
+    assert (downloads[-1].bytes_done, downloads[-1].in_flight, downloads[-1].finished) == (FILE_SIZE, 0, True)
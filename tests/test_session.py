@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from media_asset.media_asset import MediaAsset, MediaConfig
+
+
+def make_config(**kwargs):
+    return MediaConfig("127.0.0.1", 80, "secret-id", "secret-key", 1, 1, "service", "2021-02-26", **kwargs)
+
+
+def test_session_pool():
+    with MediaAsset(make_config(pool_size=3, connect_timeout=2, read_timeout=5)) as media_asset:
+        adapter = media_asset.session.get_adapter("http://127.0.0.1/gateway")
+        assert adapter._pool_maxsize == 3
+        assert media_asset.timeout == (2, 5)
+        assert media_asset.session.headers["Connection"] == "keep-alive"
+
+
+def test_session_without_keep_alive():
+    with MediaAsset(make_config(keep_alive=False)) as media_asset:
+        assert media_asset.session.headers["Connection"] == "close"
+
+
+def test_gateway_requests_share_session(gateway, media_meta, make_file):
+    with MediaAsset(gateway.config(pool_size=2)) as media_asset:
+        for i in range(3):
+            media_info, err = media_asset.upload_file(make_file(1024, "{}.bin".format(i)), "pooled", media_meta)
+            assert err.code == "ok", err.message
+        infos, err = media_asset.describe_media_details([media_info.media_id])
+        assert err.code == "ok", err.message
+        assert infos[0].name == "pooled"
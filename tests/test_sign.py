@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import hmac
+import hashlib
+from datetime import datetime
+
+import pytest
+
+import media_asset.tisign.sign
+from media_asset.tisign.sign import TiSign
+
+SECRET_ID = "AKIDmock"
+SECRET_KEY = "secret"
+
+
+def baseline_authorization(host, action, service, content_type, http_method, timestamp):
+    # 改动前 TiSign.build_header_with_signature 的签名计算，每次从头计算所有步骤
+    def hmac_sha256(key, msg):
+        return hmac.new(key, msg.encode('utf-8'), hashlib.sha256)
+
+    canonical_headers = 'content-type:%s\nhost:%s\n' % (content_type, host)
+    payload_hash = hashlib.sha256(b'').hexdigest()
+    canonical_request = '%s\n%s\n%s\n%s\n%s\n%s' % (http_method, '/', '', canonical_headers, 'content-type;host',
+                                                    payload_hash)
+    date = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d')
+    credential_scope = date + '/' + service + '/tc3_request'
+    string2sign = '%s\n%s\n%s\n%s' % ('TC3-HMAC-SHA256', timestamp, credential_scope,
+                                      hashlib.sha256(canonical_request.encode("utf8")).hexdigest())
+    secret_date = hmac_sha256(('TC3' + SECRET_KEY).encode('utf-8'), date)
+    secret_service = hmac_sha256(secret_date.digest(), service)
+    secret_key = hmac_sha256(secret_service.digest(), 'tc3_request')
+    signature = hmac_sha256(secret_key.digest(), string2sign).hexdigest()
+    return "TC3-HMAC-SHA256 Credential=%s/%s, SignedHeaders=content-type;host, Signature=%s" % (
+        SECRET_ID, credential_scope, signature)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1700000000]
+    monkeypatch.setattr(media_asset.tisign.sign.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize("action, content_type, http_method", [
+    ("DescribeMedias", "application/json", "POST"),
+    ("UploadPart", "application/octet-stream", "PUT"),
+    ("DownloadFile", "application/octet-stream", "GET"),
+])
+def test_signature_matches_baseline(clock, action, content_type, http_method):
+    ts = TiSign("127.0.0.1", action, "2021-01-01", "app-cdn4aowk", content_type, http_method, SECRET_ID, SECRET_KEY)
+    # 同一个 TiSign 多次签名，包括跨越 UTC 日期后重新派生签名密钥
+    for timestamp in (1700000000, 1700000001, 1700000000 + 86400, 1700000000 + 86400 * 2 + 5):
+        clock[0] = timestamp
+        header, authorization = ts.build_header_with_signature()
+        assert authorization == baseline_authorization("127.0.0.1", action, "app-cdn4aowk", content_type,
+                                                       http_method, timestamp)
+        assert header["Authorization"] == authorization
+        assert header["X-TC-Timestamp"] == str(timestamp)
+        assert header["X-TC-Action"] == action
+
+
+def test_signature_returns_new_header(clock):
+    ts = TiSign("127.0.0.1", "DescribeMedias", "2021-01-01", "app-cdn4aowk", "application/json", "POST",
+                SECRET_ID, SECRET_KEY)
+    first, _ = ts.build_header_with_signature()
+    clock[0] += 1
+    second, _ = ts.build_header_with_signature()
+    # 多个线程复用同一个 TiSign 时互不影响已返回的header
+    assert first is not second
+    assert first["X-TC-Timestamp"] != second["X-TC-Timestamp"]
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import asyncio
+import hashlib
+
+import pytest
+
+from media_asset.media_asset import MediaAsset, BytesSlice, iter_stream_parts
+from media_asset.async_media_asset import AsyncMediaAsset
+
+MB = 1024 * 1024
+STREAM_SIZE = 3 * MB + 5
+
+
+class ReadOnlyStream(object):
+    # ReadOnlyStream 只实现 read，每次最多返回 chunk_size 字节，模拟管道
+    def __init__(self, data, chunk_size=100 * 1024):
+        self.stream = io.BytesIO(data)
+        self.chunk_size = chunk_size
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return self.stream.read(min(size, self.chunk_size))
+
+
+class AsyncStream(ReadOnlyStream):
+    # AsyncStream read 为协程的流，如 aiohttp.StreamReader
+    async def read(self, size=-1):
+        return super(AsyncStream, self).read(size)
+
+
+def download(media_asset, media_info):
+    data, err = media_asset.download_t_buf(media_info.download_url)
+    assert err.code == "ok", err.message
+    return data
+
+
+def test_iter_stream_parts():
+    data = os.urandom(2500)
+    parts = list(iter_stream_parts(ReadOnlyStream(data, 300), 1000))
+    assert [len(part) for part in parts] == [1000, 1000, 500]
+    assert b"".join(parts) == data
+    # 正好读完时不产出空分片，空流产出一个空分片
+    assert [len(part) for part in iter_stream_parts(io.BytesIO(data[:2000]), 1000)] == [1000, 1000]
+    assert list(iter_stream_parts(io.BytesIO(b""), 1000)) == [b""]
+    # memoryview 按分片切分，不复制数据
+    view = memoryview(bytearray(data))
+    parts = list(iter_stream_parts(view, 1000))
+    assert [part.obj for part in parts] == [view.obj] * 3
+
+
+def test_bytes_slice():
+    data = bytearray(os.urandom(1000))
+    body = BytesSlice(data, chunk_size=300)
+    assert body.md5() == hashlib.md5(data).hexdigest()
+    assert body.read(600) == bytes(data[:600])
+    body.seek(0)
+    assert body.read() == bytes(data)
+    assert body.read() == b""
+
+
+@pytest.mark.parametrize("make_stream, size", [
+    (lambda data: data, None),
+    (lambda data: memoryview(data), None),
+    (lambda data: io.BytesIO(data), STREAM_SIZE),
+    (lambda data: io.BytesIO(data), None),
+    (lambda data: ReadOnlyStream(data), None),
+])
+def test_upload_stream(gateway, media_meta, small_parts, make_stream, size):
+    data = os.urandom(STREAM_SIZE)
+    file_hash = hashlib.md5()
+    with MediaAsset(gateway.config()) as media_asset:
+        media_info, err = media_asset.upload_stream(make_stream(data), "stream", media_meta, size, file_hash=file_hash)
+        assert err.code == "ok", err.message
+        assert download(media_asset, media_info) == data
+    assert gateway.call_count("UploadPart") == 4
+    assert file_hash.hexdigest() == hashlib.md5(data).hexdigest()
+
+
+@pytest.mark.parametrize("size", [None, 1000])
+def test_upload_stream_put_object(gateway, media_meta, small_parts, size):
+    data = os.urandom(1000)
+    with MediaAsset(gateway.config()) as media_asset:
+        media_info, err = media_asset.upload_stream(ReadOnlyStream(data, 300), "stream", media_meta, size)
+        assert err.code == "ok", err.message
+        assert download(media_asset, media_info) == data
+    # 流在第一个分片内结束时直传
+    assert gateway.call_count("PutObject") == 1
+    assert gateway.call_count("UploadPart") == 0
+
+
+@pytest.mark.parametrize("stream_size, size", [
+    # 流比 size 短
+    (1000, 2000),
+    (STREAM_SIZE, STREAM_SIZE + 1),
+    # 流比 size 长：size 小于分片大小时不能只上传第一个分片
+    (2000, 1000),
+    (STREAM_SIZE, 2 * MB + 1),
+])
+def test_upload_stream_size_mismatch(gateway, media_meta, small_parts, stream_size, size):
+    data = os.urandom(stream_size)
+    with MediaAsset(gateway.config(upload_concurrency=1, max_inflight_bytes=MB)) as media_asset:
+        media_info, err = media_asset.upload_stream(io.BytesIO(data), "stream", media_meta, size)
+    assert media_info is None
+    assert err.code == "size mismatch"
+    assert gateway.call_count("CommitUpload") == 0
+    if stream_size > size:
+        # 读到超过 size 的分片后立即停止，多出的数据不上传
+        assert gateway.call_count("UploadPart") <= size // MB
+
+
+def test_upload_stream_read_failed(gateway, media_meta, small_parts):
+    class BrokenStream(ReadOnlyStream):
+        def read(self, size=-1):
+            if self.reads >= 15:
+                raise OSError("broken pipe")
+            return super(BrokenStream, self).read(size)
+
+    with MediaAsset(gateway.config()) as media_asset:
+        media_info, err = media_asset.upload_stream(BrokenStream(os.urandom(STREAM_SIZE)), "stream", media_meta)
+    assert media_info is None
+    assert (err.code, err.message) == ("read failed", "broken pipe")
+    assert gateway.call_count("CommitUpload") == 0
+
+
+@pytest.mark.parametrize("make_stream", [AsyncStream, io.BytesIO, bytes])
+def test_async_upload_stream(gateway, media_meta, small_parts, make_stream):
+    data = os.urandom(STREAM_SIZE)
+
+    async def upload():
+        async with AsyncMediaAsset(gateway.config()) as media_asset:
+            media_info, err = await media_asset.upload_stream(make_stream(data), "stream", media_meta)
+            assert err.code == "ok", err.message
+            content, err = await media_asset.download_t_buf(media_info.download_url)
+            assert err.code == "ok", err.message
+            return content
+
+    assert asyncio.run(upload()) == data
+    assert gateway.call_count("UploadPart") == 4
+
+
+@pytest.mark.parametrize("stream_size, size", [(2000, 1000), (STREAM_SIZE, 2 * MB + 1)])
+def test_async_upload_stream_size_mismatch(gateway, media_meta, small_parts, stream_size, size):
+    async def upload():
+        async with AsyncMediaAsset(gateway.config(upload_concurrency=1, max_inflight_bytes=MB)) as media_asset:
+            return await media_asset.upload_stream(AsyncStream(os.urandom(stream_size)), "stream", media_meta, size)
+
+    media_info, err = asyncio.run(upload())
+    assert media_info is None
+    assert err.code == "size mismatch"
+    assert gateway.call_count("CommitUpload") == 0
+    assert gateway.call_count("UploadPart") <= size // MB
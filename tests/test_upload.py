@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+from urllib.parse import urlparse, parse_qsl
+
+from media_asset.media_asset import MediaAsset, FileSlice
+
+MB = 1024 * 1024
+FILE_SIZE = 10 * MB + 5
+PARTS = 11
+
+
+def upload_config(gateway, **kwargs):
+    kwargs.setdefault("upload_retry_interval", 0)
+    return gateway.config(max_inflight_bytes=4 * MB, **kwargs)
+
+
+def uploaded_data(gateway, media_info):
+    key = media_info.download_url.rsplit("=", 1)[1]
+    with open(gateway.object_path(key), "rb") as f:
+        return f.read()
+
+
+def write_file(tmp_path, data, name="media.bin"):
+    path = str(tmp_path / name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_file_slice_read(tmp_path):
+    data = os.urandom(10000)
+    part = FileSlice(write_file(tmp_path, data), 1000, 3000, chunk_size=512)
+    try:
+        assert len(part) == 3000
+        assert part.read(100) == data[1000:1100]
+        assert part.tell() == 100
+        assert part.read() == data[1100:4000]
+        assert part.read() == b""
+    finally:
+        part.close()
+
+
+def test_file_slice_iter_and_seek(tmp_path):
+    data = os.urandom(10000)
+    part = FileSlice(write_file(tmp_path, data), 9000, 1000, chunk_size=300)
+    try:
+        chunks = list(part)
+        assert [len(chunk) for chunk in chunks] == [300, 300, 300, 100]
+        assert b"".join(chunks) == data[9000:]
+        assert part.seek(-200, 2) == 800
+        assert part.read() == data[9800:]
+        assert part.seek(5000) == 1000
+        assert part.seek(-100, 1) == 900
+        assert part.read(50) == data[9900:9950]
+    finally:
+        part.close()
+
+
+def test_file_slice_md5(tmp_path):
+    data = os.urandom(10000)
+    part = FileSlice(write_file(tmp_path, data), 2500, 5000, chunk_size=1024)
+    try:
+        part.read(10)
+        assert part.md5() == hashlib.md5(data[2500:7500]).hexdigest()
+        # 计算完成后回到分片开头，可以直接作为 body 发送
+        assert part.tell() == 0
+        assert part.read() == data[2500:7500]
+    finally:
+        part.close()
+
+
+def test_put_object(gateway, media_meta, make_file):
+    path = make_file(100 * 1024)
+    media_info, err = MediaAsset(upload_config(gateway)).upload_file(path, "small", media_meta)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("PutObject") == 1
+    assert gateway.call_count("UploadPart") == 0
+    assert uploaded_data(gateway, media_info) == open(path, "rb").read()
+
+
+def test_upload_parts(gateway, media_meta, make_file, small_parts):
+    path = make_file(FILE_SIZE)
+    media_info, err = MediaAsset(upload_config(gateway)).upload_file(path, "parts", media_meta)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("UploadPart") == PARTS
+    assert media_info.size == FILE_SIZE
+    assert uploaded_data(gateway, media_info) == open(path, "rb").read()
+
+
+def test_upload_parts_exact_multiple(gateway, media_meta, make_file, small_parts):
+    # 文件大小是分片大小的整数倍时没有空的最后一个分片
+    path = make_file(4 * MB)
+    media_info, err = MediaAsset(upload_config(gateway)).upload_file(path, "parts", media_meta)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("UploadPart") == 4
+    assert uploaded_data(gateway, media_info) == open(path, "rb").read()
+
+
+def test_upload_parts_retry(gateway, media_meta, make_file, inject_errors, small_parts):
+    path = make_file(FILE_SIZE)
+    # 失败总数少于 upload_retry_times，同一个分片的重试不会全部失败
+    injector = inject_errors(lambda index: index % 3 == 1 and index < 12)
+    media_info, err = MediaAsset(upload_config(gateway, upload_concurrency=4)).upload_file(path, "retry", media_meta)
+    assert err.code == "ok", err.message
+    assert injector.failures > 0
+    assert gateway.call_count("UploadPart") == PARTS + injector.failures
+    assert uploaded_data(gateway, media_info) == open(path, "rb").read()
+
+
+def test_upload_parts_failed(gateway, media_meta, make_file, inject_errors, small_parts):
+    path = make_file(FILE_SIZE)
+    inject_errors(lambda index: index >= 2)
+    media_info, err = MediaAsset(upload_config(gateway, upload_retry_times=2)).upload_file(path, "failed", media_meta)
+    assert media_info is None
+    assert err.code != "ok"
+    # 出现失败后不再提交新的分片
+    assert gateway.call_count("UploadPart") < PARTS
+    assert gateway.call_count("CommitUpload") == 0
+
+
+def resume_config(gateway, tmp_path):
+    return upload_config(gateway, checkpoint_dir=str(tmp_path / "checkpoint"), upload_concurrency=1,
+                         upload_retry_times=1)
+
+
+def test_upload_resume(gateway, media_meta, make_file, inject_errors, small_parts, tmp_path):
+    path = make_file(FILE_SIZE)
+    config = resume_config(gateway, tmp_path)
+
+    # 前 4 个分片成功，之后的分片都失败，断点记录保留
+    inject_errors(lambda index: index >= 4)
+    media_info, err = MediaAsset(config).upload_file(path, "resume", media_meta)
+    assert err.code == "500"
+    assert len(os.listdir(config.checkpoint_dir)) == 1
+
+    inject_errors(lambda index: False)
+    applies, parts = gateway.call_count("ApplyUpload"), gateway.call_count("UploadPart")
+    media_info, err = MediaAsset(config).upload_file(path, "resume", media_meta)
+    assert err.code == "ok", err.message
+    # 沿用记录中的上传，只上传剩下的分片
+    assert gateway.call_count("ApplyUpload") == applies
+    assert gateway.call_count("UploadPart") - parts == PARTS - 4
+    assert os.listdir(config.checkpoint_dir) == []
+    assert uploaded_data(gateway, media_info) == open(path, "rb").read()
+
+
+def test_upload_resume_rejected(gateway, media_meta, make_file, inject_errors, small_parts, tmp_path):
+    path = make_file(FILE_SIZE)
+    config = resume_config(gateway, tmp_path)
+    inject_errors(lambda index: index >= 4)
+    media_info, err = MediaAsset(config).upload_file(path, "rejected", media_meta)
+    assert err.code == "500"
+
+    # 网关不再认可记录中的上传时删除记录，重新申请上传
+    inject_errors(lambda index: False)
+    gateway.uploads.clear()
+    applies = gateway.call_count("ApplyUpload")
+    media_info, err = MediaAsset(config).upload_file(path, "rejected", media_meta)
+    assert err.code == "ok", err.message
+    assert gateway.call_count("ApplyUpload") - applies == 1
+    assert os.listdir(config.checkpoint_dir) == []
+    assert uploaded_data(gateway, media_info) == open(path, "rb").read()
+
+
+def test_upload_resume_rejected_by_status(gateway, mock_gateway, media_meta, make_file, inject_errors, small_parts,
+                                          tmp_path, monkeypatch):
+    path = make_file(FILE_SIZE)
+    config = resume_config(gateway, tmp_path)
+    inject_errors(lambda index: index >= 4)
+    media_info, err = MediaAsset(config).upload_file(path, "rejected", media_meta)
+    assert err.code == "500"
+
+    # 网关用 http 404 拒绝过期的上传时同样重新申请上传，只有 429 和 5xx 保留断点记录
+    do_put = mock_gateway._Handler.do_PUT
+
+    def reject_unknown(handler):
+        query = dict(parse_qsl(urlparse(handler.path).query))
+        if query.get("uploadId") is not None and query.get("Key") not in gateway.uploads:
+            handler.__read_body__(lambda data: None)
+            return handler.__send__(404, b"upload not found")
+        return do_put(handler)
+
+    monkeypatch.setattr(mock_gateway._Handler, "do_PUT", reject_unknown)
+    inject_errors(lambda index: False)
+    gateway.uploads.clear()
+    media_info, err = MediaAsset(config).upload_file(path, "rejected", media_meta)
+    assert err.code == "ok", err.message
+    assert os.listdir(config.checkpoint_dir) == []
+    assert uploaded_data(gateway, media_info) == open(path, "rb").read()
+
+
+def test_upload_resume_renamed(gateway, media_meta, make_file, inject_errors, small_parts, tmp_path):
+    path = make_file(FILE_SIZE)
+    config = resume_config(gateway, tmp_path)
+    inject_errors(lambda index: index >= 4)
+    media_info, err = MediaAsset(config).upload_file(path, "old", media_meta)
+    assert err.code == "500"
+
+    # 名称与记录不同时视为新的上传
+    inject_errors(lambda index: False)
+    applies, parts = gateway.call_count("ApplyUpload"), gateway.call_count("UploadPart")
+    media_info, err = MediaAsset(config).upload_file(path, "new", media_meta)
+    assert err.code == "ok", err.message
+    assert media_info.name == "new"
+    assert gateway.call_count("ApplyUpload") - applies == 1
+    assert gateway.call_count("UploadPart") - parts == PARTS
+
+
+def test_upload_files(gateway, media_meta, make_file, small_parts):
+    items = [(make_file(size, "media{}.bin".format(i)), "media{}".format(i), media_meta)
+             for i, size in enumerate([100, 3 * MB + 1, 2000, 2 * MB])]
+    with MediaAsset(upload_config(gateway, upload_files_concurrency=2)) as media_asset:
+        results = list(media_asset.upload_files(items))
+    assert sorted(index for index, media_info, err in results) == [0, 1, 2, 3]
+    for index, media_info, err in results:
+        assert err.code == "ok", err.message
+        assert media_info.name == items[index][1]
+        assert uploaded_data(gateway, media_info) == open(items[index][0], "rb").read()
+    assert gateway.call_count("PutObject") == 2
+    assert gateway.call_count("UploadPart") == 4 + 2
+
+
+def test_upload_files_exception(gateway, media_meta, make_file, monkeypatch):
+    items = [(make_file(100, "media{}.bin".format(i)), "media{}".format(i), media_meta) for i in range(3)]
+    upload_file = MediaAsset.upload_file
+
+    def fail_second(self, file_path, media_name, media_meta):
+        if media_name == "media1":
+            raise OSError("network down")
+        return upload_file(self, file_path, media_name, media_meta)
+
+    monkeypatch.setattr(MediaAsset, "upload_file", fail_second)
+    with MediaAsset(upload_config(gateway)) as media_asset:
+        results = {index: (media_info, err) for index, media_info, err in media_asset.upload_files(items)}
+    # 一个文件抛出的异常只作为该文件的错误返回
+    assert results[1][0] is None
+    assert results[1][1].code == "upload failed"
+    assert results[1][1].message == "network down"
+    assert results[0][1].code == "ok" and results[2][1].code == "ok"
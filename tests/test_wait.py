@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from media_asset.media_asset import MediaAsset, MediaState, UploadMedia
+
+
+def create_medias(media_asset, media_meta, count):
+    upload_medias = [UploadMedia("wait-{}".format(i), "", "http://example.com/{}.mp4".format(i), media_meta, "")
+                     for i in range(count)]
+    media_infos, err = media_asset.create_medias(upload_medias)
+    assert err.code == "ok", err.message
+    return [media_info.media_id for media_info in media_infos]
+
+
+def test_wait_for_medias(mock_gateway, media_meta):
+    with mock_gateway.MockGateway(process_time=0.3) as gateway:
+        with MediaAsset(gateway.config(media_id_batch_size=2)) as media_asset:
+            media_ids = create_medias(media_asset, media_meta, 5)
+            futures = media_asset.wait_for_medias(media_ids, timeout=10, interval=0.05)
+            assert sorted(futures) == sorted(media_ids)
+            for media_id, future in futures.items():
+                media_info, err = future.result(timeout=10)
+                assert err.code == "ok", err.message
+                assert media_info.media_id == media_id
+                assert media_info.status == MediaState.COMPLETED.value
+
+
+def test_wait_for_medias_timeout(mock_gateway, media_meta):
+    with mock_gateway.MockGateway(process_time=60) as gateway:
+        with MediaAsset(gateway.config()) as media_asset:
+            media_ids = create_medias(media_asset, media_meta, 2)
+            futures = media_asset.wait_for_medias(media_ids, timeout=0.3, interval=0.05)
+            for future in futures.values():
+                media_info, err = future.result(timeout=10)
+                assert err.code == "timeout"
+                # 超时时返回最后一次查询到的媒体信息
+                assert media_info.status == MediaState.DOWNLOADING.value
+
+
+def test_wait_for_medias_poll_at_deadline(mock_gateway, media_meta):
+    with mock_gateway.MockGateway(process_time=0.3) as gateway:
+        with MediaAsset(gateway.config()) as media_asset:
+            media_ids = create_medias(media_asset, media_meta, 1)
+            # 第一次查询后的等待时间超过截止时间，截止时再查询一次，期间完成的媒体不算超时
+            futures = media_asset.wait_for_medias(media_ids, timeout=0.6, interval=10)
+            media_info, err = futures[media_ids[0]].result(timeout=10)
+            assert err.code == "ok", err.message
+            assert media_info.status == MediaState.COMPLETED.value
+            assert gateway.call_count("DescribeMediaDetails") == 2
+
+
+def test_wait_for_medias_not_found(gateway):
+    media_ids = gateway.add_medias(1)
+    with MediaAsset(gateway.config()) as media_asset:
+        futures = media_asset.wait_for_medias(media_ids + [10000], timeout=10, interval=0.05)
+        media_info, err = futures[media_ids[0]].result(timeout=10)
+        assert err.code == "ok"
+        media_info, err = futures[10000].result(timeout=10)
+        assert media_info is None
+        assert err.code == "not found"
+
+
+def test_wait_for_medias_callback(gateway):
+    media_ids = gateway.add_medias(3)
+    called = []
+    lock = threading.Lock()
+
+    def callback(media_id, media_info, err):
+        with lock:
+            called.append(media_id)
+        raise RuntimeError("callback failed")
+
+    with MediaAsset(gateway.config()) as media_asset:
+        futures = media_asset.wait_for_medias(media_ids, timeout=10, callback=callback, interval=0.05)
+        # 回调抛出异常不影响其他媒体的结果
+        for future in futures.values():
+            media_info, err = future.result(timeout=10)
+            assert err.code == "ok"
+    assert sorted(called) == sorted(media_ids)
+
+
+def test_wait_for_medias_exception(gateway, monkeypatch):
+    media_ids = gateway.add_medias(2)
+
+    def describe(media_ids):
+        raise KeyError("MediaInfoSet")
+
+    with MediaAsset(gateway.config()) as media_asset:
+        monkeypatch.setattr(media_asset, "__describe_media_details__", describe)
+        futures = media_asset.wait_for_medias(media_ids, timeout=10, interval=0.05)
+        for future in futures.values():
+            with pytest.raises(KeyError):
+                future.result(timeout=10)